@@ -1,19 +1,31 @@
-from fastapi import FastAPI, HTTPException, Header, Depends, Query
+from fastapi import FastAPI, HTTPException, Header, Depends, Query, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse, FileResponse
-from gestor_db import GestorConPresupuesto
-from pydantic import BaseModel, Field
+from fastapi.responses import RedirectResponse, FileResponse, StreamingResponse, PlainTextResponse
+from gestor_db import GestorConPresupuesto, normalizar_fecha
+from cache_resultados import CacheResultados, CacheMemoria
+from ejecutores import EjecutorAcotado, IteradorConCupo, iterar_en_ejecutor
+from metricas import RegistroMetricas, MetricasGestor, MiddlewareMetricas
+from perfilador_sql import PerfiladorSQL
+from captura_trafico import CapturaTrafico, MiddlewareCaptura
+from reportes_pdf import GeneradorReportes
+from exportaciones import ColaExportaciones, LimiteExportaciones
+from pydantic import BaseModel, Field, ValidationError
 import logging
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import date, datetime, timedelta
+from typing import Optional, Literal
 from jose import JWTError, jwt
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
 import os
+import io
+import csv
+import json
+import base64
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -22,6 +34,55 @@ SECRET_KEY = os.getenv("SECRET_KEY", "clave_por_defecto_seguridad")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
 
+# Caché de autenticación: cantidad máxima de tokens/PINs recordados y segundos que vale cada uno
+AUTH_CACHE_MAX = int(os.getenv("AUTH_CACHE_MAX", "10000"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+
+# Memoria máxima (MB) de la caché de resultados de lectura; 0 la desactiva
+CACHE_RESULTADOS_MB = float(os.getenv("CACHE_RESULTADOS_MB", "16"))
+
+# Memoria máxima (MB) de los reportes PDF ya generados, por versión de los datos del usuario; 0 la desactiva
+REPORTES_CACHE_MB = float(os.getenv("REPORTES_CACHE_MB", "32"))
+
+# Exportaciones en segundo plano: trabajos simultáneos, memoria máxima (MB) de los archivos
+# terminados, segundos que se guarda cada uno y trabajos pendientes permitidos por usuario.
+# Los trabajos viven en la memoria de un proceso: con varios workers vienen desactivadas
+# (EXPORTACIONES=0) y pedirlas con EXPORTACIONES=1 impide arrancar
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+EXPORTACIONES = os.getenv("EXPORTACIONES", "1" if WORKERS == 1 else "0") == "1"
+EXPORTACIONES_HILOS = int(os.getenv("EXPORTACIONES_HILOS", "2"))
+EXPORTACIONES_MAX_MB = float(os.getenv("EXPORTACIONES_MAX_MB", "256"))
+EXPORTACIONES_TTL = float(os.getenv("EXPORTACIONES_TTL", "3600"))
+EXPORTACIONES_POR_USUARIO = int(os.getenv("EXPORTACIONES_POR_USUARIO", "3"))
+
+# Descargas CSV en streaming simultáneas por proceso: cada una retiene una conexión del pool
+# mientras dura la descarga, así unos pocos clientes lentos no dejan sin conexiones al resto
+DESCARGAS_STREAMING = int(os.getenv("DESCARGAS_STREAMING", str(max(1, int(os.getenv("DB_POOL_MAX", "10")) // 4))))
+
+# Máximo de gastos aceptados en una sola petición a POST /gastos/lote
+LOTE_MAX_GASTOS = int(os.getenv("LOTE_MAX_GASTOS", "1000"))
+
+# Métricas en GET /metrics (METRICAS=0 las desactiva). Para leerlas se envía METRICAS_TOKEN como Bearer;
+# sin token definido GET /metrics no responde, salvo con METRICAS_PUBLICAS=1 (puerto no expuesto a internet)
+METRICAS = os.getenv("METRICAS", "1") != "0"
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN")
+METRICAS_PUBLICAS = os.getenv("METRICAS_PUBLICAS", "0") == "1"
+
+# Perfilado de sentencias SQL (PERFIL_SQL=1 lo activa): las que tardan más de PERFIL_SQL_UMBRAL_MS
+# van a PERFIL_SQL_ARCHIVO (con rotación) y el ranking se consulta en GET /admin/consultas-costosas,
+# solo para los usuarios cuyo email figura en ADMIN_EMAILS (separados por coma), igual que GET /estadisticas
+PERFIL_SQL = os.getenv("PERFIL_SQL", "0") == "1"
+PERFIL_SQL_UMBRAL_MS = float(os.getenv("PERFIL_SQL_UMBRAL_MS", "100"))
+PERFIL_SQL_ARCHIVO = os.getenv("PERFIL_SQL_ARCHIVO", "consultas_lentas.log")
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
+
+# Captura de tráfico (CAPTURA_TRAFICO=1): cada petición, sin datos personales, se agrega a
+# CAPTURA_TRAFICO_ARCHIVO (JSONL) para reproducirla con `python -m bench reproducir`;
+# CAPTURA_TRAFICO_MUESTREO es la fracción de peticiones que se guarda
+CAPTURA_TRAFICO = os.getenv("CAPTURA_TRAFICO", "0") == "1"
+CAPTURA_TRAFICO_ARCHIVO = os.getenv("CAPTURA_TRAFICO_ARCHIVO", "trafico.jsonl")
+CAPTURA_TRAFICO_MUESTREO = float(os.getenv("CAPTURA_TRAFICO_MUESTREO", "1"))
+
 def crear_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Genera un token JWT firmado"""
     to_encode = data.copy()
@@ -34,6 +95,74 @@ def crear_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+class CacheAutenticacion:
+    """
+    LRU acotado de credencial (token JWT o PIN) -> user_id con vencimiento.
+    Una entrada vence a los `ttl` segundos o cuando expira el JWT (su 'exp'), lo que ocurra antes.
+    Solo se guardan credenciales válidas: un PIN o token incorrecto siempre se vuelve a comprobar.
+    """
+    def __init__(self, max_entradas=10000, ttl=300.0):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas = OrderedDict()  # credencial -> (user_id, vence)
+        self._lock = threading.Lock()
+        self._generacion = 0  # aumenta con cada invalidación
+        self._stats = {"aciertos": 0, "fallos": 0, "expirados": 0, "desalojos": 0, "invalidaciones": 0}
+
+    @property
+    def generacion(self):
+        return self._generacion
+
+    def obtener(self, credencial):
+        ahora = time.time()
+        with self._lock:
+            entrada = self._entradas.get(credencial)
+            if entrada is None:
+                self._stats["fallos"] += 1
+                return None
+            user_id, vence = entrada
+            if vence <= ahora:
+                del self._entradas[credencial]
+                self._stats["expirados"] += 1
+                self._stats["fallos"] += 1
+                return None
+            self._entradas.move_to_end(credencial)
+            self._stats["aciertos"] += 1
+            return user_id
+
+    def guardar(self, credencial, user_id, vence=None, generacion=None):
+        """
+        generacion: valor de self.generacion antes de consultar la base; si hubo una invalidación
+        entretanto, el dato leído puede ser viejo y no se guarda.
+        """
+        limite = time.time() + self.ttl
+        vence = min(vence, limite) if vence else limite
+        with self._lock:
+            if generacion is not None and generacion != self._generacion:
+                return
+            self._entradas[credencial] = (user_id, vence)
+            self._entradas.move_to_end(credencial)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+                self._stats["desalojos"] += 1
+
+    def invalidar_usuario(self, user_id):
+        """Olvida todas las credenciales de un usuario (p. ej. al cambiar su PIN)"""
+        with self._lock:
+            claves = [c for c, (uid, _) in self._entradas.items() if uid == user_id]
+            for clave in claves:
+                del self._entradas[clave]
+            self._generacion += 1
+            self._stats["invalidaciones"] += len(claves)
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entradas"] = len(self._entradas)
+        consultas = stats["aciertos"] + stats["fallos"]
+        stats["tasa_aciertos"] = stats["aciertos"] / consultas if consultas else 0.0
+        return stats
+
 # Modelo para CREAR gastos (sin id ni fecha, se generan automáticamente)
 
 class GastoCreate(BaseModel):
@@ -41,14 +170,28 @@ class GastoCreate(BaseModel):
     categoria: str = Field(min_length=1, description="Categoría del gasto")
     descripcion: str = Field(default="Sin descripcion", description="Descripción opcional del gasto")
 
+# Modelo para PEDIR una exportación en segundo plano
+class SolicitudExportacion(BaseModel):
+    tipo: Literal["pdf", "csv", "xlsx"] = Field(description="pdf: reporte ejecutivo, csv: todos los gastos, xlsx: libro de Excel")
+
+# Modelo para CREAR varios gastos de una vez; cada elemento se valida como GastoCreate
+# por separado para poder informar el resultado de cada uno
+class LoteGastos(BaseModel):
+    gastos: list[dict] = Field(min_length=1, max_length=LOTE_MAX_GASTOS, description="Gastos a registrar")
+
 # Modelo para MOSTRAR gastos (con todos los campos)
 class GastoResponse(BaseModel):
     id: int
     monto: float
     categoria: str
-    fecha: str
+    fecha: date
     descripcion: str
 
+# Modelo para una PÁGINA de gastos (paginación por cursor)
+class PaginaGastos(BaseModel):
+    gastos: list[GastoResponse]
+    next_cursor: Optional[str] = None
+
 # Modelo para el RESUMEN de gastos
 class ResumenGastos(BaseModel):
     total_general: float
@@ -59,6 +202,25 @@ class ResumenGastos(BaseModel):
     nivel_alerta: str  # 'seguro', 'advertencia', 'peligro'
     balance_neto: float
 
+# Modelo para la COMPARACIÓN presupuesto vs gasto real por categoría
+class ComparacionPresupuesto(BaseModel):
+    categorias: list[str]
+    gastos_reales: list[float]
+    presupuesto_sugerido: list[float]
+
+# Modelo para los gastos DIARIOS
+class GastosDiarios(BaseModel):
+    fechas: list[str]
+    totales: list[float]
+
+# Modelo para el PANEL completo (una sola petición al cargar la página)
+class Dashboard(BaseModel):
+    gastos: list[GastoResponse]
+    next_cursor: Optional[str] = None
+    resumen: ResumenGastos
+    comparacion: ComparacionPresupuesto
+    diarios: GastosDiarios
+
 # ============ MODELOS DE AUTENTICACIÓN ============
 
 class UsuarioRegistro(BaseModel):
@@ -80,29 +242,140 @@ class PresupuestoUpdate(BaseModel):
     nuevo_limite: float = Field(gt=0, description="Nuevo límite de presupuesto mensual")
 
 
-app = FastAPI(title="FinanzasPro API")
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    if EXPORTACIONES and WORKERS > 1:
+        # Un GET o DELETE de una exportación que llega a otro worker no la encontraría
+        raise RuntimeError("Las exportaciones en segundo plano necesitan un único worker: use EXPORTACIONES=0 "
+                           "o WEB_CONCURRENCY=1")
+    # Cada worker crea su gestor (y aplica migraciones pendientes) al arrancar, no en la primera petición
+    obtener_gestor()
+    yield
+    cola_exportaciones.cerrar()
+    for ejecutor in EJECUTORES.values():
+        ejecutor.cerrar()
+    generador_reportes.cerrar()
+    if _gestor is not None:
+        _gestor.cerrar()
+    if captura_trafico is not None:
+        captura_trafico.cerrar()
+
+app = FastAPI(title="FinanzasPro API", lifespan=ciclo_de_vida)
 security = HTTPBearer()
+registro_metricas = RegistroMetricas()
+if METRICAS:
+    app.add_middleware(MiddlewareMetricas, registro=registro_metricas)
 DATABASE_NAME = os.getenv("DATABASE_URL", "FinanzasPro.db")
-mi_gestor = GestorConPresupuesto(DATABASE_NAME)
+# WORKERS: procesos de uvicorn (--workers); cada uno tiene su propio gestor, pool y cachés
+captura_trafico = None
+if CAPTURA_TRAFICO:
+    # La sal es SECRET_KEY: el mismo usuario cae en la misma cubeta en todos los workers
+    captura_trafico = CapturaTrafico(CAPTURA_TRAFICO_ARCHIVO, muestreo=CAPTURA_TRAFICO_MUESTREO, sal=SECRET_KEY,
+                                     por_proceso=WORKERS > 1)
+    app.add_middleware(MiddlewareCaptura, captura=captura_trafico)
+
+# Los endpoints son async: el trabajo bloqueante va a un pool de hilos según su tipo, cada uno
+# con su propia cola, para que un PDF lento no deje sin hilos a un /auth/me.
+# - bd: tantos hilos como conexiones del pool, así ninguno se queda esperando una conexión
+# - pdf: armado de reportes (CPU, lento)
+# - hash: registro y login, que esperan al pool de procesos de hashing
+ejecutor_bd = EjecutorAcotado("bd", int(os.getenv("DB_HILOS", os.getenv("DB_POOL_MAX", "10"))))
+ejecutor_pdf = EjecutorAcotado("pdf", int(os.getenv("PDF_HILOS", "2")))
+ejecutor_hash = EjecutorAcotado("hash", int(os.getenv("HASH_HILOS", os.getenv("HASH_PROCESOS") or str((os.cpu_count() or 1) // WORKERS))))
+# - exportaciones: trabajos de POST /exportaciones, que pueden tardar segundos cada uno
+ejecutor_exportaciones = EjecutorAcotado("exportaciones", EXPORTACIONES_HILOS)
+cupo_descargas = threading.BoundedSemaphore(DESCARGAS_STREAMING)
+EJECUTORES = {"bd": ejecutor_bd, "pdf": ejecutor_pdf, "hash": ejecutor_hash, "exportaciones": ejecutor_exportaciones}
+# Los hilos del pool pdf solo esperan: el armado corre en procesos aparte, uno por hilo
+generador_reportes = GeneradorReportes(int(os.getenv("PDF_PROCESOS", str(ejecutor_pdf.max_hilos))))
+# Clave (usuario, versión de sus datos, día): cualquier escritura cambia la versión, así que
+# un reporte guardado nunca queda desactualizado, aun con varios workers
+cache_reportes = CacheMemoria(max_bytes=int(REPORTES_CACHE_MB * 1024 * 1024)) if REPORTES_CACHE_MB > 0 else None
+# Los trabajos y sus archivos viven en este proceso (por eso EXPORTACIONES exige un único worker)
+cola_exportaciones = ColaExportaciones(ejecutor_exportaciones, max_bytes=int(EXPORTACIONES_MAX_MB * 1024 * 1024),
+                                       ttl=EXPORTACIONES_TTL, max_por_usuario=EXPORTACIONES_POR_USUARIO)
+
+_gestor = None
+_gestor_pid = None
+_gestor_lock = threading.Lock()
+
+def crear_gestor():
+    """
+    Arma el gestor de un worker. Con varios workers:
+    - la caché de resultados en memoria se desactiva: no se enteraría de lo que escriben
+      los demás procesos (para compartirla hace falta un BackendCache externo);
+    - los núcleos se reparten entre los pools de hashing de todos los workers.
+    """
+    cache = None
+    if CACHE_RESULTADOS_MB > 0 and WORKERS == 1:
+        cache = CacheResultados(CacheMemoria(max_bytes=int(CACHE_RESULTADOS_MB * 1024 * 1024)))
+    procesos_hash = None
+    if "HASH_PROCESOS" not in os.environ:
+        procesos_hash = max(1, (os.cpu_count() or 1) // WORKERS)
+    metricas = MetricasGestor(registro_metricas) if METRICAS else None
+    perfilador = None
+    if PERFIL_SQL:
+        archivo = PERFIL_SQL_ARCHIVO
+        if WORKERS > 1:
+            # Un archivo por worker: la rotación no es segura con varios procesos escribiendo
+            raiz, extension = os.path.splitext(archivo)
+            archivo = f"{raiz}.{os.getpid()}{extension}"
+        perfilador = PerfiladorSQL(umbral=PERFIL_SQL_UMBRAL_MS / 1000, archivo=archivo)
+    return GestorConPresupuesto(DATABASE_NAME, cache=cache, procesos_hash=procesos_hash, metricas=metricas,
+                                perfilador=perfilador)
+
+def obtener_gestor():
+    """
+    Gestor del proceso actual, creado en el primer uso. Así cada worker abre sus propias
+    conexiones después de arrancar, aunque el módulo se haya importado antes de un fork.
+    """
+    global _gestor, _gestor_pid
+    if _gestor is None or _gestor_pid != os.getpid():
+        with _gestor_lock:
+            if _gestor is None or _gestor_pid != os.getpid():
+                _gestor = crear_gestor()
+                _gestor_pid = os.getpid()
+    return _gestor
+cache_auth = CacheAutenticacion(max_entradas=AUTH_CACHE_MAX, ttl=AUTH_CACHE_TTL)
+# Con varios workers no se cachean los PINs: /auth/regenerar-codigo solo invalida la caché del
+# worker que lo atiende y los demás seguirían aceptando el PIN viejo. Los JWT no se revocan,
+# así que cachearlos en cada worker es seguro.
+CACHE_PINES = WORKERS == 1
+
+def _indicador_conexiones():
+    return {(): _gestor.estadisticas_pool()["en_uso"]} if _gestor is not None else {}
+
+def _indicador_ejecutores():
+    valores = {}
+    for nombre, ejecutor in EJECUTORES.items():
+        stats = ejecutor.estadisticas()
+        valores[(nombre, "en_cola")] = stats["en_cola"]
+        valores[(nombre, "en_curso")] = stats["en_curso"]
+    return valores
+
+registro_metricas.indicador("finanzas_bd_conexiones_en_uso", "Conexiones del pool prestadas ahora", (), _indicador_conexiones)
+registro_metricas.indicador("finanzas_ejecutor_tareas", "Tareas esperando hilo o corriendo en cada pool",
+                            ("pool", "estado"), _indicador_ejecutores)
 
 @app.get("/")
-def inicio():
+async def inicio():
     """Redirige a la interfaz web"""
     return RedirectResponse(url="/static/login.html")
 
 @app.get("/api-docs-pretty")
-def docs_pretty():
+async def docs_pretty():
     """Ruta alternativa para servir el HTML de documentación"""
     return FileResponse('static/api_docs.html')
 
 # ============ ENDPOINTS DE AUTENTICACIÓN ============
 
 @app.post("/auth/registro", status_code=201)
-def registrar_usuario(datos: UsuarioRegistro):
+async def registrar_usuario(datos: UsuarioRegistro):
     """
     Registra un nuevo usuario y devuelve un token JWT.
     """
-    exito, resultado = mi_gestor.registrar_usuario(
+    exito, resultado = await ejecutor_hash.ejecutar(
+        obtener_gestor().registrar_usuario,
         nombre=datos.nombre,
         email=datos.email,
         password=datos.password
@@ -116,7 +389,7 @@ def registrar_usuario(datos: UsuarioRegistro):
             expires_delta=access_token_expires
         )
         
-        usuario = mi_gestor.obtener_usuario_por_id(resultado)
+        usuario = await ejecutor_bd.ejecutar(obtener_gestor().obtener_usuario_por_id, resultado)
         
         return {
             "mensaje": "Usuario registrado exitosamente",
@@ -128,11 +401,12 @@ def registrar_usuario(datos: UsuarioRegistro):
         raise HTTPException(status_code=400, detail=resultado)
 
 @app.post("/auth/login")
-def login_usuario(datos: UsuarioLogin):
+async def login_usuario(datos: UsuarioLogin):
     """
     Inicia sesión y devuelve un token JWT.
     """
-    exito, resultado = mi_gestor.verificar_login(
+    exito, resultado = await ejecutor_hash.ejecutar(
+        obtener_gestor().verificar_login,
         email=datos.email,
         password=datos.password
     )
@@ -156,17 +430,25 @@ def login_usuario(datos: UsuarioLogin):
 
 # ============ SEGURIDAD Y JWT ============
 
-def obtener_usuario_actual(credentials: HTTPAuthorizationCredentials = Depends(security)) -> int:
+async def obtener_usuario_actual(credentials: HTTPAuthorizationCredentials = Depends(security)) -> int:
     """
     Dependencia para validar la identidad. 
     Soporta tanto Token JWT largo como Código Numérico Corto (6 dígitos).
     """
     token = credentials.credentials
+
+    # 0. Credencial ya validada hace poco: basta con buscarla en la caché
+    user_id = cache_auth.obtener(token)
+    if user_id is not None:
+        return user_id
     
     # 1. Intentar como Código Numérico Corto (6 dígitos)
     if token.isdigit() and len(token) == 6:
-        user_id = mi_gestor.obtener_usuario_por_codigo(token)
+        generacion = cache_auth.generacion
+        user_id = await ejecutor_bd.ejecutar(obtener_gestor().obtener_usuario_por_codigo, token)
         if user_id:
+            if CACHE_PINES:
+                cache_auth.guardar(token, user_id, generacion=generacion)
             return user_id
         raise HTTPException(status_code=401, detail="Código de acceso incorrecto o expirado")
 
@@ -176,24 +458,39 @@ def obtener_usuario_actual(credentials: HTTPAuthorizationCredentials = Depends(s
         user_id_str: str = payload.get("sub")
         if user_id_str is None:
             raise HTTPException(status_code=401, detail="Token inválido: falta ID de usuario")
-        return int(user_id_str)
+        user_id = int(user_id_str)
+        # La entrada vence junto con el token
+        cache_auth.guardar(token, user_id, vence=payload.get("exp"))
+        return user_id
     except JWTError:
         raise HTTPException(status_code=401, detail="Token inválido, expirado o formato incorrecto")
     except ValueError:
         raise HTTPException(status_code=401, detail="ID de usuario corrupto")
 
 @app.get("/auth/me")
-def obtener_perfil(user_id: int = Depends(obtener_usuario_actual)):
+async def obtener_perfil(user_id: int = Depends(obtener_usuario_actual)):
     """
     Obtiene el perfil del usuario autenticado.
     """
-    usuario = mi_gestor.obtener_usuario_por_id(user_id)
+    usuario = await ejecutor_bd.ejecutar(obtener_gestor().obtener_usuario_por_id, user_id)
     if not usuario:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     return usuario
 
+@app.post("/auth/regenerar-codigo")
+async def regenerar_codigo(user_id: int = Depends(obtener_usuario_actual)):
+    """
+    Genera un nuevo código de acceso (PIN) para el usuario. El anterior deja de funcionar.
+    """
+    codigo = await ejecutor_bd.ejecutar(obtener_gestor().regenerar_codigo_acceso, user_id)
+    if not codigo:
+        raise HTTPException(status_code=500, detail="No se pudo generar un nuevo código")
+    # El PIN viejo puede estar en la caché de autenticación
+    cache_auth.invalidar_usuario(user_id)
+    return {"mensaje": "Código de acceso actualizado", "codigo_acceso": codigo}
+
 @app.post("/auth/logout")
-def logout_usuario():
+async def logout_usuario():
     """
     Con JWT el logout se maneja en el cliente (eliminando el token).
     Este endpoint es informativo.
@@ -201,13 +498,73 @@ def logout_usuario():
     return {"mensaje": "Para cerrar sesión, elimine el token del almacenamiento local"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def exponer_metricas(request: Request):
+    """Métricas de este proceso en el formato de texto de Prometheus"""
+    if not METRICAS or not (METRICAS_TOKEN or METRICAS_PUBLICAS):
+        raise HTTPException(status_code=404, detail="Métricas desactivadas")
+    if METRICAS_TOKEN and not secrets.compare_digest(request.headers.get("authorization", "").encode(),
+                                                      f"Bearer {METRICAS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Token de métricas inválido")
+    return PlainTextResponse(registro_metricas.exponer(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+async def verificar_admin(user_id: int = Depends(obtener_usuario_actual)) -> int:
+    """Dependencia para endpoints de administración: el email del usuario debe estar en ADMIN_EMAILS"""
+    usuario = await ejecutor_bd.ejecutar(obtener_gestor().obtener_usuario_por_id, user_id)
+    if not usuario or usuario["email"].lower() not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Solo para administradores")
+    return user_id
+
+@app.get("/estadisticas")
+async def obtener_estadisticas(user_id: int = Depends(verificar_admin)):
+    """
+    Contadores internos del servidor: pool de conexiones, control de concurrencia,
+    caché de autenticación, caché de resultados, caché de reportes, exportaciones y colas de los pools de hilos.
+    Solo para administradores (ADMIN_EMAILS).
+    """
+    return {
+        "pool": obtener_gestor().estadisticas_pool(),
+        "concurrencia": obtener_gestor().estadisticas_concurrencia(),
+        "cache_autenticacion": cache_auth.estadisticas(),
+        "cache_resultados": obtener_gestor().estadisticas_cache(),
+        "cache_reportes": cache_reportes.estadisticas() if cache_reportes else None,
+        "exportaciones": cola_exportaciones.estadisticas(),
+        "ejecutores": {nombre: ejecutor.estadisticas() for nombre, ejecutor in EJECUTORES.items()}
+    }
+
+@app.get("/admin/consultas-costosas")
+async def consultas_costosas(
+    orden: str = Query("tiempo_total", description="tiempo_total, tiempo_max, tiempo_promedio, ejecuciones o filas"),
+    limit: int = Query(20, ge=1, le=500, description="Cantidad de sentencias"),
+    user_id: int = Depends(verificar_admin)
+):
+    """
+    Sentencias SQL que más cuestan desde que arrancó este proceso (o desde el último reinicio
+    del ranking), agrupadas por método del gestor y plantilla SQL. Requiere PERFIL_SQL=1.
+    """
+    perfilador = obtener_gestor().perfilador
+    if perfilador is None:
+        raise HTTPException(status_code=404, detail="El perfilado SQL está desactivado (PERFIL_SQL=1)")
+    if orden not in perfilador.ORDENES:
+        raise HTTPException(status_code=400, detail=f"Orden inválido, opciones: {', '.join(perfilador.ORDENES)}")
+    return {**perfilador.estadisticas(), "sentencias": perfilador.top(limit, orden)}
+
+@app.delete("/admin/consultas-costosas")
+async def reiniciar_consultas_costosas(user_id: int = Depends(verificar_admin)):
+    """Vacía el ranking de sentencias (el archivo de consultas lentas no se toca)"""
+    perfilador = obtener_gestor().perfilador
+    if perfilador is None:
+        raise HTTPException(status_code=404, detail="El perfilado SQL está desactivado (PERFIL_SQL=1)")
+    perfilador.reiniciar()
+    return {"mensaje": "Ranking de consultas reiniciado"}
+
 @app.put("/usuario/presupuesto", status_code=200)
-def actualizar_presupuesto(datos: PresupuestoUpdate, user_id: int = Depends(obtener_usuario_actual)):
+async def actualizar_presupuesto(datos: PresupuestoUpdate, user_id: int = Depends(obtener_usuario_actual)):
     """
     Actualiza el presupuesto mensual del usuario autenticado.
     """
     try:
-        exito = mi_gestor.actualizar_presupuesto_usuario(user_id, datos.nuevo_limite)
+        exito = await ejecutor_bd.ejecutar(obtener_gestor().actualizar_presupuesto_usuario, user_id, datos.nuevo_limite)
         if exito:
             return {"mensaje": "Presupuesto actualizado correctamente", "nuevo_limite": datos.nuevo_limite}
         else:
@@ -219,7 +576,7 @@ def actualizar_presupuesto(datos: PresupuestoUpdate, user_id: int = Depends(obte
 # ============ ENDPOINTS DE GASTOS ============
 
 @app.post("/gastos", status_code=201)
-def crear_gasto(gasto: GastoCreate, user_id: int = Depends(obtener_usuario_actual)):
+async def crear_gasto(gasto: GastoCreate, user_id: int = Depends(obtener_usuario_actual)):
     """
     Crea un nuevo gasto en la base de datos.
     
@@ -229,7 +586,8 @@ def crear_gasto(gasto: GastoCreate, user_id: int = Depends(obtener_usuario_actua
     """
     try:
         # Llamar al método con el ORDEN CORRECTO de parámetros
-        exito = mi_gestor.agregar_gasto(
+        exito = await ejecutor_bd.ejecutar(
+            obtener_gestor().agregar_gasto,
             monto=gasto.monto,
             categoria=gasto.categoria,
             descripcion=gasto.descripcion,
@@ -262,13 +620,55 @@ def crear_gasto(gasto: GastoCreate, user_id: int = Depends(obtener_usuario_actua
         )
 
 
+@app.post("/gastos/lote", status_code=201)
+async def crear_gastos_lote(lote: LoteGastos, user_id: int = Depends(obtener_usuario_actual)):
+    """
+    Registra varios gastos en una sola petición y una sola transacción.
+    
+    Cada elemento se valida igual que en POST /gastos. Los válidos se guardan juntos y
+    los inválidos se informan en **resultados** (con su índice) sin frenar al resto.
+    """
+    resultados = []
+    validos = []
+    for indice, item in enumerate(lote.gastos):
+        try:
+            gasto = GastoCreate.model_validate(item)
+        except ValidationError as e:
+            errores = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            resultados.append({"indice": indice, "ok": False, "error": errores})
+            continue
+        validos.append(gasto)
+        resultados.append({"indice": indice, "ok": True})
+
+    if not validos:
+        raise HTTPException(
+            status_code=422,
+            detail={"mensaje": "Ningún gasto del lote es válido", "resultados": resultados}
+        )
+
+    insertados = await ejecutor_bd.ejecutar(
+        obtener_gestor().agregar_gastos_lote,
+        [(g.monto, g.categoria, g.descripcion) for g in validos],
+        usuario_id=user_id
+    )
+    if insertados == 0:
+        raise HTTPException(status_code=500, detail="Error interno al agregar el lote de gastos")
+
+    return {
+        "mensaje": f"{insertados} gastos agregados correctamente",
+        "insertados": insertados,
+        "rechazados": len(resultados) - insertados,
+        "resultados": resultados
+    }
+
+
 @app.delete("/gastos/{gasto_id}", status_code=200)
-def eliminar_gasto(gasto_id: int, user_id: int = Depends(obtener_usuario_actual)):
+async def eliminar_gasto(gasto_id: int, user_id: int = Depends(obtener_usuario_actual)):
     """
     Elimina un gasto específico por su ID.
     """
     try:
-        exito = mi_gestor.eliminar_gasto(gasto_id, usuario_id=user_id)
+        exito = await ejecutor_bd.ejecutar(obtener_gestor().eliminar_gasto, gasto_id, usuario_id=user_id)
         
         if exito:
             logging.info(f"API: Gasto {gasto_id} eliminado exitosamente por usuario {user_id}")
@@ -291,14 +691,14 @@ def eliminar_gasto(gasto_id: int, user_id: int = Depends(obtener_usuario_actual)
         )
 
 @app.put("/gastos/{gasto_id}", status_code=200)
-def actualizar_gasto(gasto_id: int, gasto_actualizado: GastoCreate, user_id: int = Depends(obtener_usuario_actual)):
+async def actualizar_gasto(gasto_id: int, gasto_actualizado: GastoCreate, user_id: int = Depends(obtener_usuario_actual)):
     """
     Actualiza un gasto existente.
     """
     try:
         # Primero obtener el gasto actual para mostrar qué cambió
         # NOTA: obtener_todos_los_gastos ahora filtra por usuario, así que esto también valida propiedad
-        gastos_actuales = mi_gestor.obtener_todos_los_gastos(user_id)
+        gastos_actuales = await ejecutor_bd.ejecutar(obtener_gestor().obtener_todos_los_gastos, user_id)
         gasto_anterior = next((g for g in gastos_actuales if g['id'] == gasto_id), None)
         
         if not gasto_anterior:
@@ -310,7 +710,8 @@ def actualizar_gasto(gasto_id: int, gasto_actualizado: GastoCreate, user_id: int
         # Actualizar el gasto con fecha actual
         fecha_actual = datetime.now().strftime("%Y-%m-%d")
         
-        exito = mi_gestor.actualizar_gasto(
+        exito = await ejecutor_bd.ejecutar(
+            obtener_gestor().actualizar_gasto,
             id_gasto=gasto_id,
             nuevo_monto=gasto_actualizado.monto,
             categoria=gasto_actualizado.categoria,
@@ -351,51 +752,147 @@ def actualizar_gasto(gasto_id: int, gasto_actualizado: GastoCreate, user_id: int
             detail="Error interno al actualizar el gasto"
         ) 
 
-@app.get("/gastos", response_model=list[GastoResponse])
-def listar_gastos(categorias: list[str] = Query(None, description="Categoría para filtrar los gastos"), user_id: int = Depends(obtener_usuario_actual)):
+def etag_datos(user_id: int, version) -> str:
+    # Débil: identifica el estado de los datos, no los bytes exactos de la respuesta
+    return f'W/"{user_id}-{version}"'
+
+async def respuesta_no_modificada(request: Request, response: Response, user_id: int) -> Optional[Response]:
     """
-    Obtiene los gastos de la base de datos del usuario autenticado.
+    Pone en la respuesta el ETag de la versión actual de los datos del usuario.
+    Si el cliente envía ese mismo ETag en If-None-Match devuelve un 304 listo para responder,
+    sin haber leído ningún gasto; si no, devuelve None y el endpoint sigue normalmente.
     """
+    version = await ejecutor_bd.ejecutar(obtener_gestor().obtener_version_datos, user_id)
+    if version is None:
+        return None
+    etag = etag_datos(user_id, version)
+    # no-cache: el navegador guarda la respuesta pero la revalida siempre con el ETag
+    cabeceras = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    enviados = [e.strip().removeprefix("W/") for e in request.headers.get("if-none-match", "").split(",")]
+    if etag.removeprefix("W/") in enviados or "*" in enviados:
+        return Response(status_code=304, headers=cabeceras)
+    response.headers.update(cabeceras)
+    return None
+
+def codificar_cursor(clave) -> str:
+    """Convierte la clave (fecha, id) del último gasto de una página en un cursor opaco"""
+    fecha, id_gasto = clave
+    return base64.urlsafe_b64encode(json.dumps([str(fecha), id_gasto]).encode()).decode()
+
+def decodificar_cursor(cursor: str):
+    """Clave (fecha, id) de un cursor; 400 si no es uno de los que genera codificar_cursor"""
     try:
-        # 1. Obtener solo los gastos del usuario autenticado
-        todos_los_gastos = mi_gestor.obtener_todos_los_gastos(user_id)
-        
-        # 2. Si hay filtro, aplicarlo en memoria
-        if categorias:
-            # Filtramos la lista ignorando mayúsculas/minúsculas
-            cats_mn = [c.lower() for c in categorias]
-            gastos_filtrados = [
-                gasto for gasto in todos_los_gastos if gasto['categoria'].lower() in cats_mn
-            ]
-            return gastos_filtrados
+        fecha, id_gasto = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        # Lo que llegue va tal cual al WHERE (fecha, id) < (...): en PostgreSQL una fecha
+        # inválida sería un error de la base (500) y no un cursor rechazado
+        if not isinstance(fecha, str) or not isinstance(id_gasto, int) or isinstance(id_gasto, bool):
+            raise ValueError("Tipos inválidos")
+        return (normalizar_fecha(fecha), id_gasto)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+
+def rango_fechas(desde: Optional[date], hasta: Optional[date]):
+    """Valida el rango de fechas de la consulta y lo devuelve como texto 'AAAA-MM-DD' (o None)"""
+    if desde and hasta and desde > hasta:
+        raise HTTPException(status_code=400, detail="La fecha 'desde' no puede ser posterior a 'hasta'")
+    return (desde.isoformat() if desde else None), (hasta.isoformat() if hasta else None)
+
+@app.get("/gastos", response_model=PaginaGastos)
+async def listar_gastos(
+    request: Request,
+    response: Response,
+    categorias: list[str] = Query(None, description="Categoría para filtrar los gastos"),
+    limit: int = Query(50, ge=1, le=500, description="Cantidad máxima de gastos por página"),
+    cursor: Optional[str] = Query(None, description="Valor de next_cursor de la página anterior"),
+    desde: Optional[date] = Query(None, description="Solo gastos desde esta fecha (AAAA-MM-DD, incluida)"),
+    hasta: Optional[date] = Query(None, description="Solo gastos hasta esta fecha (AAAA-MM-DD, incluida)"),
+    user_id: int = Depends(obtener_usuario_actual)
+):
+    """
+    Obtiene los gastos del usuario autenticado, del más reciente al más antiguo, página a página.
+    Para pedir la siguiente página se envía el `next_cursor` recibido (es null en la última)
+    junto con los mismos filtros.
+    Responde 304 si el ETag enviado en If-None-Match sigue vigente.
+    """
+    despues_de = decodificar_cursor(cursor) if cursor else None
+    desde, hasta = rango_fechas(desde, hasta)
+    no_modificada = await respuesta_no_modificada(request, response, user_id)
+    if no_modificada:
+        return no_modificada
+    try:
+        # Una página de los gastos del usuario; el filtro de categorías (sin distinguir
+        # mayúsculas) se resuelve en la base de datos con el índice de categoria_clave
+        gastos, siguiente = await ejecutor_bd.ejecutar(
+            obtener_gestor().obtener_gastos_paginados, user_id, limite=limit, despues_de=despues_de, categorias=categorias,
+            desde=desde, hasta=hasta
+        )
         
-        # 3. Si no hay filtro, devolver todo
-        return todos_los_gastos
+        return {
+            "gastos": gastos,
+            "next_cursor": codificar_cursor(siguiente) if siguiente else None
+        }
 
     except Exception as e:
         logging.error(f"Error al listar gastos: {e}")
         raise HTTPException(status_code=500, detail="Error al obtener los gastos")
 
-@app.get("/gastos/exportar/csv")
-def exportar_gastos_csv(user_id: int = Depends(obtener_usuario_actual)):
+def decodificar_cursor_busqueda(cursor: str) -> int:
+    try:
+        desplazamiento = int(json.loads(base64.urlsafe_b64decode(cursor.encode())))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+    if desplazamiento < 0:
+        raise HTTPException(status_code=400, detail="Cursor de paginación inválido")
+    return desplazamiento
+
+@app.get("/gastos/buscar", response_model=PaginaGastos)
+async def buscar_gastos(
+    request: Request,
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200, description="Palabras a buscar en la descripción y la categoría"),
+    limit: int = Query(50, ge=1, le=500, description="Cantidad máxima de gastos por página"),
+    cursor: Optional[str] = Query(None, description="Valor de next_cursor de la página anterior"),
+    user_id: int = Depends(obtener_usuario_actual)
+):
     """
-    Exporta los gastos del usuario en formato CSV
+    Busca gastos del usuario cuya descripción o categoría contenga todas las palabras de `q`,
+    también como comienzo de palabra y sin distinguir acentos ni mayúsculas.
+    Los resultados vienen ordenados por relevancia y paginados igual que GET /gastos.
     """
-    from fastapi.responses import StreamingResponse
-    import io
-    import csv
-    
-    # Obtener gastos del usuario
-    gastos = mi_gestor.obtener_todos_los_gastos(user_id)
-    
-    # Crear archivo CSV en memoria
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Escribir encabezados
+    desplazamiento = decodificar_cursor_busqueda(cursor) if cursor else 0
+    no_modificada = await respuesta_no_modificada(request, response, user_id)
+    if no_modificada:
+        return no_modificada
+    try:
+        gastos, siguiente = await ejecutor_bd.ejecutar(
+            obtener_gestor().buscar_gastos_paginados, q, user_id, limite=limit, desplazamiento=desplazamiento
+        )
+    except Exception as e:
+        logging.error(f"Error al buscar gastos: {e}")
+        raise HTTPException(status_code=500, detail="Error al buscar gastos")
+    return {
+        "gastos": gastos,
+        "next_cursor": base64.urlsafe_b64encode(json.dumps(siguiente).encode()).decode() if siguiente else None
+    }
+
+def generar_csv_gastos(gastos, filas_por_bloque=500):
+    """
+    Convierte un iterable de gastos en bloques de texto CSV a medida que llegan.
+    El encabezado sale de inmediato y luego se envía un bloque cada filas_por_bloque filas.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def vaciar():
+        bloque = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+        return bloque
+
     writer.writerow(['ID', 'Fecha', 'Descripción', 'Categoría', 'Monto'])
-    
-    # Escribir datos
+    yield vaciar()
+
+    pendientes = 0
     for gasto in gastos:
         writer.writerow([
             gasto['id'],
@@ -404,133 +901,337 @@ def exportar_gastos_csv(user_id: int = Depends(obtener_usuario_actual)):
             gasto['categoria'],
             f"${gasto['monto']:.2f}"
         ])
-    
-    # Preparar respuesta
-    output.seek(0)
+        pendientes += 1
+        if pendientes == filas_por_bloque:
+            yield vaciar()
+            pendientes = 0
+    if pendientes:
+        yield vaciar()
+
+@app.get("/gastos/exportar/csv")
+async def exportar_gastos_csv(user_id: int = Depends(obtener_usuario_actual)):
+    """
+    Exporta los gastos del usuario en formato CSV.
+    El archivo se genera mientras se envía: la memoria usada no depende de la cantidad de gastos.
+    Responde 503 si ya hay DESCARGAS_STREAMING descargas en curso en este proceso.
+    """
+    if not cupo_descargas.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="Demasiadas descargas en curso, reintente en unos segundos",
+                            headers={"Retry-After": "5"})
+    # Cada bloque se lee y se arma en un hilo del pool de base de datos; el lugar se libera
+    # cuando termina o se corta la descarga
+    recorrido = IteradorConCupo(generar_csv_gastos(obtener_gestor().iterar_gastos(user_id)), cupo_descargas)
     return StreamingResponse(
-        iter([output.getvalue()]),
+        iterar_en_ejecutor(ejecutor_bd, recorrido),
         media_type="text/csv",
         headers={
             "Content-Disposition": f"attachment; filename=gastos_{datetime.now().strftime('%Y%m%d')}.csv"
         }
     )
 
+# Un libro de hasta este tamaño se arma en memoria; uno más grande pasa a un archivo temporal
+XLSX_EN_MEMORIA = 8 * 1024 * 1024
+XLSX_TIPO = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+def armar_libro_excel(user_id: int):
+    """Arma el libro de Excel del usuario; devuelve el archivo listo para leer, o None si falló"""
+    archivo = tempfile.SpooledTemporaryFile(max_size=XLSX_EN_MEMORIA)
+    if not obtener_gestor().exportar_a_excel_completo(archivo, user_id):
+        archivo.close()
+        return None
+    archivo.seek(0)
+    return archivo
+
+def leer_en_bloques(archivo, tamano=64 * 1024):
+    try:
+        while True:
+            bloque = archivo.read(tamano)
+            if not bloque:
+                break
+            yield bloque
+    finally:
+        archivo.close()
+
+@app.get("/gastos/exportar/xlsx")
+async def exportar_gastos_xlsx(user_id: int = Depends(obtener_usuario_actual)):
+    """
+    Exporta un libro de Excel con dos hojas: los gastos del mes actual y el historial de
+    cierres mensuales. Se escribe fila a fila (modo write-only), sin cargar todos los gastos.
+    """
+    # Un libro grande tarda: se arma en el pool de exportaciones y no ocupa los hilos de la base
+    archivo = await ejecutor_exportaciones.ejecutar(armar_libro_excel, user_id)
+    if archivo is None:
+        raise HTTPException(status_code=500, detail="Error al generar el libro de Excel")
+    return StreamingResponse(
+        leer_en_bloques(archivo),
+        media_type=XLSX_TIPO,
+        headers={
+            "Content-Disposition": f"attachment; filename=gastos_{datetime.now().strftime('%Y%m%d')}.xlsx"
+        }
+    )
+
 @app.get("/gastos/resumen", response_model=ResumenGastos)
-def obtener_resumen(user_id: int = Depends(obtener_usuario_actual)):
+async def obtener_resumen(
+    request: Request,
+    response: Response,
+    desde: Optional[date] = Query(None, description="Solo gastos desde esta fecha (AAAA-MM-DD, incluida)"),
+    hasta: Optional[date] = Query(None, description="Solo gastos hasta esta fecha (AAAA-MM-DD, incluida)"),
+    user_id: int = Depends(obtener_usuario_actual)
+):
     """
-    Obtiene un resumen financiero completo del usuario autenticado.
+    Obtiene un resumen financiero completo del usuario autenticado, opcionalmente
+    solo de los gastos entre `desde` y `hasta`.
     """
+    desde, hasta = rango_fechas(desde, hasta)
+    no_modificada = await respuesta_no_modificada(request, response, user_id)
+    if no_modificada:
+        return no_modificada
     try: 
-        return mi_gestor.obtener_resumen(user_id)
+        return await ejecutor_bd.ejecutar(obtener_gestor().obtener_resumen, user_id, desde, hasta)
     except Exception as e:
         logging.error(f"Error al obtener resumen: {e}")
         raise HTTPException(status_code=500, detail="Error al generar el resumen")
 
-@app.get("/gastos/comparacion-presupuesto")
-def obtener_comparacion(user_id: int = Depends(obtener_usuario_actual)):
+def armar_comparacion(gastos_por_cat: dict, presupuesto_total: float) -> dict:
+    """Reparte el presupuesto entre las categorías en proporción a lo gastado en cada una"""
+    total_gastado = sum(gastos_por_cat.values())
+    
+    presupuesto_por_categoria = {}
+    if total_gastado > 0:
+        for cat, gasto in gastos_por_cat.items():
+            proporcion = gasto / total_gastado
+            presupuesto_por_categoria[cat] = presupuesto_total * proporcion
+    
+    return {
+        "categorias": list(gastos_por_cat.keys()),
+        "gastos_reales": list(gastos_por_cat.values()),
+        "presupuesto_sugerido": list(presupuesto_por_categoria.values())
+    }
+
+def armar_diarios(gastos_diarios: dict) -> dict:
+    return {
+        "fechas": [str(fecha) for fecha in gastos_diarios.keys()],
+        "totales": list(gastos_diarios.values())
+    }
+
+@app.get("/gastos/comparacion-presupuesto", response_model=ComparacionPresupuesto)
+async def obtener_comparacion(request: Request, response: Response, user_id: int = Depends(obtener_usuario_actual)):
     """
     Obtiene comparación entre presupuesto y gastos por categoría
     """
+    no_modificada = await respuesta_no_modificada(request, response, user_id)
+    if no_modificada:
+        return no_modificada
     try:
-        # Obtener gastos por categoría del usuario
-        gastos_por_cat = mi_gestor.obtener_gastos_por_categoria(user_id)
-        
-        # Obtener presupuesto total del usuario
-        presupuesto_total = mi_gestor.obtener_presupuesto_usuario(user_id)
-        
-        # Calcular presupuesto sugerido por categoría (distribución proporcional)
-        total_gastado = sum(gastos_por_cat.values())
-        
-        presupuesto_por_categoria = {}
-        if total_gastado > 0:
-            for cat, gasto in gastos_por_cat.items():
-                proporcion = gasto / total_gastado
-                presupuesto_por_categoria[cat] = presupuesto_total * proporcion
-        
-        return {
-            "categorias": list(gastos_por_cat.keys()),
-            "gastos_reales": list(gastos_por_cat.values()),
-            "presupuesto_sugerido": list(presupuesto_por_categoria.values())
-        }
+        # Gastos por categoría y presupuesto total del usuario
+        resumen = await ejecutor_bd.ejecutar(obtener_gestor().obtener_resumen, user_id)
+        return armar_comparacion(resumen["por_categoria"], resumen["presupuesto_limite"])
     except Exception as e:
         logging.error(f"Error en comparación de presupuesto: {e}")
         raise HTTPException(status_code=500, detail="Error al obtener comparación")
 
-@app.get("/gastos/diarios")
-def obtener_gastos_diarios(user_id: int = Depends(obtener_usuario_actual)):
+@app.get("/gastos/diarios", response_model=GastosDiarios)
+async def obtener_gastos_diarios(
+    request: Request,
+    response: Response,
+    desde: Optional[date] = Query(None, description="Solo días desde esta fecha (AAAA-MM-DD, incluida)"),
+    hasta: Optional[date] = Query(None, description="Solo días hasta esta fecha (AAAA-MM-DD, incluida)"),
+    user_id: int = Depends(obtener_usuario_actual)
+):
     """
-    Obtiene el total de gastos agrupados por día
+    Obtiene el total de gastos agrupados por día, opcionalmente entre `desde` y `hasta`
     """
+    desde, hasta = rango_fechas(desde, hasta)
+    no_modificada = await respuesta_no_modificada(request, response, user_id)
+    if no_modificada:
+        return no_modificada
     try:
-        gastos_diarios = mi_gestor.obtener_gastos_por_dia(user_id)
-        return {
-            "fechas": list(gastos_diarios.keys()),
-            "totales": list(gastos_diarios.values())
-        }
+        return armar_diarios(await ejecutor_bd.ejecutar(obtener_gestor().obtener_gastos_por_dia, user_id, desde, hasta))
     except Exception as e:
         logging.error(f"Error al obtener gastos diarios: {e}")
         raise HTTPException(status_code=500, detail="Error al obtener gastos diarios")
+
+@app.get("/dashboard", response_model=Dashboard)
+async def obtener_dashboard(
+    request: Request,
+    response: Response,
+    categorias: list[str] = Query(None, description="Categoría para filtrar la tabla de gastos"),
+    limit: int = Query(50, ge=1, le=500, description="Cantidad máxima de gastos en la primera página"),
+    user_id: int = Depends(obtener_usuario_actual)
+):
+    """
+    Todo lo que necesita el panel en una sola petición: la primera página de gastos (igual que
+    `GET /gastos`), el resumen, la comparación con el presupuesto y la serie diaria.
+    Los datos salen de una misma lectura consistente de la base de datos.
+    Responde 304 si el ETag enviado en If-None-Match sigue vigente.
+    """
+    no_modificada = await respuesta_no_modificada(request, response, user_id)
+    if no_modificada:
+        return no_modificada
+    try:
+        panel = await ejecutor_bd.ejecutar(obtener_gestor().obtener_dashboard, user_id, limite=limit, categorias=categorias)
+        resumen = panel["resumen"]
+        return {
+            "gastos": panel["gastos"],
+            "next_cursor": codificar_cursor(panel["siguiente"]) if panel["siguiente"] else None,
+            "resumen": resumen,
+            "comparacion": armar_comparacion(resumen["por_categoria"], resumen["presupuesto_limite"]),
+            "diarios": armar_diarios(panel["por_dia"])
+        }
+    except Exception as e:
+        logging.error(f"Error al obtener el panel: {e}")
+        raise HTTPException(status_code=500, detail="Error al obtener el panel")
         
+def leer_datos_reporte(user_id: int):
+    """Resumen y usuario del encabezado del reporte PDF (los gastos los lee quien lo arma)"""
+    gestor = obtener_gestor()
+    return gestor.obtener_resumen(user_id), gestor.obtener_usuario_por_id(user_id)
+
+def clave_reporte(user_id: int, version) -> str:
+    return f"reporte:{user_id}:{version}:{datetime.now().strftime('%Y-%m-%d')}"
+
+def preparar_cache_reporte(user_id: int):
+    """Antes de armar un reporte: olvida los de versiones anteriores y devuelve la generación para guardarlo"""
+    if cache_reportes is None:
+        return None
+    cache_reportes.invalidar_usuario(user_id)
+    return cache_reportes.generacion(user_id)
+
+def guardar_reporte(clave: str, pdf: bytes, user_id: int, generacion):
+    if cache_reportes is not None:
+        cache_reportes.guardar(clave, pdf, user_id, generacion)
+
 @app.get("/gastos/reporte/pdf")
-def generar_reporte_pdf(user_id: int = Depends(obtener_usuario_actual)):
-    """Genera un reporte ejecutivo en PDF para el usuario"""
-    filename = f"reporte_ejecutivo_{user_id}.pdf"
-    
-    # 1. Obtener datos
-    gastos = mi_gestor.obtener_todos_los_gastos(user_id)
-    resumen = mi_gestor.obtener_resumen(user_id) 
-    usuario = mi_gestor.obtener_usuario_por_id(user_id)
-    
-    if not usuario:
+async def generar_reporte_pdf(user_id: int = Depends(obtener_usuario_actual)):
+    """
+    Genera el reporte ejecutivo en PDF con todos los gastos del usuario, paginado.
+    Se arma en memoria y, mientras los datos no cambien, se sirve desde la caché.
+    """
+    version = await ejecutor_bd.ejecutar(obtener_gestor().obtener_version_datos, user_id)
+    if version is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
+    clave = clave_reporte(user_id, version)
+    pdf = cache_reportes.obtener(clave) if cache_reportes else None
 
-    # 2. Configurar el documento
-    doc = SimpleDocTemplate(filename, pagesize=letter)
-    story = [] 
-    styles = getSampleStyleSheet()
-    
-    # Título
-    story.append(Paragraph(f"Reporte Ejecutivo de Gastos - FinanzasPro", styles['Title']))
-    story.append(Paragraph(f"Usuario: {usuario['nombre']} | Fecha: {datetime.now().strftime('%d/%m/%Y')}", styles['Normal']))
-    story.append(Spacer(1, 20))
-    
-    # Tabla de Resumen
-    data_resumen = [
-        ["Concepto", "Valor"],
-        ["Total Gastado", f"${resumen['total_general']:,.2f}"],
-        ["Presupuesto Mensual", f"${resumen['presupuesto_limite']:,.2f}"],
-        ["Saldo Disponible", f"${resumen['saldo_disponible']:,.2f}"],
-        ["Nivel de Alerta", resumen['nivel_alerta'].upper()]
-    ]
-    t_resumen = Table(data_resumen, colWidths=[200, 100])
-    t_resumen.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.purple),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    story.append(Paragraph("Resumen Financiero", styles['Heading2']))
-    story.append(t_resumen)
-    story.append(Spacer(1, 20))
-    
-    # Tabla de Gastos Detallada
-    story.append(Paragraph("Desglose de Gastos", styles['Heading2']))
-    data_gastos = [["Fecha", "Categoría", "Descripción", "Monto"]]
-    for g in gastos[:20]: 
-        data_gastos.append([g['fecha'], g['categoria'], g['descripcion'], f"${g['monto']:.2f}"])
-    
-    t_gastos = Table(data_gastos, colWidths=[80, 100, 200, 80])
-    t_gastos.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('FONTSIZE', (0, 0), (-1, -1), 9)
-    ]))
-    story.append(t_gastos)
-    
-    # 3. Construir PDF
-    doc.build(story)
-    
-    return FileResponse(filename, filename=filename, media_type='application/pdf')
+    if pdf is None:
+        resumen, usuario = await ejecutor_bd.ejecutar(leer_datos_reporte, user_id)
+        if not usuario:
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        generacion = preparar_cache_reporte(user_id)
+        # El armado va a su propio pool: varios reportes a la vez no ocupan los hilos de la base
+        pdf = await ejecutor_pdf.ejecutar(generador_reportes.generar, DATABASE_NAME, user_id, usuario, resumen)
+        guardar_reporte(clave, pdf, user_id, generacion)
+
+    filename = f"reporte_ejecutivo_{user_id}.pdf"
+    return Response(content=pdf, media_type="application/pdf",
+                    headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# ============ EXPORTACIONES EN SEGUNDO PLANO ============
+
+def exportar_pdf(trabajo):
+    """Reporte PDF para un trabajo de exportación (usa la misma caché que el endpoint)"""
+    user_id = trabajo.usuario_id
+    version = obtener_gestor().obtener_version_datos(user_id)
+    clave = clave_reporte(user_id, version)
+    pdf = cache_reportes.obtener(clave) if cache_reportes else None
+    if pdf is None:
+        resumen, usuario = leer_datos_reporte(user_id)
+        if not trabajo.avanzar(0, obtener_gestor().contar_gastos(user_id)):
+            return None
+        generacion = preparar_cache_reporte(user_id)
+        pdf = generador_reportes.generar(DATABASE_NAME, user_id, usuario, resumen)
+        guardar_reporte(clave, pdf, user_id, generacion)
+    return pdf, f"reporte_ejecutivo_{user_id}.pdf", "application/pdf"
+
+def exportar_csv(trabajo, filas_por_bloque=1000):
+    """Todos los gastos del usuario en CSV, con el mismo formato que GET /gastos/exportar/csv"""
+    gestor = obtener_gestor()
+    total = gestor.contar_gastos(trabajo.usuario_id)
+    trabajo.avanzar(0, total)
+    buffer = io.BytesIO()
+    gastos = gestor.iterar_gastos(trabajo.usuario_id)
+    try:
+        for numero, bloque in enumerate(generar_csv_gastos(gastos, filas_por_bloque)):
+            buffer.write(bloque.encode("utf-8"))
+            if not trabajo.avanzar(min(numero * filas_por_bloque, total)):
+                return None
+    finally:
+        gastos.close()
+    trabajo.avanzar(total)
+    return buffer.getvalue(), f"gastos_{datetime.now().strftime('%Y%m%d')}.csv", "text/csv"
+
+def exportar_xlsx(trabajo):
+    """Libro de Excel del usuario, el mismo que GET /gastos/exportar/xlsx"""
+    buffer = io.BytesIO()
+    if not obtener_gestor().exportar_a_excel_completo(buffer, trabajo.usuario_id, progreso=trabajo.avanzar):
+        if trabajo.cancelada:
+            return None
+        raise RuntimeError("No se pudo generar el libro de Excel")
+    return buffer.getvalue(), f"gastos_{datetime.now().strftime('%Y%m%d')}.xlsx", XLSX_TIPO
+
+EXPORTADORES = {"pdf": exportar_pdf, "csv": exportar_csv, "xlsx": exportar_xlsx}
+
+def verificar_exportaciones():
+    if not EXPORTACIONES:
+        raise HTTPException(status_code=404, detail="Exportaciones en segundo plano desactivadas")
+
+def estado_exportacion(trabajo) -> dict:
+    estado = trabajo.como_dict()
+    estado["descarga"] = f"/exportaciones/{trabajo.id}/descarga" if trabajo.estado == "terminado" else None
+    return estado
+
+@app.post("/exportaciones", status_code=202)
+async def crear_exportacion(solicitud: SolicitudExportacion, user_id: int = Depends(obtener_usuario_actual)):
+    """
+    Encola una exportación (pdf, csv o xlsx) y responde enseguida con su id.
+    El avance se consulta en GET /exportaciones/{id} y el archivo se baja de
+    GET /exportaciones/{id}/descarga cuando el estado es "terminado".
+    """
+    verificar_exportaciones()
+    try:
+        trabajo = cola_exportaciones.enviar(user_id, solicitud.tipo, EXPORTADORES[solicitud.tipo])
+    except LimiteExportaciones as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return estado_exportacion(trabajo)
+
+@app.get("/exportaciones")
+async def listar_exportaciones(user_id: int = Depends(obtener_usuario_actual)):
+    """Exportaciones del usuario que el servidor todavía recuerda, de la más vieja a la más nueva"""
+    verificar_exportaciones()
+    return [estado_exportacion(t) for t in cola_exportaciones.listar(user_id)]
+
+@app.get("/exportaciones/{exportacion_id}")
+async def obtener_exportacion(exportacion_id: str, user_id: int = Depends(obtener_usuario_actual)):
+    """Estado (en_cola, en_curso, terminado, error, cancelado, vencido, eliminado) y avance de una exportación"""
+    verificar_exportaciones()
+    trabajo = cola_exportaciones.obtener(exportacion_id, user_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Exportación no encontrada")
+    return estado_exportacion(trabajo)
+
+@app.get("/exportaciones/{exportacion_id}/descarga")
+async def descargar_exportacion(exportacion_id: str, user_id: int = Depends(obtener_usuario_actual)):
+    """Archivo de una exportación terminada"""
+    verificar_exportaciones()
+    trabajo = cola_exportaciones.obtener(exportacion_id, user_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Exportación no encontrada")
+    datos = trabajo.datos
+    if trabajo.estado in ("en_cola", "en_curso"):
+        raise HTTPException(status_code=409, detail="La exportación todavía no terminó")
+    if datos is None:
+        raise HTTPException(status_code=410, detail=f"La exportación no tiene archivo disponible ({trabajo.estado})")
+    return Response(content=datos, media_type=trabajo.tipo_contenido,
+                    headers={"Content-Disposition": f'attachment; filename="{trabajo.nombre_archivo}"'})
+
+@app.delete("/exportaciones/{exportacion_id}")
+async def cancelar_exportacion(exportacion_id: str, user_id: int = Depends(obtener_usuario_actual)):
+    """Cancela una exportación en cola o en curso; si ya terminó, descarta su archivo"""
+    verificar_exportaciones()
+    trabajo = cola_exportaciones.cancelar(exportacion_id, user_id)
+    if trabajo is None:
+        raise HTTPException(status_code=404, detail="Exportación no encontrada")
+    return estado_exportacion(trabajo)
 
 # Montamos la carpeta static al final para evitar conflictos con las rutas de la API
 app.mount("/static", StaticFiles(directory="static", html=True), name="static")
@@ -0,0 +1,12 @@
+"""
+Benchmarks de FinanzasPro.
+
+    python -m bench micro    # cada método de GestorGastos (SQLite y, si se indica, PostgreSQL)
+    python -m bench http     # carga HTTP en proceso sobre los endpoints de api_corregido
+    python -m bench todo     # ambos
+    python -m bench reproducir trafico.jsonl --velocidad 10   # tráfico capturado con CAPTURA_TRAFICO=1
+    python -m bench comparar base.json nuevo.json
+
+Los datos salen de bench.generador con una semilla fija, así dos corridas sobre commits
+distintos miden lo mismo. Los resultados se guardan en JSON (--salida).
+"""
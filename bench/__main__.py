@@ -0,0 +1,156 @@
+"""
+Uso:
+    python -m bench micro [--usuarios 100] [--gastos 100000] [--repeticiones 200] [--pg URL]
+    python -m bench http [--segundos 10] [--concurrencia 16]
+    python -m bench todo [...]                      # micro + http
+    python -m bench reproducir trafico.jsonl [--url http://127.0.0.1:8000] [--velocidad 10] [--concurrencia 32]
+    python -m bench comparar base.json nuevo.json [--tolerancia 0.10]
+    python -m bench.login [logins] [hilos]         # logins según el tamaño del pool de hashing
+    python -m bench.workers [segundos] [conexiones] [fracción de escrituras]   # servidor.py con 1, 2, 4... workers
+
+Opciones comunes: --semilla 42, --salida bench_resultados.json. PostgreSQL se mide solo si
+se pasa --pg o la variable BENCH_PG_URL (se usa un esquema propio, bench_finanzas).
+Para millones de gastos: --gastos 2000000.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime
+
+import psycopg2
+
+
+def _commit():
+    try:
+        salida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        sucio = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True)
+        return salida.stdout.strip() + ("-sucio" if sucio.stdout.strip() else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _metadatos(args):
+    return {
+        "commit": _commit(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "nucleos": os.cpu_count(),
+        "parametros": {k: v for k, v in vars(args).items() if k not in ("comando", "pg")},
+    }
+
+
+def _correr(args):
+    from bench import carga_http, micro
+
+    resultado = {"meta": _metadatos(args)}
+    if args.comando in ("micro", "todo"):
+        resultado["micro"] = {"sqlite": micro.ejecutar(None, args.usuarios, args.gastos, args.semilla, args.repeticiones)}
+        if args.pg:
+            try:
+                resultado["micro"]["postgresql"] = micro.ejecutar(args.pg, args.usuarios, args.gastos, args.semilla,
+                                                                  args.repeticiones)
+            except psycopg2.OperationalError as e:
+                print(f"[AVISO] PostgreSQL no disponible, se omite: {e}")
+                resultado["micro"]["postgresql"] = {"error": str(e)}
+    if args.comando in ("http", "todo"):
+        resultado["http"] = carga_http.ejecutar(args.usuarios, args.gastos, args.semilla, args.segundos,
+                                                args.concurrencia)
+
+    _guardar(resultado, args.salida)
+
+
+def _reproducir(args):
+    from bench import reproducir
+
+    # Se guarda bajo "http" para poder usar comparar entre dos reproducciones
+    resultado = {"meta": _metadatos(args)}
+    resultado["http"] = reproducir.ejecutar(args.archivos, args.url, args.velocidad, args.concurrencia,
+                                            args.gastos_por_usuario, args.semilla)
+    _guardar(resultado, args.salida)
+
+
+def _guardar(resultado, salida):
+    with open(salida, "w", encoding="utf-8") as archivo:
+        json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+    print(f"[OK] Resultados guardados en {salida}")
+
+
+def _metricas_planas(resultado):
+    """{(sección, nombre, métrica): valor} con las métricas comparables de un resultado"""
+    planas = {}
+    for motor, datos in resultado.get("micro", {}).items():
+        for metodo, r in datos.get("metodos", {}).items():
+            for clave in ("ops_por_segundo", "p50_ms", "p95_ms"):
+                planas[(f"micro/{motor}", metodo, clave)] = r[clave]
+    if "http" in resultado:
+        for nombre, r in {**resultado["http"]["endpoints"], "TOTAL": resultado["http"]["total"]}.items():
+            for clave in ("peticiones_por_segundo", "p50_ms", "p95_ms", "p99_ms"):
+                planas[("http", nombre, clave)] = r[clave]
+    return planas
+
+
+def _comparar(args):
+    """Muestra las diferencias y termina con código 1 si alguna métrica empeoró más que la tolerancia"""
+    with open(args.base, encoding="utf-8") as archivo:
+        base = json.load(archivo)
+    with open(args.nuevo, encoding="utf-8") as archivo:
+        nuevo = json.load(archivo)
+    antes, despues = _metricas_planas(base), _metricas_planas(nuevo)
+    print(f"base {base['meta'].get('commit')}  ->  nuevo {nuevo['meta'].get('commit')}")
+
+    regresiones = 0
+    for clave in sorted(antes.keys() & despues.keys()):
+        a, d = antes[clave], despues[clave]
+        if not a:
+            continue
+        cambio = (d - a) / a
+        # En latencias subir es peor; en throughput, bajar
+        peor = cambio > args.tolerancia if clave[2].endswith("_ms") else cambio < -args.tolerancia
+        regresiones += peor
+        marca = "  << REGRESIÓN" if peor else ""
+        print(f"{clave[0]:<18} {clave[1]:<40} {clave[2]:<22} {a:>10.2f} -> {d:>10.2f} ({cambio:+.1%}){marca}")
+    print(f"{regresiones} regresiones (tolerancia {args.tolerancia:.0%})")
+    sys.exit(1 if regresiones else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmarks de FinanzasPro")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    for nombre in ("micro", "http", "todo"):
+        p = sub.add_parser(nombre)
+        p.add_argument("--usuarios", type=int, default=100)
+        p.add_argument("--gastos", type=int, default=100_000)
+        p.add_argument("--semilla", type=int, default=42)
+        p.add_argument("--repeticiones", type=int, default=200, help="llamadas por método (micro)")
+        p.add_argument("--segundos", type=float, default=10.0, help="duración de la carga (http)")
+        p.add_argument("--concurrencia", type=int, default=16, help="clientes simultáneos (http)")
+        p.add_argument("--pg", default=os.getenv("BENCH_PG_URL"), help="URL de PostgreSQL (micro)")
+        p.add_argument("--salida", default="bench_resultados.json")
+    p = sub.add_parser("reproducir")
+    p.add_argument("archivos", nargs="+", help="capturas JSONL de CAPTURA_TRAFICO=1 (incluidas las rotadas)")
+    p.add_argument("--url", default="http://127.0.0.1:8000", help="instancia local a la que se envían")
+    p.add_argument("--velocidad", type=float, default=1.0, help="1 = tiempos reales, 10 = diez veces más rápido")
+    p.add_argument("--concurrencia", type=int, default=32, help="máximo de peticiones en vuelo")
+    p.add_argument("--gastos-por-usuario", type=int, default=300, help="gastos de cada usuario sintético nuevo")
+    p.add_argument("--semilla", type=int, default=42)
+    p.add_argument("--salida", default="bench_reproduccion.json")
+    p = sub.add_parser("comparar")
+    p.add_argument("base")
+    p.add_argument("nuevo")
+    p.add_argument("--tolerancia", type=float, default=0.10, help="cambio relativo aceptado (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    if args.comando == "comparar":
+        _comparar(args)
+    elif args.comando == "reproducir":
+        _reproducir(args)
+    else:
+        _correr(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Prueba de carga HTTP en proceso sobre api_corregido: clientes asíncronos (httpx con
+ASGITransport, sin red ni servidor aparte) piden durante `segundos` una mezcla de los
+endpoints principales con tokens de los usuarios generados. Informa peticiones por segundo,
+errores y p50/p95/p99 por endpoint y en total.
+
+Cliente y servidor comparten proceso y CPU: las cifras sirven para comparar commits entre sí
+en la misma máquina, no como capacidad absoluta del servidor.
+"""
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import timedelta
+
+import httpx
+
+from bench.generador import poblar
+from bench.micro import percentiles
+
+# (método, ruta, peso): el panel pide /dashboard al cargar; el resto son las vistas sueltas
+ESCENARIO = (
+    ("GET", "/dashboard", 3),
+    ("GET", "/gastos", 2),
+    ("GET", "/gastos/resumen", 2),
+    ("GET", "/auth/me", 2),
+    ("GET", "/gastos/diarios", 1),
+    ("GET", "/gastos/comparacion-presupuesto", 1),
+    ("POST", "/gastos", 1),
+)
+
+
+async def _cliente(http, tokens, rng, hasta, registros):
+    pedidos = [(metodo, ruta) for metodo, ruta, _ in ESCENARIO]
+    pesos = [peso for _, _, peso in ESCENARIO]
+    while time.perf_counter() < hasta:
+        metodo, ruta = rng.choices(pedidos, weights=pesos)[0]
+        cabeceras = {"Authorization": f"Bearer {rng.choice(tokens)}"}
+        cuerpo = {"monto": round(rng.uniform(1, 50), 2), "categoria": "Comida"} if metodo == "POST" else None
+        inicio = time.perf_counter()
+        try:
+            respuesta = await http.request(metodo, ruta, headers=cabeceras, json=cuerpo)
+            ok = respuesta.status_code < 400
+        except Exception:
+            ok = False
+        registros.setdefault(f"{metodo} {ruta}", []).append((time.perf_counter() - inicio, ok))
+
+
+def _resultado(muestras, segundos):
+    latencias = [duracion for duracion, _ in muestras]
+    errores = sum(1 for _, ok in muestras if not ok)
+    return {"peticiones": len(muestras), "errores": errores,
+            "peticiones_por_segundo": (len(muestras) - errores) / segundos, **percentiles(latencias)}
+
+
+def ejecutar(usuarios=100, gastos=100_000, semilla=42, segundos=10.0, concurrencia=16, progreso=print):
+    """
+    Pobla una base SQLite temporal, apunta la API a ella y lanza `concurrencia` clientes.
+    Devuelve {"concurrencia", "segundos", "total": {...}, "endpoints": {...}}.
+    """
+    import api_corregido as api
+
+    # La API lee DATABASE_URL al importarse: se la redirige a la base del benchmark
+    if api._gestor is not None:
+        api._gestor.cerrar()
+        api._gestor = None
+    api.DATABASE_NAME = os.path.join(tempfile.mkdtemp(), "bench_http.db")
+    gestor = api.obtener_gestor()
+    try:
+        ids = poblar(gestor, usuarios=usuarios, gastos=gastos, semilla=semilla)
+        tokens = [api.crear_access_token({"sub": str(uid)}, timedelta(hours=1)) for uid in ids]
+        progreso(f"[http] {gastos} gastos de {usuarios} usuarios cargados; {concurrencia} clientes durante {segundos:.0f}s")
+
+        registros = {}
+
+        async def correr():
+            transporte = httpx.ASGITransport(app=api.app)
+            async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as http:
+                hasta = time.perf_counter() + segundos
+                await asyncio.gather(*(_cliente(http, tokens, random.Random(semilla + i), hasta, registros)
+                                       for i in range(concurrencia)))
+
+        inicio = time.perf_counter()
+        asyncio.run(correr())
+        duracion = time.perf_counter() - inicio
+
+        endpoints = {nombre: _resultado(muestras, duracion) for nombre, muestras in sorted(registros.items())}
+        total = _resultado([m for muestras in registros.values() for m in muestras], duracion)
+        for nombre, r in endpoints.items():
+            progreso(f"[http] {nombre:<38} {r['peticiones_por_segundo']:>8.1f} pet/s  p50 {r['p50_ms']:>7.2f} ms  "
+                     f"p95 {r['p95_ms']:>7.2f} ms  p99 {r['p99_ms']:>7.2f} ms  errores {r['errores']}")
+        progreso(f"[http] {'TOTAL':<38} {total['peticiones_por_segundo']:>8.1f} pet/s  p50 {total['p50_ms']:>7.2f} ms  "
+                 f"p95 {total['p95_ms']:>7.2f} ms  p99 {total['p99_ms']:>7.2f} ms  errores {total['errores']}")
+        return {"concurrencia": concurrencia, "segundos": duracion, "usuarios": usuarios, "gastos": gastos,
+                "total": total, "endpoints": endpoints}
+    finally:
+        for ejecutor in api.EJECUTORES.values():
+            ejecutor.cerrar()
+        api._gestor.cerrar()
+        api._gestor = None
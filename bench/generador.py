@@ -0,0 +1,117 @@
+"""
+Generador de datos sintéticos reproducibles: usuarios y gastos repartidos entre las
+categorías de la app y a lo largo de un año.
+
+- Pocos usuarios concentran muchos gastos (pesos tipo Pareto), como en uso real.
+- Cada categoría tiene su frecuencia y su monto típico (log-normal alrededor de la mediana).
+- Los fines de semana hay más gastos que los días hábiles.
+
+Con la misma semilla se generan exactamente los mismos datos.
+"""
+import random
+from datetime import date, timedelta
+
+from psycopg2.extras import execute_values
+
+from gestor_db import normalizar_categoria
+
+# categoría -> (peso, monto mediano, descripciones)
+CATEGORIAS = {
+    "Comida": (0.34, 12.0, ("Almuerzo", "Supermercado", "Café", "Cena", "Delivery")),
+    "Transporte": (0.20, 8.0, ("Taxi", "Colectivo", "Combustible", "Peaje", "Estacionamiento")),
+    "Hogar": (0.14, 45.0, ("Alquiler", "Luz", "Gas", "Internet", "Limpieza")),
+    "Salud": (0.07, 30.0, ("Farmacia", "Consulta", "Análisis", "Óptica")),
+    "Ocio": (0.15, 20.0, ("Cine", "Streaming", "Bar", "Libro", "Recital")),
+    "Otros": (0.10, 15.0, ("Regalo", "Varios", "Suscripción", "Ferretería")),
+}
+PASSWORD = "bench-secreto"
+INICIO = date(2025, 1, 1)
+
+
+def generar_usuarios(cantidad, semilla=42):
+    """Datos de `cantidad` usuarios: nombre, email, presupuesto y PIN únicos"""
+    rng = random.Random(semilla)
+    codigos = rng.sample(range(1_000_000), cantidad)
+    return [{
+        "nombre": f"Usuario {i}",
+        "email": f"usuario{i:06d}@bench.local",
+        "presupuesto": float(rng.choice((1500, 3000, 5000, 8000, 12000))),
+        "codigo_acceso": f"{codigos[i]:06d}",
+    } for i in range(cantidad)]
+
+
+def generar_gastos(cantidad_usuarios, cantidad, semilla=42, dias=365, inicio=INICIO):
+    """
+    Generador de `cantidad` gastos (monto, categoria, descripcion, indice_usuario, fecha 'YYYY-MM-DD').
+    indice_usuario va de 0 a cantidad_usuarios - 1, en el orden de generar_usuarios.
+    """
+    rng = random.Random(semilla + 1)
+    pesos_usuarios = [rng.paretovariate(1.2) for _ in range(cantidad_usuarios)]
+    usuarios_acum = _acumular(pesos_usuarios)
+    fechas = [(inicio + timedelta(days=d)).isoformat() for d in range(dias)]
+    fechas_acum = _acumular([1.4 if (inicio + timedelta(days=d)).weekday() >= 5 else 1.0 for d in range(dias)])
+    nombres = list(CATEGORIAS)
+    categorias_acum = _acumular([CATEGORIAS[c][0] for c in nombres])
+
+    elegir = rng.choices
+    for _ in range(cantidad):
+        categoria = elegir(nombres, cum_weights=categorias_acum)[0]
+        _, mediana, descripciones = CATEGORIAS[categoria]
+        monto = round(rng.lognormvariate(0, 0.7) * mediana, 2) or 0.01
+        yield (monto, categoria, rng.choice(descripciones),
+               elegir(range(cantidad_usuarios), cum_weights=usuarios_acum)[0],
+               elegir(fechas, cum_weights=fechas_acum)[0])
+
+
+def _acumular(pesos):
+    total, acumulados = 0.0, []
+    for peso in pesos:
+        total += peso
+        acumulados.append(total)
+    return acumulados
+
+
+def poblar(gestor, usuarios=100, gastos=100_000, semilla=42, dias=365, tamano_lote=10_000):
+    """
+    Carga los datos generados directamente en la base del gestor (en lotes, una transacción
+    por lote) y recalcula los totales precalculados. Todos los usuarios tienen PASSWORD.
+    Devuelve los ids de los usuarios en el orden de generar_usuarios.
+    """
+    p = gestor.p
+    password_hash = gestor.hashes.hashear(PASSWORD)
+    datos = generar_usuarios(usuarios, semilla)
+    with gestor._get_cursor(escritura=True) as cur:
+        cur.executemany(
+            f"INSERT INTO usuarios (nombre, email, password_hash, codigo_acceso, presupuesto) VALUES ({p}, {p}, {p}, {p}, {p})",
+            [(u["nombre"], u["email"], password_hash, u["codigo_acceso"], u["presupuesto"]) for u in datos])
+        cur.connection.commit()
+    with gestor._get_cursor() as cur:
+        cur.execute("SELECT id, email FROM usuarios WHERE email LIKE '%@bench.local'")
+        por_email = {fila["email"]: fila["id"] for fila in cur.fetchall()}
+    ids = [por_email[u["email"]] for u in datos]
+
+    lote = []
+    for monto, categoria, descripcion, indice, fecha in generar_gastos(usuarios, gastos, semilla, dias):
+        lote.append((monto, categoria, normalizar_categoria(categoria), descripcion, ids[indice], fecha))
+        if len(lote) == tamano_lote:
+            _insertar_gastos(gestor, lote)
+            lote = []
+    if lote:
+        _insertar_gastos(gestor, lote)
+    gestor.reconstruir_resumenes()
+    return ids
+
+
+def _insertar_gastos(gestor, filas):
+    with gestor._get_cursor(escritura=True) as cur:
+        if gestor.es_postgresql:
+            execute_values(cur, """
+                INSERT INTO gastos (monto, categoria, categoria_clave, descripcion, usuario_id, fecha)
+                VALUES %s
+            """, filas, page_size=1000)
+        else:
+            cur.executemany("""
+                INSERT INTO gastos (monto, categoria, categoria_clave, descripcion, usuario_id, fecha)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, filas)
+        cur.connection.commit()
@@ -0,0 +1,67 @@
+"""
+Benchmark de logins: throughput de verificar_login según el tamaño del pool de hashing,
+y cuánto tarda una lectura común (obtener_resumen) mientras dura la tormenta de logins.
+
+Uso: python -m bench.login [logins] [hilos]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from gestor_db import GestorGastos
+
+
+def medir(procesos_hash, logins, hilos):
+    ruta = os.path.join(tempfile.mkdtemp(), "bench_login.db")
+    gestor = GestorGastos(ruta, procesos_hash=procesos_hash)
+    try:
+        _, uid = gestor.registrar_usuario("Bench", "bench@correo.com", "secreto1")
+        gestor.verificar_login("bench@correo.com", "secreto1")  # arranca los procesos antes de medir
+
+        latencias = []
+        terminado = threading.Event()
+
+        def lector():
+            while not terminado.is_set():
+                inicio = time.perf_counter()
+                gestor.obtener_resumen(uid)
+                latencias.append(time.perf_counter() - inicio)
+                time.sleep(0.005)
+
+        hilo_lector = threading.Thread(target=lector)
+        hilo_lector.start()
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=hilos) as executor:
+            resultados = list(executor.map(lambda _: gestor.verificar_login("bench@correo.com", "secreto1")[0],
+                                           range(logins)))
+        duracion = time.perf_counter() - inicio
+        terminado.set()
+        hilo_lector.join()
+        assert all(resultados)
+
+        latencias.sort()
+        return {
+            "logins_por_segundo": logins / duracion,
+            "lectura_p50_ms": statistics.median(latencias) * 1000,
+            "lectura_p95_ms": latencias[int(len(latencias) * 0.95)] * 1000,
+        }
+    finally:
+        gestor.cerrar()
+
+
+if __name__ == "__main__":
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    hilos = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    nucleos = os.cpu_count() or 1
+    # 0 = hashing en el hilo que atiende la petición (comportamiento anterior)
+    tamanos = [0] + sorted({1, 2, 4, nucleos} & set(range(1, nucleos + 1)))
+
+    print(f"{logins} logins desde {hilos} hilos, {nucleos} núcleos")
+    print(f"{'procesos':>8} {'logins/s':>10} {'lectura p50':>12} {'lectura p95':>12}")
+    for procesos in tamanos:
+        r = medir(procesos, logins, hilos)
+        print(f"{procesos:>8} {r['logins_por_segundo']:>10.1f} {r['lectura_p50_ms']:>10.2f}ms {r['lectura_p95_ms']:>10.2f}ms")
@@ -0,0 +1,152 @@
+"""
+Microbenchmarks de GestorGastos: cada método público se llama `repeticiones` veces sobre una
+base poblada con bench.generador, rotando entre los usuarios generados, y se informa
+ops/s y percentiles de latencia. Sin caché de resultados: se mide el trabajo contra la base.
+
+En PostgreSQL todo se crea en el esquema bench_finanzas (se borra y se vuelve a crear en
+cada corrida), así no se toca ninguna tabla de la aplicación.
+"""
+import io
+import os
+import random
+import tempfile
+import time
+
+import psycopg2
+
+from gestor_db import GestorGastos
+from bench.generador import PASSWORD, poblar
+
+ESQUEMA_PG = "bench_finanzas"
+
+
+def percentiles(latencias):
+    """p50/p95/p99 y media en milisegundos de una lista de duraciones en segundos"""
+    if not latencias:
+        return {"p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0, "media_ms": 0.0}
+    orden = sorted(latencias)
+
+    def p(fraccion):
+        return orden[min(len(orden) - 1, int(len(orden) * fraccion))] * 1000
+
+    return {"p50_ms": p(0.50), "p95_ms": p(0.95), "p99_ms": p(0.99), "media_ms": sum(orden) / len(orden) * 1000}
+
+
+def medir(funcion, repeticiones, calentamiento=3):
+    """funcion(i) recibe 0..repeticiones-1; el calentamiento usa los índices siguientes"""
+    for i in range(calentamiento):
+        funcion(repeticiones + i)
+    latencias = []
+    inicio = time.perf_counter()
+    for i in range(repeticiones):
+        t = time.perf_counter()
+        funcion(i)
+        latencias.append(time.perf_counter() - t)
+    duracion = time.perf_counter() - inicio
+    return {"repeticiones": repeticiones, "ops_por_segundo": repeticiones / duracion if duracion else 0.0,
+            **percentiles(latencias)}
+
+
+def url_pg_aislada(url):
+    """Crea de cero el esquema de benchmark y devuelve la URL que lo usa por defecto"""
+    conexion = psycopg2.connect(url)
+    conexion.autocommit = True
+    with conexion.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {ESQUEMA_PG} CASCADE")
+        cur.execute(f"CREATE SCHEMA {ESQUEMA_PG}")
+    conexion.close()
+    separador = "&" if "?" in url else "?"
+    return f"{url}{separador}options=-c%20search_path%3D{ESQUEMA_PG}"
+
+
+def casos(gestor, ids, repeticiones, semilla):
+    """(nombre, función(i), repeticiones) para cada método medido"""
+    rng = random.Random(semilla)
+    usuarios = [rng.choice(ids) for _ in range(repeticiones + 10)]
+    # Usuario propio para las escrituras que modifican gastos existentes
+    _, propio = gestor.registrar_usuario("Bench Escrituras", "escrituras@bench.local", PASSWORD)
+    gestor.agregar_gastos_lote([(10.0, "Comida", f"Gasto {i}") for i in range(2 * repeticiones + 10)], propio)
+    gastos_propios = [g["id"] for g in gestor.obtener_todos_los_gastos(propio)]
+    a_actualizar, a_eliminar = gastos_propios[:repeticiones + 5], gastos_propios[repeticiones + 5:]
+    # Segunda página: la del primer usuario con más de 50 gastos
+    paginado, siguiente = usuarios[0], None
+    for uid in ids:
+        _, siguiente = gestor.obtener_gastos_paginados(uid, limite=50)
+        if siguiente:
+            paginado = uid
+            break
+    codigo = gestor.obtener_usuario_por_id(usuarios[0])["codigo_acceso"]
+    lote = [(5.0, "Ocio", "Cine"), (8.0, "Transporte", "Taxi"), (12.0, "Comida", "Cena")] * 10
+    pocas = max(1, repeticiones // 20)  # para los métodos lentos (hashing, recorridos completos)
+
+    return [
+        ("obtener_usuario_por_id", lambda i: gestor.obtener_usuario_por_id(usuarios[i]), repeticiones),
+        ("obtener_usuario_por_email", lambda i: gestor.obtener_usuario_por_email("usuario000000@bench.local"), repeticiones),
+        ("obtener_usuario_por_codigo", lambda i: gestor.obtener_usuario_por_codigo(codigo), repeticiones),
+        ("obtener_version_datos", lambda i: gestor.obtener_version_datos(usuarios[i]), repeticiones),
+        ("obtener_presupuesto_usuario", lambda i: gestor.obtener_presupuesto_usuario(usuarios[i]), repeticiones),
+        ("obtener_total_gastado", lambda i: gestor.obtener_total_gastado(usuarios[i]), repeticiones),
+        ("obtener_gastos_por_categoria", lambda i: gestor.obtener_gastos_por_categoria(usuarios[i]), repeticiones),
+        ("obtener_gastos_por_dia", lambda i: gestor.obtener_gastos_por_dia(usuarios[i]), repeticiones),
+        ("obtener_gastos_por_mes", lambda i: gestor.obtener_gastos_por_mes(usuarios[i]), repeticiones),
+        ("obtener_resumen", lambda i: gestor.obtener_resumen(usuarios[i]), repeticiones),
+        ("obtener_gastos_paginados", lambda i: gestor.obtener_gastos_paginados(usuarios[i], limite=50), repeticiones),
+        ("obtener_gastos_paginados_siguiente",
+         lambda i: gestor.obtener_gastos_paginados(paginado, limite=50, despues_de=siguiente), repeticiones),
+        ("obtener_gastos_paginados_categorias",
+         lambda i: gestor.obtener_gastos_paginados(usuarios[i], limite=50, categorias=["comida", "ocio"]), repeticiones),
+        ("obtener_dashboard", lambda i: gestor.obtener_dashboard(usuarios[i]), repeticiones),
+        ("buscar_gastos_paginados", lambda i: gestor.buscar_gastos_paginados("almuerzo", usuarios[i], limite=50),
+         repeticiones),
+        ("buscar_gastos_prefijo", lambda i: gestor.buscar_gastos_paginados("su", usuarios[i], limite=50), repeticiones),
+        ("obtener_todos_los_gastos", lambda i: gestor.obtener_todos_los_gastos(usuarios[i]), pocas),
+        ("iterar_gastos", lambda i: sum(1 for _ in gestor.iterar_gastos(usuarios[i])), pocas),
+        ("obtener_todos_los_gastos_filtrados",
+         lambda i: gestor.obtener_todos_los_gastos_filtrados("2025-03-01", "2025-03-31", usuarios[i]), repeticiones),
+        ("obtener_gastos_por_rango", lambda i: gestor.obtener_gastos_por_rango("2025-03-01", "2025-03-31", usuarios[i]),
+         repeticiones),
+        ("contar_gastos", lambda i: gestor.contar_gastos(usuarios[i]), repeticiones),
+        ("obtener_historial_cierres", lambda i: gestor.obtener_historial_cierres(usuarios[i]), repeticiones),
+        ("exportar_a_excel_completo", lambda i: gestor.exportar_a_excel_completo(io.BytesIO(), usuarios[i]), pocas),
+        ("agregar_gasto", lambda i: gestor.agregar_gasto(15.0, "Comida", "Almuerzo", usuarios[i]), repeticiones),
+        ("agregar_gastos_lote_30", lambda i: gestor.agregar_gastos_lote(lote, usuarios[i]), repeticiones),
+        ("actualizar_gasto", lambda i: gestor.actualizar_gasto(a_actualizar[i], 20.0, "Ocio", "Editado", "2025-06-01",
+                                                               propio), repeticiones),
+        ("eliminar_gasto", lambda i: gestor.eliminar_gasto(a_eliminar[i], propio), repeticiones),
+        ("actualizar_presupuesto_usuario",
+         lambda i: gestor.actualizar_presupuesto_usuario(usuarios[i], 4000 + i), repeticiones),
+        ("regenerar_codigo_acceso", lambda i: gestor.regenerar_codigo_acceso(propio), repeticiones),
+        ("verificar_login", lambda i: gestor.verificar_login("escrituras@bench.local", PASSWORD), pocas),
+        ("registrar_usuario",
+         lambda i: gestor.registrar_usuario("Nuevo", f"nuevo{i}.{time.time_ns()}@bench.local", PASSWORD), pocas),
+        ("reconstruir_resumenes", lambda i: gestor.reconstruir_resumenes(), min(3, pocas)),
+    ]
+
+
+def ejecutar(url=None, usuarios=100, gastos=100_000, semilla=42, repeticiones=200, progreso=print):
+    """
+    Pobla una base nueva (archivo temporal SQLite, o el esquema aislado en la URL de PostgreSQL)
+    y mide cada método. Devuelve {"motor", "usuarios", "gastos", "carga_segundos", "metodos": {...}}.
+    """
+    if url is None:
+        url = os.path.join(tempfile.mkdtemp(), "bench_micro.db")
+        motor = "sqlite"
+    else:
+        url = url_pg_aislada(url)
+        motor = "postgresql"
+    gestor = GestorGastos(url)
+    try:
+        inicio = time.perf_counter()
+        ids = poblar(gestor, usuarios=usuarios, gastos=gastos, semilla=semilla)
+        carga = time.perf_counter() - inicio
+        progreso(f"[{motor}] {gastos} gastos de {usuarios} usuarios cargados en {carga:.1f}s")
+
+        resultados = {}
+        for nombre, funcion, veces in casos(gestor, ids, repeticiones, semilla):
+            resultados[nombre] = medir(funcion, veces, calentamiento=0 if nombre == "reconstruir_resumenes" else 3)
+            r = resultados[nombre]
+            progreso(f"[{motor}] {nombre:<38} {r['ops_por_segundo']:>9.1f} ops/s  p50 {r['p50_ms']:>8.2f} ms  "
+                     f"p99 {r['p99_ms']:>8.2f} ms")
+        return {"motor": motor, "usuarios": usuarios, "gastos": gastos, "carga_segundos": carga, "metodos": resultados}
+    finally:
+        gestor.cerrar()
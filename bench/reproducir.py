@@ -0,0 +1,286 @@
+"""
+Reproduce una captura de CAPTURA_TRAFICO=1 (ver captura_trafico.py) contra una instancia
+local de la API, respetando los tiempos entre peticiones a 1x, 10x, 100x... y con un máximo
+de peticiones en vuelo. Así se repiten las ráfagas reales (varias peticiones del mismo
+usuario casi juntas al abrir el panel) en lugar de una carga uniforme.
+
+Cada cubeta de la captura pasa a ser un usuario sintético (replayNNNN@bench.local), que se
+registra y se puebla con gastos la primera vez. Los valores que la captura no guarda se
+reconstruyen: cuerpos a partir de su forma, ids de gastos del propio usuario, cursores y
+ETags de las respuestas anteriores del mismo usuario.
+"""
+import asyncio
+import json
+import random
+import time
+from datetime import date
+
+import httpx
+
+from bench.generador import CATEGORIAS, PASSWORD, generar_gastos
+from bench.micro import percentiles
+
+TAMANO_LOTE = 1000
+
+
+def leer_captura(archivos):
+    """Eventos de uno o más archivos JSONL (incluidas las copias rotadas), ordenados por tiempo"""
+    eventos = []
+    for nombre in archivos:
+        with open(nombre, encoding="utf-8") as archivo:
+            for linea in archivo:
+                try:
+                    eventos.append(json.loads(linea))
+                except ValueError:
+                    continue
+    eventos.sort(key=lambda e: e["t"])
+    return eventos
+
+
+def distribucion(latencias):
+    """Percentiles de percentiles() más p90 y máximo, en milisegundos"""
+    resultado = percentiles(latencias)
+    orden = sorted(latencias)
+    resultado["p90_ms"] = orden[min(len(orden) - 1, int(len(orden) * 0.90))] * 1000 if orden else 0.0
+    resultado["max_ms"] = orden[-1] * 1000 if orden else 0.0
+    return resultado
+
+
+def rafaga_maxima(tiempos, ventana=1.0):
+    """Mayor cantidad de peticiones dentro de una misma ventana de `ventana` segundos"""
+    maximo, inicio = 0, 0
+    for fin, t in enumerate(tiempos):
+        while t - tiempos[inicio] >= ventana:
+            inicio += 1
+        maximo = max(maximo, fin - inicio + 1)
+    return maximo
+
+
+def valor_sintetico(forma, campo, usuario, rng):
+    """Un valor con la forma capturada; los campos conocidos de la API reciben valores verosímiles"""
+    if isinstance(forma, dict):
+        if "lista" in forma:
+            return [valor_sintetico(forma["elemento"], campo, usuario, rng) for _ in range(forma["lista"])]
+        if "bytes" in forma:
+            return None
+        return {clave: valor_sintetico(sub, clave, usuario, rng) for clave, sub in forma.items()}
+    if forma == "numero":
+        if campo == "nuevo_limite":
+            return float(rng.choice((1500, 3000, 5000, 8000)))
+        return round(rng.lognormvariate(0, 0.7) * 15, 2) or 1.0
+    if forma == "texto":
+        if campo == "categoria":
+            return rng.choice(list(CATEGORIAS))
+        if campo == "descripcion":
+            return rng.choice(CATEGORIAS[rng.choice(list(CATEGORIAS))][2])
+        if campo == "fecha":
+            return date.today().isoformat()
+        if campo == "email":
+            return usuario["email"]
+        if campo == "password":
+            return PASSWORD
+        return "Replay"
+    if forma == "bool":
+        return True
+    return None
+
+
+class Reproductor:
+    def __init__(self, url, velocidad=1.0, concurrencia=32, gastos_por_usuario=300, semilla=42, tiempo_espera=30.0):
+        self.url = url
+        self.velocidad = velocidad
+        self.concurrencia = concurrencia
+        self.gastos_por_usuario = gastos_por_usuario
+        self.rng = random.Random(semilla)
+        self.semilla = semilla
+        self.tiempo_espera = tiempo_espera
+        self.usuarios = {}  # cubeta -> {"email", "token", "pin", "gastos", "cursor", "etags"}
+        self._nuevos = 0
+
+    async def _preparar_usuario(self, http, cubeta):
+        email = f"replay{cubeta:04d}@bench.local"
+        respuesta = await http.post("/auth/login", json={"email": email, "password": PASSWORD})
+        nuevo = respuesta.status_code == 401
+        if nuevo:
+            respuesta = await http.post("/auth/registro",
+                                        json={"nombre": f"Replay {cubeta}", "email": email, "password": PASSWORD})
+        respuesta.raise_for_status()
+        datos = respuesta.json()
+        usuario = {"email": email, "token": datos["token"], "pin": datos["usuario"].get("codigo_acceso"),
+                   "gastos": [], "cursor": None, "etags": {}}
+        cabeceras = {"Authorization": f"Bearer {usuario['token']}"}
+        if nuevo and self.gastos_por_usuario:
+            gastos = [{"monto": monto, "categoria": categoria, "descripcion": descripcion}
+                      for monto, categoria, descripcion, _, _ in
+                      generar_gastos(1, self.gastos_por_usuario, self.semilla + cubeta)]
+            for i in range(0, len(gastos), TAMANO_LOTE):
+                (await http.post("/gastos/lote", json={"gastos": gastos[i:i + TAMANO_LOTE]},
+                                 headers=cabeceras)).raise_for_status()
+        respuesta = await http.get("/gastos", params={"limit": 500}, headers=cabeceras)
+        respuesta.raise_for_status()
+        usuario["gastos"] = [g["id"] for g in respuesta.json()["gastos"]]
+        self.usuarios[cubeta] = usuario
+
+    async def preparar(self, http, cubetas):
+        """Registra (o reutiliza) un usuario sintético por cubeta"""
+        limite = asyncio.Semaphore(self.concurrencia)
+
+        async def uno(cubeta):
+            async with limite:
+                await self._preparar_usuario(http, cubeta)
+
+        await asyncio.gather(*(uno(c) for c in sorted(cubetas)))
+
+    def _peticion(self, evento):
+        """(método, ruta, parámetros, cabeceras, cuerpo, usuario) para repetir un evento capturado"""
+        cubeta = evento.get("cubeta")
+        usuario = self.usuarios.get(cubeta) or self.usuarios[self.rng.choice(list(self.usuarios))]
+        ruta = evento["ruta"]
+        if "{gasto_id}" in ruta:
+            ids = usuario["gastos"]
+            if evento["metodo"] == "DELETE" and ids:
+                gasto_id = ids.pop(self.rng.randrange(len(ids)))
+            else:
+                gasto_id = self.rng.choice(ids) if ids else 0
+            ruta = ruta.replace("{gasto_id}", str(gasto_id))
+
+        parametros = {}
+        for clave, valor in evento.get("query", {}).items():
+            if clave == "categorias":
+                parametros[clave] = [c.lower() for c in list(CATEGORIAS)[:valor]]
+            elif clave == "q":
+                # El texto buscado no se captura: se busca una palabra de una descripción verosímil
+                parametros[clave] = valor_sintetico("texto", "descripcion", usuario, self.rng).split()[0]
+            elif clave == "cursor":
+                # El cursor guardado es el de /gastos; el de una búsqueda no sirve en otra
+                if usuario["cursor"] and evento["ruta"] != "/gastos/buscar":
+                    parametros[clave] = usuario["cursor"]
+            elif valor != "?":
+                parametros[clave] = valor
+
+        cabeceras = {}
+        credencial = evento.get("credencial")
+        if credencial == "jwt" or (credencial == "pin" and not usuario["pin"]):
+            cabeceras["Authorization"] = f"Bearer {usuario['token']}"
+        elif credencial == "pin":
+            cabeceras["Authorization"] = f"Bearer {usuario['pin']}"
+        elif credencial == "invalida":
+            cabeceras["Authorization"] = "Bearer invalido"
+        if evento.get("condicional") and evento["ruta"] in usuario["etags"]:
+            cabeceras["If-None-Match"] = usuario["etags"][evento["ruta"]]
+
+        cuerpo = None
+        if evento.get("cuerpo") is not None:
+            cuerpo = valor_sintetico(evento["cuerpo"], None, usuario, self.rng)
+            if evento["ruta"] == "/auth/registro" and isinstance(cuerpo, dict):
+                self._nuevos += 1
+                cuerpo["email"] = f"replay-nuevo{self._nuevos}.{time.time_ns()}@bench.local"
+        return evento["metodo"], ruta, parametros, cabeceras, cuerpo, usuario
+
+    async def _enviar(self, http, evento, muestras, limite):
+        inicio = time.perf_counter()
+        try:
+            metodo, ruta, parametros, cabeceras, cuerpo, usuario = self._peticion(evento)
+            inicio = time.perf_counter()
+            respuesta = await http.request(metodo, ruta, params=parametros, headers=cabeceras, json=cuerpo)
+            estado = respuesta.status_code
+            if estado == 200 and metodo == "GET":
+                if "etag" in respuesta.headers:
+                    usuario["etags"][evento["ruta"]] = respuesta.headers["etag"]
+                if evento["ruta"] in ("/gastos", "/dashboard"):
+                    usuario["cursor"] = respuesta.json().get("next_cursor") or usuario["cursor"]
+        except httpx.HTTPError:
+            estado = None
+        finally:
+            limite.release()
+        muestras.setdefault(f"{evento['metodo']} {evento['ruta']}", []).append((time.perf_counter() - inicio, estado))
+
+    async def reproducir(self, eventos, progreso=print):
+        muestras, retrasos = {}, []
+        limites = httpx.Limits(max_connections=self.concurrencia, max_keepalive_connections=self.concurrencia)
+        async with httpx.AsyncClient(base_url=self.url, timeout=self.tiempo_espera, limits=limites) as http:
+            cubetas = {e["cubeta"] for e in eventos if e.get("cubeta") is not None} or {0}
+            await self.preparar(http, cubetas)
+            progreso(f"[reproducir] {len(self.usuarios)} usuarios listos; {len(eventos)} peticiones a "
+                     f"{self.velocidad:g}x con hasta {self.concurrencia} en vuelo")
+
+            limite = asyncio.Semaphore(self.concurrencia)
+            tareas = set()
+            loop = asyncio.get_running_loop()
+            t0 = eventos[0]["t"]
+            inicio = loop.time()
+            for evento in eventos:
+                objetivo = inicio + (evento["t"] - t0) / self.velocidad
+                espera = objetivo - loop.time()
+                if espera > 0:
+                    await asyncio.sleep(espera)
+                await limite.acquire()
+                # Cuánto salió tarde la petición respecto del horario (por falta de lugar en vuelo)
+                retrasos.append(max(0.0, loop.time() - objetivo))
+                tarea = asyncio.create_task(self._enviar(http, evento, muestras, limite))
+                tareas.add(tarea)
+                tarea.add_done_callback(tareas.discard)
+            await asyncio.gather(*tareas)
+            duracion = loop.time() - inicio
+        return muestras, retrasos, duracion
+
+
+def _resumen(muestras, originales, segundos):
+    """Conteos de estados y distribución de latencias de un endpoint (o del total)"""
+    estados = [estado for _, estado in muestras]
+    fallos = sum(1 for e in estados if e is None)
+    errores_5xx = sum(1 for e in estados if e is not None and e >= 500)
+    errores = fallos + errores_5xx
+    errores_originales = sum(1 for e in originales if e["estado"] >= 500)
+    original = percentiles([e["duracion_ms"] / 1000 for e in originales])
+    return {
+        "peticiones": len(muestras),
+        "errores": errores,
+        "tasa_error": errores / len(muestras) if muestras else 0.0,
+        "errores_4xx": sum(1 for e in estados if e is not None and 400 <= e < 500),
+        "errores_5xx": errores_5xx,
+        "fallos": fallos,
+        "peticiones_por_segundo": (len(muestras) - errores) / segundos if segundos else 0.0,
+        **distribucion([duracion for duracion, _ in muestras]),
+        "original_p50_ms": original["p50_ms"],
+        "original_p99_ms": original["p99_ms"],
+        "tasa_error_original": errores_originales / len(originales) if originales else 0.0,
+    }
+
+
+def ejecutar(archivos, url="http://127.0.0.1:8000", velocidad=1.0, concurrencia=32, gastos_por_usuario=300,
+             semilla=42, progreso=print):
+    """
+    Reproduce la captura y devuelve {"velocidad", "concurrencia", "segundos", "retraso_p99_ms",
+    "objetivo_por_segundo", "rafaga_max_por_segundo", "total": {...}, "endpoints": {...}}.
+    """
+    eventos = leer_captura(archivos)
+    if not eventos:
+        raise ValueError("La captura no tiene peticiones")
+    reproductor = Reproductor(url, velocidad, concurrencia, gastos_por_usuario, semilla)
+    muestras, retrasos, duracion = asyncio.run(reproductor.reproducir(eventos, progreso))
+
+    por_endpoint = {}
+    for evento in eventos:
+        por_endpoint.setdefault(f"{evento['metodo']} {evento['ruta']}", []).append(evento)
+    endpoints = {nombre: _resumen(m, por_endpoint[nombre], duracion) for nombre, m in sorted(muestras.items())}
+    total = _resumen([m for lista in muestras.values() for m in lista], eventos, duracion)
+    tiempos = [(e["t"] - eventos[0]["t"]) / velocidad for e in eventos]
+    resultado = {
+        "velocidad": velocidad,
+        "concurrencia": concurrencia,
+        "segundos": duracion,
+        "retraso_p99_ms": percentiles(retrasos)["p99_ms"],
+        "objetivo_por_segundo": len(eventos) / tiempos[-1] if tiempos[-1] else float(len(eventos)),
+        "rafaga_max_por_segundo": rafaga_maxima(tiempos),
+        "total": total,
+        "endpoints": endpoints,
+    }
+
+    for nombre, r in {**endpoints, "TOTAL": total}.items():
+        progreso(f"[reproducir] {nombre:<38} {r['peticiones']:>7} pet  p50 {r['p50_ms']:>7.2f} ms  "
+                 f"p95 {r['p95_ms']:>7.2f} ms  p99 {r['p99_ms']:>7.2f} ms  (original p99 {r['original_p99_ms']:>7.2f})  "
+                 f"errores {r['tasa_error']:.1%}")
+    progreso(f"[reproducir] objetivo {resultado['objetivo_por_segundo']:.1f} pet/s (ráfaga máx. "
+             f"{resultado['rafaga_max_por_segundo']} en 1 s); retraso p99 al enviar {resultado['retraso_p99_ms']:.1f} ms")
+    return resultado
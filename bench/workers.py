@@ -0,0 +1,110 @@
+"""
+Benchmark del modo multi-proceso: levanta servidor.py con 1, 2, 4... workers sobre una base
+SQLite nueva y mide peticiones por segundo con una mezcla de lecturas y escrituras
+(por defecto 90% GET /gastos/resumen, 10% POST /gastos) desde varios procesos cliente.
+
+Uso: python -m bench.workers [segundos] [conexiones] [fracción de escrituras]
+"""
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+PUERTO = 8799
+
+
+def esperar_servidor(timeout=30):
+    limite = time.time() + timeout
+    while time.time() < limite:
+        try:
+            conexion = http.client.HTTPConnection("127.0.0.1", PUERTO, timeout=1)
+            conexion.request("GET", "/api-docs-pretty")
+            conexion.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("El servidor no arrancó")
+
+
+def pedir(conexion, metodo, ruta, token, cuerpo=None):
+    cabeceras = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    conexion.request(metodo, ruta, body=json.dumps(cuerpo) if cuerpo else None, headers=cabeceras)
+    respuesta = conexion.getresponse()
+    respuesta.read()
+    return respuesta.status
+
+
+def cliente(token, segundos, escrituras, resultados):
+    """Un cliente con conexión keep-alive que pide sin pausa durante `segundos`"""
+    conexion = http.client.HTTPConnection("127.0.0.1", PUERTO, timeout=30)
+    ok, errores, latencias = 0, 0, []
+    limite = time.time() + segundos
+    while time.time() < limite:
+        inicio = time.perf_counter()
+        if random.random() < escrituras:
+            estado = pedir(conexion, "POST", "/gastos", token, {"monto": 10, "categoria": "Bench"})
+        else:
+            estado = pedir(conexion, "GET", "/gastos/resumen", token)
+        latencias.append(time.perf_counter() - inicio)
+        if estado < 400:
+            ok += 1
+        else:
+            errores += 1
+    resultados.put((ok, errores, latencias))
+
+
+def medir(workers, segundos, conexiones, escrituras=0.1):
+    ruta_bd = os.path.join(tempfile.mkdtemp(), "bench_workers.db")
+    entorno = dict(os.environ, DATABASE_URL=ruta_bd)
+    servidor = subprocess.Popen(
+        [sys.executable, "servidor.py", "--host", "127.0.0.1", "--port", str(PUERTO),
+         "--workers", str(workers), "--log-level", "warning"],
+        env=entorno, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        esperar_servidor()
+        conexion = http.client.HTTPConnection("127.0.0.1", PUERTO)
+        conexion.request("POST", "/auth/registro", body=json.dumps(
+            {"nombre": "Bench", "email": "bench@correo.com", "password": "secreto1"}),
+            headers={"Content-Type": "application/json"})
+        token = json.loads(conexion.getresponse().read())["token"]
+
+        resultados = multiprocessing.Queue()
+        clientes = [multiprocessing.Process(target=cliente, args=(token, segundos, escrituras, resultados))
+                    for _ in range(conexiones)]
+        for proceso in clientes:
+            proceso.start()
+        datos = [resultados.get() for _ in clientes]
+        for proceso in clientes:
+            proceso.join()
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+    ok = sum(d[0] for d in datos)
+    errores = sum(d[1] for d in datos)
+    latencias = sorted(l for d in datos for l in d[2])
+    return {
+        "peticiones_por_segundo": ok / segundos,
+        "errores": errores,
+        "p95_ms": latencias[int(len(latencias) * 0.95)] * 1000 if latencias else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    segundos = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    conexiones = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    escrituras = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+    nucleos = os.cpu_count() or 1
+    cantidades = sorted({1, 2, 4, nucleos})
+
+    print(f"{segundos:.0f}s por prueba, {conexiones} conexiones cliente, {escrituras:.0%} escrituras, {nucleos} núcleos")
+    print(f"{'workers':>7} {'pet/s':>9} {'errores':>8} {'p95':>10}")
+    for workers in cantidades:
+        r = medir(workers, segundos, conexiones, escrituras)
+        print(f"{workers:>7} {r['peticiones_por_segundo']:>9.1f} {r['errores']:>8} {r['p95_ms']:>8.1f}ms")
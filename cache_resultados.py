@@ -0,0 +1,182 @@
+"""
+Caché de resultados de lectura para GestorGastos.
+
+CacheResultados guarda el resultado de los métodos marcados con @cacheado, por
+(método, usuario, argumentos), y lo olvida cuando ese usuario escribe. El almacenamiento
+es intercambiable (BackendCache): CacheMemoria vive dentro del proceso; para compartir la
+caché entre varios workers basta implementar la misma interfaz sobre un servicio externo.
+"""
+import functools
+import inspect
+import pickle
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+class BackendCache(ABC):
+    """
+    Interfaz de almacenamiento: clave (str) -> bytes, con invalidación por usuario.
+    La generación de un usuario cambia cada vez que se lo invalida; guardar() recibe la
+    generación leída antes de calcular el valor y lo descarta si ya no es la actual.
+    Un backend al que le falte algún método no se puede instanciar.
+    """
+    @abstractmethod
+    def obtener(self, clave):
+        ...
+
+    @abstractmethod
+    def guardar(self, clave, datos, usuario_id, generacion):
+        ...
+
+    @abstractmethod
+    def generacion(self, usuario_id):
+        ...
+
+    @abstractmethod
+    def invalidar_usuario(self, usuario_id):
+        ...
+
+    @abstractmethod
+    def limpiar(self):
+        ...
+
+    def estadisticas(self):
+        return {}
+
+
+class CacheMemoria(BackendCache):
+    """LRU en memoria del proceso, acotado por el tamaño total (en bytes) de los valores guardados"""
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()  # clave -> (usuario_id, datos)
+        self._por_usuario = {}          # usuario_id -> claves
+        self._generaciones = {}         # usuario_id -> generación
+        self._generacion_global = 0     # cambia con limpiar()
+        self._bytes = 0
+        self._desalojos = 0
+        self._lock = threading.Lock()
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            self._entradas.move_to_end(clave)
+            return entrada[1]
+
+    def _quitar(self, clave):
+        usuario_id, datos = self._entradas.pop(clave)
+        self._bytes -= len(datos)
+        claves = self._por_usuario[usuario_id]
+        claves.discard(clave)
+        if not claves:
+            del self._por_usuario[usuario_id]
+
+    def guardar(self, clave, datos, usuario_id, generacion):
+        if len(datos) > self.max_bytes:
+            return False
+        with self._lock:
+            if generacion != self._generacion_actual(usuario_id):
+                return False
+            if clave in self._entradas:
+                self._quitar(clave)
+            self._entradas[clave] = (usuario_id, datos)
+            self._por_usuario.setdefault(usuario_id, set()).add(clave)
+            self._bytes += len(datos)
+            while self._bytes > self.max_bytes:
+                self._quitar(next(iter(self._entradas)))
+                self._desalojos += 1
+            return True
+
+    def _generacion_actual(self, usuario_id):
+        return (self._generacion_global, self._generaciones.get(usuario_id, 0))
+
+    def generacion(self, usuario_id):
+        with self._lock:
+            return self._generacion_actual(usuario_id)
+
+    def invalidar_usuario(self, usuario_id):
+        with self._lock:
+            self._generaciones[usuario_id] = self._generaciones.get(usuario_id, 0) + 1
+            for clave in list(self._por_usuario.get(usuario_id, ())):
+                self._quitar(clave)
+
+    def limpiar(self):
+        with self._lock:
+            self._generacion_global += 1
+            self._entradas.clear()
+            self._por_usuario.clear()
+            self._bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            return {"entradas": len(self._entradas), "bytes": self._bytes,
+                    "max_bytes": self.max_bytes, "desalojos": self._desalojos}
+
+
+class CacheResultados:
+    """
+    Capa de lectura a través de la caché: si el resultado está, se devuelve una copia
+    (los valores se guardan serializados); si no, se calcula, se guarda y se devuelve.
+    """
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else CacheMemoria()
+        self._stats_lock = threading.Lock()
+        self._stats = {"aciertos": 0, "fallos": 0, "invalidaciones": 0}
+
+    def _contar(self, clave):
+        with self._stats_lock:
+            self._stats[clave] += 1
+
+    def leer(self, metodo, usuario_id, args, calcular):
+        clave = f"{metodo}:{usuario_id}:{args!r}"
+        datos = self.backend.obtener(clave)
+        if datos is not None:
+            self._contar("aciertos")
+            return pickle.loads(datos)
+        self._contar("fallos")
+        # La generación se lee antes de ir a la base: si el usuario escribe mientras
+        # calculamos, el backend descarta este valor en lugar de guardarlo ya viejo
+        generacion = self.backend.generacion(usuario_id)
+        valor = calcular()
+        self.backend.guardar(clave, pickle.dumps(valor), usuario_id, generacion)
+        return valor
+
+    def invalidar_usuario(self, usuario_id):
+        self._contar("invalidaciones")
+        self.backend.invalidar_usuario(usuario_id)
+
+    def limpiar(self):
+        self._contar("invalidaciones")
+        self.backend.limpiar()
+
+    def estadisticas(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        consultas = stats["aciertos"] + stats["fallos"]
+        stats["tasa_aciertos"] = stats["aciertos"] / consultas if consultas else 0.0
+        stats.update(self.backend.estadisticas())
+        return stats
+
+
+def cacheado(metodo):
+    """
+    Marca un método de lectura de GestorGastos cuyo primer argumento es el usuario.
+    Los argumentos se normalizan con la firma del método (posicionales, por nombre o por
+    defecto dan la misma clave). Sin caché configurada (self.cache es None) o sin usuario,
+    llama directo a la base.
+    """
+    firma = inspect.signature(metodo)
+
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        if self.cache is None:
+            return metodo(self, *args, **kwargs)
+        argumentos = firma.bind(self, *args, **kwargs)
+        argumentos.apply_defaults()
+        usuario_id, *resto = list(argumentos.arguments.values())[1:]
+        if usuario_id is None:
+            return metodo(self, *args, **kwargs)
+        return self.cache.leer(metodo.__name__, usuario_id, tuple(resto), lambda: metodo(self, *args, **kwargs))
+    return envoltura
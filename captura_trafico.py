@@ -0,0 +1,210 @@
+"""
+Captura del tráfico real de la API (modo opcional, CAPTURA_TRAFICO=1) para reproducirlo
+después con `python -m bench reproducir`.
+
+Por cada petición se guarda una línea JSON con lo necesario para repetir la carga, pero
+ningún dato personal:
+- la ruta declarada (/gastos/{gasto_id}) y no la real;
+- de los parámetros de consulta, solo los valores que no identifican a nadie (limit) y la
+  cantidad de categorías pedidas; el resto, solo el nombre;
+- la forma del cuerpo JSON (campos, tipos y largo de las listas), nunca los valores;
+- una cubeta por usuario (hash con sal de su id) en lugar del id, el email o el token.
+
+La escritura la hace un hilo aparte (QueueListener), así el event loop no espera al disco.
+"""
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from urllib.parse import parse_qsl
+
+from jose import JWTError, jwt
+
+from metricas import plantilla_ruta
+
+# Parámetros de consulta cuyo valor se conserva tal cual
+PARAMETROS_CONSERVADOS = {"limit", "orden"}
+# Rutas que no son uso de la API
+RUTAS_EXCLUIDAS = ("/metrics", "/static", "sin_ruta")
+MAX_CUERPO = 256 * 1024
+
+
+def forma_json(valor):
+    """Estructura de un valor JSON sin sus datos: {"monto": "numero", "gastos": {"lista": 30, ...}}"""
+    if isinstance(valor, dict):
+        return {clave: forma_json(v) for clave, v in valor.items()}
+    if isinstance(valor, list):
+        return {"lista": len(valor), "elemento": forma_json(valor[0]) if valor else None}
+    if isinstance(valor, bool):
+        return "bool"
+    if isinstance(valor, (int, float)):
+        return "numero"
+    if isinstance(valor, str):
+        return "texto"
+    return "nulo"
+
+
+def parametros_saneados(query_string):
+    """Parámetros de consulta sin valores personales: {"limit": "50", "categorias": 2, "cursor": "?"}"""
+    saneados = {}
+    for clave, valor in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True):
+        if clave in PARAMETROS_CONSERVADOS:
+            saneados[clave] = valor
+        elif clave == "categorias":
+            saneados[clave] = saneados.get(clave, 0) + 1
+        else:
+            saneados[clave] = "?"
+    return saneados
+
+
+class CapturaTrafico:
+    """
+    archivo: destino JSONL (con rotación). Con por_proceso=True cada proceso escribe en el
+    suyo (archivo.<pid>.jsonl), ya que la rotación no es segura entre procesos.
+    muestreo: fracción de las peticiones que se guarda.
+    sal: secreto con el que se calcula la cubeta de cada usuario (la misma en todos los workers).
+    """
+    def __init__(self, archivo="trafico.jsonl", muestreo=1.0, cubetas=1000, sal="", por_proceso=False,
+                 max_bytes=50 * 1024 * 1024, copias=5):
+        self.archivo = archivo
+        self.muestreo = muestreo
+        self.cubetas = cubetas
+        self.sal = sal.encode()
+        self.por_proceso = por_proceso
+        self.max_bytes = max_bytes
+        self.copias = copias
+        self._capturadas = 0
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+        # Logger propio (fuera del árbol de logging) para no mezclarse con el log de la app
+        self._log = logging.Logger("captura_trafico")
+
+    def _abrir(self):
+        """Abre el archivo en el proceso actual (el módulo puede importarse antes de un fork)"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            archivo = self.archivo
+            if self.por_proceso:
+                raiz, extension = os.path.splitext(archivo)
+                archivo = f"{raiz}.{os.getpid()}{extension}"
+            destino = RotatingFileHandler(archivo, maxBytes=self.max_bytes, backupCount=self.copias, encoding="utf-8")
+            destino.setFormatter(logging.Formatter("%(message)s"))
+            cola = queue.SimpleQueue()
+            self._log.handlers = [QueueHandler(cola)]
+            self._listener = QueueListener(cola, destino)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def capturar(self):
+        """Si esta petición entra en la muestra"""
+        return self.muestreo >= 1 or random.random() < self.muestreo
+
+    def cubeta(self, credencial):
+        """(tipo de credencial, cubeta del usuario) a partir del Bearer, sin validarlo"""
+        if not credencial:
+            return None, None
+        if credencial.isdigit() and len(credencial) == 6:
+            # Sin ir a la base no se sabe de quién es el PIN: la cubeta sale del PIN mismo
+            tipo, identidad = "pin", credencial
+        else:
+            try:
+                tipo, identidad = "jwt", str(jwt.get_unverified_claims(credencial).get("sub"))
+            except JWTError:
+                return "invalida", None
+        resumen = hashlib.sha256(self.sal + identidad.encode()).digest()
+        return tipo, int.from_bytes(resumen[:8], "big") % self.cubetas
+
+    def registrar(self, evento):
+        if self._pid != os.getpid():
+            self._abrir()
+        self._capturadas += 1
+        self._log.info(json.dumps(evento, ensure_ascii=False, separators=(",", ":")))
+
+    def estadisticas(self):
+        return {"archivo": self.archivo, "muestreo": self.muestreo, "capturadas": self._capturadas}
+
+    def cerrar(self):
+        """Escribe lo pendiente y cierra el archivo"""
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                for handler in self._listener.handlers:
+                    handler.close()
+                self._listener = None
+                self._pid = None
+
+
+class MiddlewareCaptura:
+    """Middleware ASGI: guarda cada petición (saneada) con su estado y duración en la CapturaTrafico"""
+    def __init__(self, app, captura):
+        self.app = app
+        self.captura = captura
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.captura.capturar():
+            await self.app(scope, receive, send)
+            return
+        marca = time.time()
+        inicio = time.perf_counter()
+        estado = 500
+        enviados = 0
+        cuerpo = bytearray()
+        recibidos = 0
+
+        async def recibir():
+            nonlocal recibidos
+            mensaje = await receive()
+            if mensaje["type"] == "http.request":
+                trozo = mensaje.get("body", b"")
+                recibidos += len(trozo)
+                if len(cuerpo) < MAX_CUERPO:
+                    cuerpo.extend(trozo)
+            return mensaje
+
+        async def enviar(mensaje):
+            nonlocal estado, enviados
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            elif mensaje["type"] == "http.response.body":
+                enviados += len(mensaje.get("body", b""))
+            await send(mensaje)
+
+        try:
+            await self.app(scope, recibir, enviar)
+        finally:
+            ruta = plantilla_ruta(scope)
+            if not ruta.startswith(RUTAS_EXCLUIDAS):
+                self.captura.registrar(self._evento(scope, ruta, marca, time.perf_counter() - inicio, estado,
+                                                    enviados, bytes(cuerpo), recibidos))
+
+    def _evento(self, scope, ruta, marca, segundos, estado, enviados, cuerpo, recibidos):
+        cabeceras = {clave: valor for clave, valor in scope["headers"]}
+        autorizacion = cabeceras.get(b"authorization", b"").decode("latin-1")
+        credencial = autorizacion[7:].strip() if autorizacion.lower().startswith("bearer ") else None
+        tipo, cubeta = self.captura.cubeta(credencial)
+        forma = None
+        if recibidos:
+            try:
+                forma = forma_json(json.loads(cuerpo)) if recibidos <= MAX_CUERPO else {"bytes": recibidos}
+            except ValueError:
+                forma = {"bytes": recibidos}
+        return {
+            "t": round(marca, 4),
+            "metodo": scope["method"],
+            "ruta": ruta,
+            "query": parametros_saneados(scope.get("query_string", b"")),
+            "cuerpo": forma,
+            "cubeta": cubeta,
+            "credencial": tipo,
+            "condicional": b"if-none-match" in cabeceras,
+            "estado": estado,
+            "duracion_ms": round(segundos * 1000, 3),
+            "respuesta_bytes": enviados,
+        }
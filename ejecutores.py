@@ -0,0 +1,152 @@
+"""
+Pools de hilos acotados para la API asíncrona.
+
+Los endpoints `async def` no bloquean el event loop: mandan cada trabajo bloqueante al
+EjecutorAcotado que le corresponde (base de datos, PDF, hashing). Cada pool tiene su propio
+tamaño y su propia cola, así un tipo de trabajo lento no deja sin hilos a los demás.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class EjecutorAcotado:
+    """
+    ThreadPoolExecutor con nombre y contadores de cola: cuántas tareas esperan hilo, cuántas
+    corren, el máximo de espera visto y el tiempo que pasaron en cola. Los hilos se crean en
+    el primer uso y cerrar() los libera; un uso posterior vuelve a crearlos.
+    """
+    def __init__(self, nombre, max_hilos):
+        self.nombre = nombre
+        self.max_hilos = max(1, max_hilos)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._stats = {"en_cola": 0, "en_curso": 0, "completadas": 0, "errores": 0, "canceladas": 0,
+                       "max_en_cola": 0, "espera_total": 0.0, "espera_max": 0.0}
+
+    def _obtener_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_hilos,
+                                                    thread_name_prefix=f"ejecutor-{self.nombre}")
+            return self._executor
+
+    def enviar(self, funcion, *args, **kwargs):
+        """Encola la tarea y devuelve su concurrent.futures.Future"""
+        encolada = time.perf_counter()
+        with self._lock:
+            self._stats["en_cola"] += 1
+            self._stats["max_en_cola"] = max(self._stats["max_en_cola"], self._stats["en_cola"])
+
+        def tarea():
+            espera = time.perf_counter() - encolada
+            with self._lock:
+                self._stats["en_cola"] -= 1
+                self._stats["en_curso"] += 1
+                self._stats["espera_total"] += espera
+                self._stats["espera_max"] = max(self._stats["espera_max"], espera)
+            ok = False
+            try:
+                resultado = funcion(*args, **kwargs)
+                ok = True
+                return resultado
+            finally:
+                with self._lock:
+                    self._stats["en_curso"] -= 1
+                    self._stats["completadas" if ok else "errores"] += 1
+
+        futuro = self._obtener_executor().submit(tarea)
+        futuro.add_done_callback(self._al_terminar)
+        return futuro
+
+    def _al_terminar(self, futuro):
+        # Cancelada antes de tomar un hilo (el cliente se fue): nunca salió de la cola
+        if futuro.cancelled():
+            with self._lock:
+                self._stats["en_cola"] -= 1
+                self._stats["canceladas"] += 1
+
+    async def ejecutar(self, funcion, *args, **kwargs):
+        """Corre funcion(*args, **kwargs) en un hilo de este pool y espera el resultado sin bloquear el loop"""
+        return await asyncio.wrap_future(self.enviar(funcion, *args, **kwargs))
+
+    def estadisticas(self):
+        with self._lock:
+            stats = dict(self._stats)
+        atendidas = stats["completadas"] + stats["errores"]
+        espera_total = stats.pop("espera_total")
+        stats["max_hilos"] = self.max_hilos
+        stats["espera_promedio"] = espera_total / atendidas if atendidas else 0.0
+        return stats
+
+    def cerrar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+
+async def iterar_en_ejecutor(ejecutor, iterable):
+    """
+    Recorre un iterable bloqueante (p. ej. un generador que lee de la base) desde código
+    asíncrono: cada next() corre en un hilo del ejecutor. Si el recorrido se corta antes del
+    final, el generador se cierra también en el ejecutor para liberar su conexión.
+    """
+    iterador = iter(iterable)
+    fin = object()
+    pendiente = None
+    try:
+        while True:
+            pendiente = ejecutor.enviar(next, iterador, fin)
+            elemento = await asyncio.wrap_future(pendiente)
+            if elemento is fin:
+                break
+            yield elemento
+    finally:
+        cerrar = getattr(iterador, "close", None)
+        if cerrar is not None:
+            # Un next() cancelado puede seguir corriendo: se cierra cuando termine
+            if pendiente is not None and not pendiente.done():
+                pendiente.add_done_callback(lambda _: ejecutor.enviar(cerrar))
+            else:
+                ejecutor.enviar(cerrar)
+
+
+class IteradorConCupo:
+    """
+    Envuelve un iterable que retiene un recurso (p. ej. una conexión dedicada) mientras se
+    recorre y ocupa un lugar de `cupo` (un semáforo ya adquirido) hasta que se agota o se
+    cierra, aunque nunca se haya empezado a recorrer. Se puede pasar a iterar_en_ejecutor.
+    """
+    def __init__(self, iterable, cupo):
+        self._cupo = cupo
+        self._liberado = False
+        self._lock = threading.Lock()
+        self._iterador = iter(iterable)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._iterador)
+        except StopIteration:
+            self.close()
+            raise
+
+    def close(self):
+        with self._lock:
+            if self._liberado:
+                return
+            self._liberado = True
+        try:
+            cerrar = getattr(self._iterador, "close", None)
+            if cerrar is not None:
+                cerrar()
+        finally:
+            self._cupo.release()
+
+    def __del__(self):
+        # Una respuesta que nunca empezó a enviarse no llega a cerrarlo
+        self.close()
@@ -0,0 +1,216 @@
+"""
+Exportaciones en segundo plano (reporte PDF, CSV completo, libro de Excel) dentro del
+proceso de la API.
+
+POST /exportaciones encola el trabajo y responde enseguida con su id; un pool de hilos propio
+lo ejecuta mientras el cliente consulta el estado y el avance. El archivo terminado queda en
+memoria hasta que vence, con un tope total de bytes: al pasarlo se descartan primero los
+terminados hace más tiempo. Un trabajo se puede cancelar en cola o mientras corre (las
+exportaciones revisan la cancelación cada lote de filas).
+"""
+import logging
+import secrets
+import threading
+import time
+
+ACTIVOS = ("en_cola", "en_curso")
+
+
+class LimiteExportaciones(Exception):
+    """El usuario ya tiene el máximo de exportaciones en cola o en curso"""
+
+
+class Exportacion:
+    """Un trabajo de exportación: estado, avance y, al terminar, el archivo generado"""
+    def __init__(self, usuario_id, tipo):
+        self.id = secrets.token_urlsafe(12)
+        self.usuario_id = usuario_id
+        self.tipo = tipo
+        self.estado = "en_cola"
+        self.filas = 0
+        self.total = None
+        self.creado = time.time()
+        self.iniciado = None
+        self.terminado = None
+        self.error = None
+        self.datos = None
+        self.nombre_archivo = None
+        self.tipo_contenido = None
+        self.futuro = None
+        self._cancelar = threading.Event()
+
+    @property
+    def cancelada(self):
+        return self._cancelar.is_set()
+
+    def avanzar(self, filas, total=None):
+        """Callback de avance para la exportación; devuelve False si hay que interrumpirla"""
+        self.filas = filas
+        if total is not None:
+            self.total = total
+        return not self._cancelar.is_set()
+
+    def como_dict(self):
+        progreso = None
+        if self.estado == "terminado":
+            progreso = 1.0
+        elif self.total:
+            progreso = min(1.0, self.filas / self.total)
+        return {
+            "id": self.id,
+            "tipo": self.tipo,
+            "estado": self.estado,
+            "progreso": progreso,
+            "filas": self.filas,
+            "total": self.total,
+            "creado": self.creado,
+            "iniciado": self.iniciado,
+            "terminado": self.terminado,
+            "bytes": len(self.datos) if self.datos is not None else None,
+            "error": self.error,
+        }
+
+
+class ColaExportaciones:
+    """
+    ejecutor: EjecutorAcotado donde corren los trabajos (su tamaño es la concurrencia).
+    max_bytes: tope de la suma de los archivos retenidos; ttl: segundos que se guarda cada uno.
+    max_por_usuario: trabajos en cola o en curso permitidos por usuario.
+    """
+    def __init__(self, ejecutor, max_bytes=256 * 1024 * 1024, ttl=3600, max_por_usuario=3, max_trabajos=1000):
+        self.ejecutor = ejecutor
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_por_usuario = max_por_usuario
+        self.max_trabajos = max_trabajos
+        self._trabajos = {}  # id -> Exportacion, en orden de creación
+        self._bytes = 0
+        self._descartados = 0
+        self._lock = threading.Lock()
+
+    def enviar(self, usuario_id, tipo, funcion):
+        """
+        Encola funcion(trabajo) -> (bytes, nombre_archivo, tipo_contenido), o None si se
+        interrumpió porque trabajo.avanzar() devolvió False. Devuelve la Exportacion.
+        """
+        with self._lock:
+            self._vencer()
+            activos = sum(1 for t in self._trabajos.values() if t.usuario_id == usuario_id and t.estado in ACTIVOS)
+            if activos >= self.max_por_usuario:
+                raise LimiteExportaciones(f"Ya hay {activos} exportaciones en curso; espere a que terminen")
+            trabajo = Exportacion(usuario_id, tipo)
+            self._trabajos[trabajo.id] = trabajo
+            self._recortar_historial()
+        trabajo.futuro = self.ejecutor.enviar(self._correr, trabajo, funcion)
+        return trabajo
+
+    def _correr(self, trabajo, funcion):
+        with self._lock:
+            if trabajo.cancelada:
+                return
+            trabajo.estado = "en_curso"
+            trabajo.iniciado = time.time()
+        try:
+            resultado = funcion(trabajo)
+        except Exception as e:
+            logging.error(f"Error en la exportación {trabajo.tipo} {trabajo.id}: {e}")
+            self._finalizar(trabajo, "error", error="Error interno al generar la exportación")
+            return
+        if resultado is None or trabajo.cancelada:
+            self._finalizar(trabajo, "cancelado")
+            return
+        datos, nombre_archivo, tipo_contenido = resultado
+        if len(datos) > self.max_bytes:
+            self._finalizar(trabajo, "error", error="El archivo generado supera el tamaño máximo retenido")
+            return
+        with self._lock:
+            trabajo.datos, trabajo.nombre_archivo, trabajo.tipo_contenido = datos, nombre_archivo, tipo_contenido
+            self._bytes += len(datos)
+            trabajo.estado = "terminado"
+            trabajo.terminado = time.time()
+            self._liberar_memoria()
+
+    def _finalizar(self, trabajo, estado, error=None):
+        with self._lock:
+            trabajo.estado = estado
+            trabajo.error = error
+            trabajo.terminado = time.time()
+
+    def _descartar_archivo(self, trabajo, estado="vencido"):
+        if trabajo.datos is not None:
+            self._bytes -= len(trabajo.datos)
+            trabajo.datos = None
+            self._descartados += 1
+        trabajo.estado = estado
+
+    def _vencer(self):
+        limite = time.time() - self.ttl
+        for trabajo in self._trabajos.values():
+            if trabajo.estado == "terminado" and trabajo.terminado < limite:
+                self._descartar_archivo(trabajo)
+
+    def _liberar_memoria(self):
+        """Descarta los archivos terminados hace más tiempo hasta volver a estar bajo max_bytes"""
+        if self._bytes <= self.max_bytes:
+            return
+        for trabajo in sorted((t for t in self._trabajos.values() if t.datos is not None), key=lambda t: t.terminado):
+            self._descartar_archivo(trabajo)
+            if self._bytes <= self.max_bytes:
+                break
+
+    def _recortar_historial(self):
+        """Olvida los trabajos finalizados más viejos si hay más de max_trabajos"""
+        sobrantes = len(self._trabajos) - self.max_trabajos
+        for id_trabajo in [i for i, t in self._trabajos.items() if t.estado not in ACTIVOS][:max(0, sobrantes)]:
+            self._descartar_archivo(self._trabajos.pop(id_trabajo))
+
+    def obtener(self, id_trabajo, usuario_id):
+        """El trabajo si existe y es del usuario; None si no"""
+        with self._lock:
+            self._vencer()
+            trabajo = self._trabajos.get(id_trabajo)
+            return trabajo if trabajo is not None and trabajo.usuario_id == usuario_id else None
+
+    def listar(self, usuario_id):
+        with self._lock:
+            self._vencer()
+            return [t for t in self._trabajos.values() if t.usuario_id == usuario_id]
+
+    def cancelar(self, id_trabajo, usuario_id):
+        """
+        Cancela el trabajo si está en cola o en curso; si ya terminó, descarta su archivo.
+        Devuelve el trabajo, o None si no existe o es de otro usuario.
+        """
+        trabajo = self.obtener(id_trabajo, usuario_id)
+        if trabajo is None:
+            return None
+        with self._lock:
+            trabajo._cancelar.set()
+            if trabajo.estado == "en_cola":
+                # Si ya tomó un hilo, o todavía no se entregó al ejecutor (futuro None),
+                # _correr lo verá cancelado apenas empiece
+                if trabajo.futuro is not None:
+                    trabajo.futuro.cancel()
+                trabajo.estado = "cancelado"
+                trabajo.terminado = time.time()
+            elif trabajo.estado == "terminado":
+                self._descartar_archivo(trabajo, "eliminado")
+        return trabajo
+
+    def estadisticas(self):
+        with self._lock:
+            estados = {}
+            for trabajo in self._trabajos.values():
+                estados[trabajo.estado] = estados.get(trabajo.estado, 0) + 1
+            return {"trabajos": estados, "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "descartados": self._descartados}
+
+    def cerrar(self):
+        """Cancela lo pendiente y espera a que terminen los trabajos en curso"""
+        with self._lock:
+            for trabajo in self._trabajos.values():
+                if trabajo.estado in ACTIVOS:
+                    trabajo._cancelar.set()
+                    if trabajo.futuro is not None:
+                        trabajo.futuro.cancel()
+        self.ejecutor.cerrar()
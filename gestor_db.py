@@ -1,293 +1,1587 @@
 import sqlite3
 import psycopg2
 import logging
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Tuple, Dict
 from passlib.context import CryptContext
 import threading
-from psycopg2.extras import RealDictCursor
+import time
+from contextlib import contextmanager
+import psycopg2.errors
+from psycopg2.extras import RealDictCursor, execute_values
+from psycopg2.pool import ThreadedConnectionPool
+from openpyxl import Workbook
 import os
+import random
+import re
+import secrets
+import sys
+from cache_resultados import cacheado
+from pool_procesos import PoolProcesos
 
 # Configuración de Passlib para hashing seguro
 pwd_context = CryptContext(schemes=["pbkdf2_sha256", "bcrypt"], deprecated="auto")
 
+def normalizar_categoria(categoria):
+    """Clave de búsqueda de una categoría: sin espacios sobrantes y en minúsculas"""
+    return categoria.strip().lower() if categoria is not None else None
+
+# Letras que la búsqueda de PostgreSQL iguala a la misma sin acento (hace lo de la extensión
+# unaccent, que no todos los servidores tienen, con translate(), que sí se puede indexar)
+ACENTOS = "áàâäãéèêëíìîïóòôöõúùûüñç"
+SIN_ACENTOS = "aaaaaeeeeiiiiooooouuuunc"
+MAX_TERMINOS_BUSQUEDA = 8
+
+def normalizar_fecha(fecha):
+    """
+    Fecha (date, datetime o texto 'AAAA-MM-DD', con o sin hora) como texto 'AAAA-MM-DD', que es
+    como la guarda la columna DATE y como se compara en los filtros por rango.
+    Lanza ValueError si no es una fecha válida.
+    """
+    if isinstance(fecha, datetime):
+        return fecha.date().isoformat()
+    if isinstance(fecha, date):
+        return fecha.isoformat()
+    return datetime.strptime(str(fecha).strip()[:10], "%Y-%m-%d").date().isoformat()
+
+# Formatos que podían quedar al editar la fecha a mano en la app de escritorio; se reconocen al migrar
+FORMATOS_FECHA_ANTIGUOS = ("%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%d/%m/%y")
+# Fecha que reciben al migrar los gastos sin fecha o con una que no se puede leer
+FECHA_DESCONOCIDA = "1900-01-01"
+
+def fecha_antigua(valor):
+    """Fecha 'AAAA-MM-DD' de un valor guardado antes de la columna DATE, o FECHA_DESCONOCIDA"""
+    if valor is None:
+        return FECHA_DESCONOCIDA
+    texto = str(valor).strip()
+    try:
+        return normalizar_fecha(texto)
+    except ValueError:
+        pass
+    dia = texto.split()[0] if texto else ""
+    for formato in FORMATOS_FECHA_ANTIGUOS:
+        try:
+            return datetime.strptime(dia, formato).date().isoformat()
+        except ValueError:
+            continue
+    return FECHA_DESCONOCIDA
+
+def terminos_busqueda(texto):
+    """Palabras de una búsqueda, sin los signos que tienen significado para FTS5 o to_tsquery"""
+    return re.findall(r"\w+", texto or "")[:MAX_TERMINOS_BUSQUEDA]
+
+class ControlConcurrencia:
+    """
+    Coordina lecturas y escrituras sobre la base de datos.
+    - 'lectura_escritura': las escrituras se serializan y las lecturas no toman ningún lock
+      (SQLite en WAL y PostgreSQL con MVCC ya garantizan lecturas consistentes).
+    - 'exclusivo': comportamiento anterior, un único lock para todo.
+    Lleva la cuenta de cuántas veces y cuánto tiempo esperaron los que llamaron.
+    """
+    MODOS = ("lectura_escritura", "exclusivo")
+
+    def __init__(self, modo="lectura_escritura"):
+        if modo not in self.MODOS:
+            raise ValueError(f"Modo de concurrencia desconocido: {modo}")
+        self.modo = modo
+        self._lock = threading.RLock()
+        self._stats_lock = threading.Lock()
+        self._stats = {"lecturas": 0, "escrituras": 0,
+                       "esperas_lectura": 0, "esperas_escritura": 0,
+                       "tiempo_espera_lectura": 0.0, "tiempo_espera_escritura": 0.0,
+                       "tiempo_espera_max": 0.0, "reintentos_bloqueo": 0}
+
+    def _adquirir(self, tipo):
+        inicio = time.perf_counter()
+        espero = not self._lock.acquire(blocking=False)
+        if espero:
+            self._lock.acquire()
+        espera = time.perf_counter() - inicio
+        with self._stats_lock:
+            self._stats[f"{tipo}s"] += 1
+            if espero:
+                self._stats[f"esperas_{tipo}"] += 1
+                self._stats[f"tiempo_espera_{tipo}"] += espera
+                self._stats["tiempo_espera_max"] = max(self._stats["tiempo_espera_max"], espera)
+
+    @contextmanager
+    def lectura(self):
+        if self.modo == "lectura_escritura":
+            with self._stats_lock:
+                self._stats["lecturas"] += 1
+            yield
+            return
+        self._adquirir("lectura")
+        try:
+            yield
+        finally:
+            self._lock.release()
+
+    @contextmanager
+    def escritura(self):
+        self._adquirir("escritura")
+        try:
+            yield
+        finally:
+            self._lock.release()
+
+    def contar_reintento(self):
+        """Un BEGIN IMMEDIATE encontró la base bloqueada por otro proceso"""
+        with self._stats_lock:
+            self._stats["reintentos_bloqueo"] += 1
+
+    def estadisticas(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["modo"] = self.modo
+        return stats
+
+
+class PoolConexiones:
+    """
+    Pool acotado de conexiones con checkout/checkin y estadísticas de espera.
+    - PostgreSQL: conexiones compartidas de un ThreadedConnectionPool de psycopg2.
+    - SQLite: una conexión propia por hilo, reutilizada entre préstamos. Con wal=True
+      la base pasa a journal WAL, esas conexiones quedan de solo lectura y las escrituras
+      usan una única conexión escritora (protegida por ControlConcurrencia.escritura).
+    - SQLite ':memory:': cada conexión sería una base vacía distinta, así que todos los hilos
+      comparten una sola (el gestor la usa en modo 'exclusivo', de a un hilo por vez).
+    Un mismo hilo que pide conexión dos veces (llamadas anidadas) recibe la misma.
+    """
+    def __init__(self, archivo_bd, es_postgresql, max_conexiones=10, timeout=30.0, wal=False, busy_timeout=5.0):
+        self.archivo_bd = archivo_bd
+        self.es_postgresql = es_postgresql
+        self.max_conexiones = max_conexiones
+        self.timeout = timeout
+        self.busy_timeout = busy_timeout
+        self.wal = wal and not es_postgresql
+        self.en_memoria = not es_postgresql and archivo_bd == ":memory:"
+        self._semaforo = threading.BoundedSemaphore(max_conexiones)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {"prestamos": 0, "esperas": 0, "timeouts": 0, "en_uso": 0,
+                       "tiempo_espera_total": 0.0, "tiempo_espera_max": 0.0}
+        self._conexiones_sqlite = []
+        self._escritor = None
+
+        if self.es_postgresql:
+            self._pool_pg = ThreadedConnectionPool(1, max_conexiones, archivo_bd)
+            print(f"[OK] Pool PostgreSQL (Neon) listo (máx. {max_conexiones} conexiones).")
+        else:
+            self._pool_pg = None
+            self._compartida = self._nueva_conexion_sqlite() if self.en_memoria else None
+            if self.wal:
+                self._escritor = self._nueva_conexion_sqlite()
+                self._escritor.execute("PRAGMA journal_mode=WAL")
+            print(f"[OK] Pool SQLite listo (máx. {max_conexiones} conexiones{', WAL' if self.wal else ''}).")
+
+    def _nueva_conexion_sqlite(self, solo_lectura=False):
+        conexion = sqlite3.connect(self.archivo_bd, check_same_thread=False, timeout=self.busy_timeout)
+        conexion.row_factory = sqlite3.Row
+        if solo_lectura:
+            conexion.execute("PRAGMA query_only=ON")
+        with self._stats_lock:
+            self._conexiones_sqlite.append(conexion)
+        return conexion
+
+    def _tomar_conexion(self):
+        if self.es_postgresql:
+            conexion = self._pool_pg.getconn()
+            if conexion.closed != 0:
+                # Neon cierra conexiones ociosas: la descartamos y pedimos otra
+                self._pool_pg.putconn(conexion, close=True)
+                conexion = self._pool_pg.getconn()
+            return conexion
+        if self.en_memoria:
+            return self._compartida
+        conexion = getattr(self._local, "sqlite", None)
+        if conexion is None:
+            conexion = self._nueva_conexion_sqlite(solo_lectura=self.wal)
+            self._local.sqlite = conexion
+        return conexion
+
+    def _prestadas(self):
+        prestadas = getattr(self._local, "prestadas", None)
+        if prestadas is None:
+            prestadas = self._local.prestadas = {}
+        return prestadas
+
+    def _reservar_cupo(self):
+        """Ocupa un lugar del pool, esperando como mucho self.timeout segundos"""
+        inicio = time.perf_counter()
+        espero = not self._semaforo.acquire(blocking=False)
+        if espero and not self._semaforo.acquire(timeout=self.timeout):
+            with self._stats_lock:
+                self._stats["timeouts"] += 1
+            raise TimeoutError(f"No hay conexiones libres tras {self.timeout}s (máx. {self.max_conexiones})")
+        espera = time.perf_counter() - inicio
+
+        with self._stats_lock:
+            self._stats["prestamos"] += 1
+            self._stats["en_uso"] += 1
+            if espero:
+                self._stats["esperas"] += 1
+                self._stats["tiempo_espera_total"] += espera
+                self._stats["tiempo_espera_max"] = max(self._stats["tiempo_espera_max"], espera)
+
+    def _liberar_cupo(self):
+        with self._stats_lock:
+            self._stats["en_uso"] -= 1
+        self._semaforo.release()
+
+    def _devolver_pg(self, conexion):
+        # Cerrar cualquier transacción abierta para que el siguiente la reciba limpia
+        roto = conexion.closed != 0
+        if not roto:
+            try:
+                conexion.rollback()
+            except Exception:
+                roto = True
+        self._pool_pg.putconn(conexion, close=roto)
+
+    def obtener(self, escritura=False):
+        """Checkout: presta una conexión, esperando si el pool está lleno"""
+        clave = "escritor" if escritura and self.wal else "pool"
+        prestadas = self._prestadas()
+        if clave in prestadas:
+            prestadas[clave][1] += 1
+            return prestadas[clave][0]
+
+        if clave == "escritor":
+            # La conexión escritora es única y el lock de escritura ya garantiza exclusividad
+            prestadas[clave] = [self._escritor, 1]
+            return self._escritor
+
+        self._reservar_cupo()
+        try:
+            conexion = self._tomar_conexion()
+        except Exception as e:
+            self._liberar_cupo()
+            logging.error(f"Error de conexión: {e}")
+            raise e
+
+        prestadas[clave] = [conexion, 1]
+        return conexion
+
+    def devolver(self, conexion, escritura=False):
+        """Checkin: devuelve la conexión prestada por obtener()"""
+        clave = "escritor" if escritura and self.wal else "pool"
+        prestadas = self._prestadas()
+        prestadas[clave][1] -= 1
+        if prestadas[clave][1] > 0:
+            return
+        del prestadas[clave]
+
+        if clave == "escritor":
+            conexion.rollback()
+            return
+
+        try:
+            if self.es_postgresql:
+                self._devolver_pg(conexion)
+            else:
+                conexion.rollback()
+        finally:
+            self._liberar_cupo()
+
+    @contextmanager
+    def conexion(self, escritura=False):
+        """Préstamo de una conexión durante un bloque with"""
+        conexion = self.obtener(escritura)
+        try:
+            yield conexion
+        finally:
+            self.devolver(conexion, escritura)
+
+    @contextmanager
+    def conexion_dedicada(self):
+        """
+        Conexión de lectura exclusiva para recorridos largos (exportaciones en streaming).
+        No queda asociada al hilo que la pidió, así que puede consumirse desde otros hilos;
+        en SQLite es una conexión propia que se cierra al terminar.
+        """
+        self._reservar_cupo()
+        try:
+            if self.es_postgresql or self.en_memoria:
+                conexion = self._tomar_conexion()
+            else:
+                conexion = sqlite3.connect(self.archivo_bd, check_same_thread=False, timeout=self.busy_timeout)
+                conexion.row_factory = sqlite3.Row
+                if self.wal:
+                    conexion.execute("PRAGMA query_only=ON")
+        except Exception as e:
+            self._liberar_cupo()
+            logging.error(f"Error de conexión: {e}")
+            raise e
+
+        try:
+            yield conexion
+        finally:
+            try:
+                if self.es_postgresql:
+                    self._devolver_pg(conexion)
+                elif not self.en_memoria:
+                    conexion.close()
+            finally:
+                self._liberar_cupo()
+
+    def estadisticas(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["max_conexiones"] = self.max_conexiones
+        stats["tiempo_espera_promedio"] = stats["tiempo_espera_total"] / stats["esperas"] if stats["esperas"] else 0.0
+        return stats
+
+    def cerrar(self):
+        if self._pool_pg is not None:
+            self._pool_pg.closeall()
+        with self._stats_lock:
+            for conexion in self._conexiones_sqlite:
+                conexion.close()
+            self._conexiones_sqlite.clear()
+
+
+class ConexionMedida:
+    """Conexión vista desde CursorMedido: mide los commits y delega todo lo demás"""
+    def __init__(self, conexion, metricas, metodo):
+        self._conexion = conexion
+        self._metricas = metricas
+        self._metodo = metodo
+
+    def commit(self):
+        inicio = time.perf_counter()
+        try:
+            self._conexion.commit()
+        finally:
+            self._metricas.observar_commit(self._metodo, time.perf_counter() - inicio)
+
+    def __getattr__(self, nombre):
+        return getattr(self._conexion, nombre)
+
+class CursorMedido:
+    """
+    Cursor que presta _get_cursor cuando el gestor tiene métricas o perfilador: cuenta las
+    filas leídas y mide los commits hechos con cur.connection.commit(). Con perfilador,
+    además mide cada sentencia (ejecución más lectura de sus filas) y se la informa al pasar
+    a la siguiente o al devolver el cursor. Lo demás va al cursor real.
+    """
+    def __init__(self, cursor, metodo, metricas=None, perfilador=None):
+        self._cursor = cursor
+        self._metodo = metodo
+        self._perfilador = perfilador
+        self.connection = ConexionMedida(cursor.connection, metricas, metodo) if metricas is not None else cursor.connection
+        self.filas = 0
+        self._sentencia = None  # [sql, parámetros, segundos, filas] de la última sentencia
+
+    def _ejecutar(self, funcion, sql, parametros, cantidad):
+        self.terminar()
+        inicio = time.perf_counter()
+        try:
+            resultado = funcion(sql, parametros) if parametros is not None else funcion(sql)
+        finally:
+            if self._perfilador is not None:
+                self._sentencia = [sql, cantidad, time.perf_counter() - inicio, 0]
+        return self if resultado is self._cursor else resultado
+
+    def execute(self, sql, parametros=None):
+        return self._ejecutar(self._cursor.execute, sql, parametros, len(parametros) if parametros else 0)
+
+    def executemany(self, sql, parametros):
+        parametros = list(parametros)
+        return self._ejecutar(self._cursor.executemany, sql, parametros, sum(len(p) for p in parametros))
+
+    def _leidas(self, cantidad, inicio):
+        self.filas += cantidad
+        if self._sentencia is not None:
+            self._sentencia[2] += time.perf_counter() - inicio
+            self._sentencia[3] += cantidad
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        fila = self._cursor.fetchone()
+        self._leidas(0 if fila is None else 1, inicio)
+        return fila
+
+    def fetchmany(self, *args, **kwargs):
+        inicio = time.perf_counter()
+        filas = self._cursor.fetchmany(*args, **kwargs)
+        self._leidas(len(filas), inicio)
+        return filas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        filas = self._cursor.fetchall()
+        self._leidas(len(filas), inicio)
+        return filas
+
+    def __iter__(self):
+        while True:
+            fila = self.fetchone()
+            if fila is None:
+                return
+            yield fila
+
+    def terminar(self):
+        """Informa al perfilador la sentencia en curso (si hay una)"""
+        sentencia, self._sentencia = self._sentencia, None
+        if sentencia is not None:
+            sql, parametros, segundos, filas = sentencia
+            if not filas and self._cursor.rowcount > 0:
+                filas = self._cursor.rowcount  # INSERT/UPDATE/DELETE: filas afectadas
+            self._perfilador.registrar(self._metodo, sql, parametros, segundos, filas)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+
+def _hashear_password(password):
+    return pwd_context.hash(password)
+
+def _verificar_password(password, password_hash):
+    return pwd_context.verify(password, password_hash)
+
+class ProcesadorHash(PoolProcesos):
+    """
+    Calcula y verifica hashes de contraseñas en un pool de procesos aparte.
+    El hashing es CPU puro y retiene el GIL: en procesos separados varios logins avanzan en
+    paralelo (uno por núcleo) sin frenar a los hilos que atienden el resto de las peticiones.
+    Con max_procesos=0 se calcula en el mismo hilo (app de escritorio, pruebas).
+    """
+    def __init__(self, max_procesos=None):
+        if max_procesos is None:
+            max_procesos = int(os.getenv("HASH_PROCESOS", str(os.cpu_count() or 1)))
+        super().__init__("hashing", max_procesos)
+
+    def hashear(self, password):
+        return self.ejecutar(_hashear_password, password)
+
+    def verificar(self, password, password_hash):
+        return self.ejecutar(_verificar_password, password, password_hash)
+
 class GestorGastos:
-    def __init__(self, finanzas_bd):
-        self.lock = threading.RLock()
+    # Totales precalculados por usuario que se mantienen en cada escritura: (tabla, columna clave)
+    TABLAS_RESUMEN = (("resumen_categoria", "categoria"), ("resumen_diario", "fecha"), ("resumen_mensual", "mes"))
+    # usuario_id con el que se acumulan en esas tablas los gastos sin usuario (app de escritorio);
+    # los ids de usuarios empiezan en 1
+    SIN_USUARIO = 0
+    # Columnas de un gasto que se devuelven (sin la de búsqueda, que en PostgreSQL es un tsvector)
+    COLUMNAS_GASTO = "id, monto, categoria, descripcion, fecha, usuario_id, categoria_clave"
+
+    def __init__(self, finanzas_bd, max_conexiones=None, modo_concurrencia=None, procesos_hash=None, cache=None,
+                 metricas=None, perfilador=None):
         self.archivo_bd = finanzas_bd
-        self.conexion = None
         self.es_postgresql = finanzas_bd.startswith("postgres://") or finanzas_bd.startswith("postgresql://")
         
         self.p = "%s" if self.es_postgresql else "?"
         self.serial_type = "SERIAL PRIMARY KEY" if self.es_postgresql else "INTEGER PRIMARY KEY AUTOINCREMENT"
         self.default_date = "CURRENT_TIMESTAMP" if self.es_postgresql else "CURRENT_TIMESTAMP"
         
-        self._conectar()
+        if max_conexiones is None:
+            max_conexiones = int(os.getenv("DB_POOL_MAX", "10"))
+        if modo_concurrencia is None:
+            modo_concurrencia = os.getenv("DB_MODO_CONCURRENCIA", "lectura_escritura")
+        # ':memory:' es distinto en cada conexión: una sola compartida, usada de a un hilo por vez
+        if finanzas_bd == ":memory:":
+            modo_concurrencia = "exclusivo"
+        self.concurrencia = ControlConcurrencia(modo_concurrencia)
+        usar_wal = modo_concurrencia == "lectura_escritura"
+        # Varios procesos sobre el mismo archivo SQLite: cada intento de tomar el lock espera
+        # hasta busy_timeout segundos y, si sigue ocupado, se reintenta reintentos_bloqueo veces
+        self.reintentos_bloqueo = int(os.getenv("SQLITE_REINTENTOS", "3"))
+        self.pool = PoolConexiones(finanzas_bd, self.es_postgresql, max_conexiones=max_conexiones,
+                                   timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")), wal=usar_wal,
+                                   busy_timeout=float(os.getenv("SQLITE_BUSY_TIMEOUT", "5")))
+        self.hashes = ProcesadorHash(procesos_hash)
+        # Caché opcional de lecturas (CacheResultados); None = siempre a la base de datos
+        self.cache = cache
+        # Receptor opcional de mediciones (metricas.MetricasGestor); None = sin medir nada
+        self.metricas = metricas
+        # Perfilador opcional de sentencias SQL (perfilador_sql.PerfiladorSQL); None = apagado
+        self.perfilador = perfilador
         self._inicializar_tablas()
 
-    def _conectar(self):
-        """Establece o recupera la conexión a la base de datos"""
-        with self.lock:
+    @contextmanager
+    def _get_cursor(self, escritura=False, metodo=None):
+        """
+        Presta una conexión del pool y entrega un cursor fresco sobre ella.
+        Con escritura=True toma además el lock de escritura (las escrituras se serializan)
+        y abre la transacción de escritura.
+        metodo: nombre del método del gestor que pide el cursor, con el que se etiquetan sus
+        métricas y sentencias perfiladas ("otro" si no se indica, p. ej. desde bench/ o pruebas).
+        """
+        if self.metricas is not None or self.perfilador is not None:
+            with self._cursor_medido(escritura, metodo or "otro") as cur:
+                yield cur
+            return
+        control = self.concurrencia.escritura() if escritura else self.concurrencia.lectura()
+        with control:
+            conexion = self.pool.obtener(escritura)
             try:
-                if self.es_postgresql:
-                    if self.conexion is None or self.conexion.closed != 0:
-                        self.conexion = psycopg2.connect(self.archivo_bd)
-                        print("[OK] Conexión PostgreSQL (Neon) restablecida.")
-                else:
-                    if self.conexion is None:
-                        self.conexion = sqlite3.connect(self.archivo_bd, check_same_thread=False)
-                        self.conexion.row_factory = sqlite3.Row
-                        print("[OK] Conexión SQLite establecida.")
-            except Exception as e:
-                logging.error(f"Error de conexión: {e}")
-                raise e
+                cur = conexion.cursor(cursor_factory=RealDictCursor) if self.es_postgresql else conexion.cursor()
+                try:
+                    if escritura:
+                        self._iniciar_escritura(cur)
+                    yield cur
+                finally:
+                    cur.close()
+            finally:
+                self.pool.devolver(conexion, escritura)
 
-    def _get_cursor(self):
-        """Retorna un cursor fresco y asegura que la conexión esté viva"""
-        self._conectar()
-        if self.es_postgresql:
-            # En Postgres, si hubo un error previo, hay que hacer rollback para limpiar el estado
+    @contextmanager
+    def _cursor_medido(self, escritura, metodo):
+        """
+        _get_cursor con métricas: espera por el lock (incluido el BEGIN IMMEDIATE de SQLite)
+        y por una conexión libre, tiempo con el cursor prestado, filas leídas y commits.
+        Con perfilador, cada sentencia ejecutada con el cursor.
+        """
+        inicio = time.perf_counter()
+        control = self.concurrencia.escritura() if escritura else self.concurrencia.lectura()
+        with control:
+            con_lock = time.perf_counter()
+            conexion = self.pool.obtener(escritura)
+            con_conexion = time.perf_counter()
             try:
-                self.conexion.rollback()
-            except:
-                pass
-            return self.conexion.cursor(cursor_factory=RealDictCursor)
-        return self.conexion.cursor()
+                cursor = conexion.cursor(cursor_factory=RealDictCursor) if self.es_postgresql else conexion.cursor()
+                cur = CursorMedido(cursor, metodo, self.metricas, self.perfilador)
+                listo = con_conexion
+                try:
+                    if escritura:
+                        self._iniciar_escritura(cur)
+                        listo = time.perf_counter()
+                    yield cur
+                finally:
+                    cur.terminar()
+                    cursor.close()
+                    fin = time.perf_counter()
+            finally:
+                self.pool.devolver(conexion, escritura)
+        if self.metricas is None:
+            return
+        tipo = "escritura" if escritura else "lectura"
+        self.metricas.observar_espera(f"lock_{tipo}", (con_lock - inicio) + (listo - con_conexion))
+        self.metricas.observar_espera("conexion", con_conexion - con_lock)
+        self.metricas.observar_consulta(metodo, escritura, fin - listo, cur.filas)
+
+    def estadisticas_pool(self):
+        return self.pool.estadisticas()
+
+    def estadisticas_concurrencia(self):
+        return self.concurrencia.estadisticas()
+
+    def estadisticas_cache(self):
+        return self.cache.estadisticas() if self.cache is not None else None
+
+    def _invalidar_cache(self, usuario_id=None):
+        """Tras el commit de una escritura: olvida lo cacheado del usuario (o todo, sin usuario)"""
+        if self.cache is None:
+            return
+        if usuario_id is None:
+            self.cache.limpiar()
+        else:
+            self.cache.invalidar_usuario(usuario_id)
+
+    def cerrar(self):
+        self.pool.cerrar()
+        self.hashes.cerrar()
+        if self.perfilador is not None:
+            self.perfilador.cerrar()
 
     def _inicializar_tablas(self):
-        with self.lock:
-            cur = self._get_cursor()
+        """
+        Aplica las migraciones de esquema pendientes.
+        En un arranque normal solo cuesta leer la versión guardada en schema_version.
+        """
+        with self._get_cursor(escritura=True, metodo="_inicializar_tablas") as cur:
+            if self._version_esquema(cur) >= self._migraciones()[-1][0]:
+                return
+            conexion = cur.connection
             try:
+                # Varios procesos pueden arrancar a la vez: solo uno migra, el resto espera
+                # (en SQLite, el BEGIN IMMEDIATE de _get_cursor; se repite si leer la versión
+                # de una base nueva terminó en rollback)
+                if self.es_postgresql:
+                    cur.execute("SELECT pg_advisory_xact_lock(7240110)")
+                else:
+                    self._iniciar_escritura(cur)
                 cur.execute(f"""
-                    CREATE TABLE IF NOT EXISTS usuarios (
-                        id {self.serial_type},
-                        nombre TEXT NOT NULL,
-                        email TEXT UNIQUE NOT NULL,
-                        password_hash TEXT NOT NULL,
-                        codigo_acceso TEXT UNIQUE,
-                        fecha_creacion TEXT DEFAULT {self.default_date},
-                        presupuesto REAL DEFAULT 5000.0
+                    CREATE TABLE IF NOT EXISTS schema_version (
+                        version INTEGER PRIMARY KEY,
+                        descripcion TEXT,
+                        fecha_aplicada TEXT DEFAULT {self.default_date}
                     )
                 """)
+                version = self._version_esquema(cur)
+                for numero, descripcion, migracion in self._migraciones():
+                    if numero <= version:
+                        continue
+                    migracion(cur)
+                    cur.execute(f"INSERT INTO schema_version (version, descripcion) VALUES ({self.p}, {self.p})", (numero, descripcion))
+                    print(f"[MIGRACIÓN] v{numero}: {descripcion}")
+                conexion.commit()
+            except Exception as e:
+                conexion.rollback()
+                logging.error(f"Error al migrar el esquema: {e}")
+                raise e
+
+    def _version_esquema(self, cur):
+        """Versión de esquema aplicada (0 si la base aún no tiene schema_version)"""
+        try:
+            cur.execute("SELECT MAX(version) AS version FROM schema_version")
+        except (sqlite3.OperationalError, psycopg2.errors.UndefinedTable):
+            cur.connection.rollback()
+            return 0
+        res = cur.fetchone()
+        version = res['version'] if self.es_postgresql else res[0]
+        return version or 0
+
+    def _migraciones(self):
+        """Migraciones del esquema en orden. Cada una se aplica una sola vez, todas en la misma transacción."""
+        return [
+            (1, "Tablas usuarios y gastos", self._migracion_tablas_base),
+            (2, "Columna codigo_acceso y PIN para usuarios sin código", self._migracion_codigo_acceso),
+            (3, "Índices por usuario en gastos y por código de acceso", self._migracion_indices_usuario),
+            (4, "Índice (usuario_id, fecha, id) para paginar por clave", self._migracion_indice_paginacion),
+            (5, "Columna categoria_clave normalizada e indexada", self._migracion_categoria_clave),
+            (6, "Tablas de totales por categoría, día y mes", self._migracion_resumenes),
+            (7, "Columna version_datos por usuario", self._migracion_version_datos),
+            (8, "Índice de búsqueda de texto en descripción y categoría", self._migracion_busqueda),
+            (9, "Columna fecha de gastos como DATE", self._migracion_fecha_date),
+            (10, "Totales precalculados de los gastos sin usuario", self._reconstruir_resumenes),
+            (11, "Sin el índice (usuario_id, categoria), reemplazado por el de categoria_clave", self._migracion_sin_indice_categoria),
+            (12, "Índices por fecha y por categoria_clave para las consultas sin usuario", self._migracion_indices_sin_usuario),
+        ]
+
+    def _columnas(self, cur, tabla):
+        if self.es_postgresql:
+            cur.execute("SELECT column_name FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = %s",
+                        (tabla,))
+            return {f['column_name'] for f in cur.fetchall()}
+        cur.execute(f"PRAGMA table_info({tabla})")
+        return {f[1] for f in cur.fetchall()}
+
+    def _migracion_tablas_base(self, cur):
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS usuarios (
+                id {self.serial_type},
+                nombre TEXT NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                codigo_acceso TEXT UNIQUE,
+                fecha_creacion TEXT DEFAULT {self.default_date},
+                presupuesto REAL DEFAULT 5000.0
+            )
+        """)
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS gastos (
+                id {self.serial_type},
+                monto REAL,
+                categoria TEXT,
+                descripcion TEXT,
+                fecha TEXT DEFAULT {self.default_date},
+                usuario_id INTEGER,
+                FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+            )
+        """)
+
+    def _migracion_codigo_acceso(self, cur):
+        # Bases anteriores a la columna (creada ya en la migración 1 para bases nuevas)
+        if "codigo_acceso" not in self._columnas(cur, "usuarios"):
+            cur.execute("ALTER TABLE usuarios ADD COLUMN codigo_acceso TEXT")
+        # PIN de 6 dígitos para todos los usuarios sin código, en un único UPDATE
+        if self.es_postgresql:
+            cur.execute("UPDATE usuarios SET codigo_acceso = lpad(floor(random() * 1000000)::int::text, 6, '0') WHERE codigo_acceso IS NULL")
+        else:
+            cur.execute("UPDATE usuarios SET codigo_acceso = printf('%06d', abs(random()) % 1000000) WHERE codigo_acceso IS NULL")
+
+    def _migracion_indices_usuario(self, cur):
+        # Listado por fecha, totales y agrupaciones por usuario
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_gastos_usuario_fecha ON gastos (usuario_id, fecha)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_gastos_usuario_categoria ON gastos (usuario_id, categoria)")
+        # Bases antiguas recibieron 'codigo_acceso' por ALTER TABLE, sin el índice del UNIQUE
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_usuarios_codigo_acceso ON usuarios (codigo_acceso)")
+
+    def _migracion_indice_paginacion(self, cur):
+        # El id desempata gastos del mismo día; sustituye al índice (usuario_id, fecha)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_gastos_usuario_fecha_id ON gastos (usuario_id, fecha, id)")
+        cur.execute("DROP INDEX IF EXISTS idx_gastos_usuario_fecha")
+
+    def _migracion_categoria_clave(self, cur):
+        if "categoria_clave" not in self._columnas(cur, "gastos"):
+            cur.execute("ALTER TABLE gastos ADD COLUMN categoria_clave TEXT")
+        if self.es_postgresql:
+            cur.execute("UPDATE gastos SET categoria_clave = lower(trim(categoria)) WHERE categoria_clave IS NULL")
+        else:
+            # lower() de SQLite solo entiende ASCII: usamos la misma normalización que al insertar
+            cur.connection.create_function("normalizar_categoria", 1, normalizar_categoria, deterministic=True)
+            cur.execute("UPDATE gastos SET categoria_clave = normalizar_categoria(categoria) WHERE categoria_clave IS NULL")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_gastos_usuario_categoria_clave ON gastos (usuario_id, categoria_clave, fecha, id)")
+
+    def _migracion_sin_indice_categoria(self, cur):
+        # Los filtros usan categoria_clave y las agrupaciones leen las tablas de resumen: ninguna
+        # consulta lo usaba y solo encarecía cada escritura
+        cur.execute("DROP INDEX IF EXISTS idx_gastos_usuario_categoria")
+
+    def _migracion_indices_sin_usuario(self, cur):
+        # La app de escritorio consulta sin usuario_id (rangos de fechas, categorías, exportar
+        # desde una fecha): sin estos índices cada una de esas consultas recorre toda la tabla
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_gastos_fecha_id ON gastos (fecha, id)")
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_gastos_categoria_clave ON gastos (categoria_clave, fecha, id)")
+
+    def _migracion_resumenes(self, cur):
+        # DOUBLE PRECISION en Postgres: su REAL es de 4 bytes y los totales acumulan error
+        tipo_total = "DOUBLE PRECISION" if self.es_postgresql else "REAL"
+        for tabla, columna in self.TABLAS_RESUMEN:
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {tabla} (
+                    usuario_id INTEGER NOT NULL,
+                    {columna} TEXT NOT NULL,
+                    total {tipo_total} NOT NULL DEFAULT 0,
+                    cantidad INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (usuario_id, {columna})
+                )
+            """)
+        self._reconstruir_resumenes(cur)
+
+    def _migracion_version_datos(self, cur):
+        if "version_datos" not in self._columnas(cur, "usuarios"):
+            cur.execute("ALTER TABLE usuarios ADD COLUMN version_datos INTEGER NOT NULL DEFAULT 0")
+
+    def _migracion_busqueda(self, cur):
+        if self.es_postgresql:
+            # Columna generada: PostgreSQL la recalcula sola en cada INSERT y UPDATE
+            vector = "setweight(to_tsvector('spanish', translate(lower(coalesce({0}, '')), '{1}', '{2}')), '{3}')"
+            if "busqueda" not in self._columnas(cur, "gastos"):
                 cur.execute(f"""
-                    CREATE TABLE IF NOT EXISTS gastos (
-                        id {self.serial_type},
-                        monto REAL,
-                        categoria TEXT,
-                        descripcion TEXT,
-                        fecha TEXT DEFAULT {self.default_date},
-                        usuario_id INTEGER,
-                        FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
-                    )
+                    ALTER TABLE gastos ADD COLUMN busqueda tsvector GENERATED ALWAYS AS (
+                        {vector.format("descripcion", ACENTOS, SIN_ACENTOS, "A")} ||
+                        {vector.format("categoria", ACENTOS, SIN_ACENTOS, "B")}
+                    ) STORED
                 """)
-                # 2. MIGRACIÓN: Asegurar que existe la columna 'codigo_acceso'
-                try:
-                    cur.execute("ALTER TABLE usuarios ADD COLUMN codigo_acceso TEXT")
-                    self.conexion.commit()
-                    print("[MIGRACIÓN] Columna 'codigo_acceso' añadida correctamente.")
-                except:
-                    if self.es_postgresql:
-                        self.conexion.rollback()
-                        # IMPORTANTE: Re-crear el cursor tras un rollback en Postgres
-                        cur.close()
-                        cur = self._get_cursor() # This line ensures the cursor is reset after a rollback in PostgreSQL
-                    pass 
-
-                # 3. MIGRACIÓN: Generar PIN para usuarios que no lo tengan
-                cur.execute("SELECT id FROM usuarios WHERE codigo_acceso IS NULL")
-
-                usuarios_sin_pin = cur.fetchall()
-                if usuarios_sin_pin:
-                    import random
-                    print(f"[MIGRACIÓN] Generando PIN para {len(usuarios_sin_pin)} usuarios...")
-                    for u in usuarios_sin_pin:
-                        u_id = u['id'] if self.es_postgresql else u[0]
-                        nuevo_pin = "".join([str(random.randint(0, 9)) for _ in range(6)])
-                        cur.execute(f"UPDATE usuarios SET codigo_acceso = {self.p} WHERE id = {self.p}", (nuevo_pin, u_id))
-                        self.conexion.commit()
-
-                self.conexion.commit()
-            finally:
-                cur.close()
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_gastos_busqueda ON gastos USING GIN (busqueda)")
+            return
+        # FTS5 sin contenido propio (content=''): solo el índice, los datos siguen en gastos.
+        # La columna usuario ('u<id>') deja que el filtro por usuario también lo resuelva el índice.
+        cur.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS gastos_fts USING fts5(
+                descripcion, categoria, usuario,
+                content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+        self._triggers_busqueda(cur)
+        # Una tabla FTS5 sin contenido no admite DELETE: se vacía con el comando 'delete-all'
+        cur.execute("INSERT INTO gastos_fts (gastos_fts) VALUES ('delete-all')")
+        cur.execute("INSERT INTO gastos_fts (rowid, descripcion, categoria, usuario) SELECT id, descripcion, categoria, 'u' || usuario_id FROM gastos")
+
+    def _triggers_busqueda(self, cur):
+        """Triggers que mantienen gastos_fts al día con cualquier escritura, también la de la app de escritorio"""
+        alta = "INSERT INTO gastos_fts (rowid, descripcion, categoria, usuario) VALUES (new.id, new.descripcion, new.categoria, 'u' || new.usuario_id);"
+        baja = ("INSERT INTO gastos_fts (gastos_fts, rowid, descripcion, categoria, usuario) "
+                "VALUES ('delete', old.id, old.descripcion, old.categoria, 'u' || old.usuario_id);")
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS gastos_fts_alta AFTER INSERT ON gastos BEGIN {alta} END")
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS gastos_fts_baja AFTER DELETE ON gastos BEGIN {baja} END")
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS gastos_fts_cambio AFTER UPDATE OF descripcion, categoria, usuario_id ON gastos
+            BEGIN {baja} {alta} END
+        """)
+
+    def _migracion_fecha_date(self, cur):
+        """
+        fecha pasa de TEXT (con CURRENT_TIMESTAMP como default, así que hay filas con hora) a DATE:
+        los filtros por rango comparan días y recorren solo ese tramo del índice (usuario_id, fecha, id).
+        """
+        corregidos = self._corregir_fechas_antiguas(cur)
+        if self.es_postgresql:
+            cur.execute("""
+                ALTER TABLE gastos ALTER COLUMN fecha DROP DEFAULT,
+                    ALTER COLUMN fecha TYPE DATE USING substr(fecha, 1, 10)::date,
+                    ALTER COLUMN fecha SET DEFAULT CURRENT_DATE,
+                    ALTER COLUMN fecha SET NOT NULL
+            """)
+        else:
+            self._rehacer_gastos_con_fecha_date(cur)
+        if corregidos:
+            # Los totales por día y mes se habían acumulado con las fechas viejas
+            self._reconstruir_resumenes(cur)
+            cur.execute("UPDATE usuarios SET version_datos = version_datos + 1")
+
+    def _rehacer_gastos_con_fecha_date(self, cur):
+        # SQLite no cambia el tipo de una columna: se rehace la tabla con los mismos ids.
+        # El CHECK asegura que toda fecha quede como 'AAAA-MM-DD' (las compara como texto).
+        cur.execute(f"""
+            CREATE TABLE gastos_nueva (
+                id {self.serial_type},
+                monto REAL,
+                categoria TEXT,
+                descripcion TEXT,
+                fecha DATE NOT NULL DEFAULT CURRENT_DATE CHECK (fecha IS date(fecha)),
+                usuario_id INTEGER,
+                categoria_clave TEXT,
+                FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+            )
+        """)
+        # El contador de AUTOINCREMENT se va con la tabla: sin copiarlo, se reusarían los ids de
+        # gastos borrados y un cursor de paginación o un ETag viejo apuntaría a otro gasto
+        cur.execute("SELECT seq FROM sqlite_sequence WHERE name = 'gastos'")
+        secuencia = cur.fetchone()
+        cur.execute(f"""
+            INSERT INTO gastos_nueva ({self.COLUMNAS_GASTO})
+            SELECT id, monto, categoria, descripcion, date(substr(fecha, 1, 10)), usuario_id, categoria_clave FROM gastos
+        """)
+        cur.execute("DROP TABLE gastos")
+        cur.execute("ALTER TABLE gastos_nueva RENAME TO gastos")
+        if secuencia is not None:
+            cur.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'gastos'", (secuencia[0],))
+        # Los índices y triggers se fueron con la tabla anterior (gastos_fts sigue válido: mismos ids)
+        self._migracion_indices_usuario(cur)
+        self._migracion_indice_paginacion(cur)
+        self._migracion_categoria_clave(cur)
+        self._triggers_busqueda(cur)
+
+    def _corregir_fechas_antiguas(self, cur):
+        """
+        Deja toda fecha con un día válido al comienzo para poder convertirla a DATE: las escritas
+        a mano en otro formato (31/01/2024) se reescriben y las vacías o ilegibles pasan a
+        FECHA_DESCONOCIDA, para que el arranque no falle por filas viejas de la app de escritorio.
+        Devuelve la cantidad de gastos modificados.
+        """
+        cur.execute("SELECT DISTINCT substr(fecha, 1, 10) AS dia FROM gastos")
+        dias_invalidos = []
+        for fila in cur.fetchall():
+            try:
+                normalizar_fecha(fila['dia'])
+            except (ValueError, TypeError):
+                dias_invalidos.append(fila['dia'])
+        corregidos = 0
+        for dia in dias_invalidos:
+            if dia is None:
+                cur.execute(f"UPDATE gastos SET fecha = {self.p} WHERE fecha IS NULL", (FECHA_DESCONOCIDA,))
+                corregidos += cur.rowcount
+                continue
+            cur.execute(f"SELECT DISTINCT fecha FROM gastos WHERE substr(fecha, 1, 10) = {self.p}", (dia,))
+            for valor in [fila['fecha'] for fila in cur.fetchall()]:
+                cur.execute(f"UPDATE gastos SET fecha = {self.p} WHERE fecha = {self.p}", (fecha_antigua(valor), valor))
+                corregidos += cur.rowcount
+        if corregidos:
+            desconocidos = self._contar_fecha(cur, FECHA_DESCONOCIDA)
+            print(f"[MIGRACIÓN] {corregidos} gastos con fecha inválida corregidos "
+                  f"({desconocidos} quedaron en {FECHA_DESCONOCIDA})")
+            logging.warning(f"Migración de fecha: {corregidos} gastos con fecha inválida corregidos, "
+                            f"{desconocidos} con {FECHA_DESCONOCIDA}")
+        return corregidos
+
+    def _contar_fecha(self, cur, fecha):
+        cur.execute(f"SELECT COUNT(*) AS cantidad FROM gastos WHERE fecha = {self.p}", (fecha,))
+        res = cur.fetchone()
+        return res['cantidad']
+
+    def _fecha_actual(self, cur):
+        """Fecha de hoy según la base de datos (la misma que usaba el DEFAULT CURRENT_DATE)"""
+        cur.execute("SELECT CURRENT_DATE AS hoy")
+        res = cur.fetchone()
+        return str(res['hoy'])
+
+    def _iniciar_escritura(self, cur):
+        """
+        Abre la transacción de escritura al prestar el cursor (_get_cursor(escritura=True)).
+        En SQLite, BEGIN IMMEDIATE toma el lock de escritura del archivo ya, también frente a
+        otros procesos (workers): nunca hay que "subir" de lectura a escritura a mitad de la
+        transacción. Si otro proceso lo retiene más que busy_timeout se reintenta con espera
+        exponencial antes de rendirse.
+        En PostgreSQL no hace falta: las filas se bloquean con SELECT ... FOR UPDATE.
+        """
+        if self.es_postgresql or cur.connection.in_transaction:
+            return
+        for intento in range(self.reintentos_bloqueo + 1):
+            try:
+                cur.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) or intento == self.reintentos_bloqueo:
+                    raise
+                self.concurrencia.contar_reintento()
+                espera = 0.05 * (2 ** intento) * (1 + random.random())
+                logging.warning(f"Base de datos bloqueada por otro proceso, reintento {intento + 1} en {espera:.2f}s")
+                time.sleep(espera)
+
+    def _acumular_resumenes(self, cur, usuario_id, movimientos):
+        """
+        Aplica a las tablas de resumen los movimientos (categoria, fecha, monto, cantidad) de una
+        escritura, dentro de su misma transacción. Las bajas van con monto y cantidad negativos.
+        """
+        if usuario_id is None:
+            usuario_id = self.SIN_USUARIO
+        deltas = {tabla: {} for tabla, _ in self.TABLAS_RESUMEN}
+        for categoria, fecha, monto, cantidad in movimientos:
+            dia = str(fecha)[:10]
+            # Igual que COALESCE(categoria, 'Sin categoría') al reconstruir: "" es una categoría aparte
+            categoria = "Sin categoría" if categoria is None else categoria
+            claves = {"resumen_categoria": categoria, "resumen_diario": dia, "resumen_mensual": dia[:7]}
+            for tabla, clave in claves.items():
+                total, n = deltas[tabla].get(clave, (0.0, 0))
+                deltas[tabla][clave] = (total + float(monto), n + cantidad)
+
+        for tabla, columna in self.TABLAS_RESUMEN:
+            filas = [(usuario_id, clave, total, n) for clave, (total, n) in deltas[tabla].items()]
+            cur.executemany(f"""
+                INSERT INTO {tabla} (usuario_id, {columna}, total, cantidad) VALUES ({self.p}, {self.p}, {self.p}, {self.p})
+                ON CONFLICT (usuario_id, {columna}) DO UPDATE
+                SET total = {tabla}.total + excluded.total, cantidad = {tabla}.cantidad + excluded.cantidad
+            """, filas)
+            if any(n < 0 for _, _, _, n in filas):
+                cur.execute(f"DELETE FROM {tabla} WHERE usuario_id = {self.p} AND cantidad <= 0", (usuario_id,))
+
+    def _incrementar_version(self, cur, usuario_id=None):
+        """
+        Marca que cambiaron los datos del usuario, dentro de la transacción de la escritura.
+        La versión solo crece: sirve para saber si lo que tiene un cliente sigue vigente.
+        """
+        if usuario_id is None:
+            return
+        cur.execute(f"UPDATE usuarios SET version_datos = version_datos + 1 WHERE id = {self.p}", (usuario_id,))
+
+    def _reconstruir_resumenes(self, cur, usuario_id=None):
+        """Recalcula las tablas de resumen desde gastos (de un usuario o de todos)"""
+        where, params = "", ()
+        if usuario_id is not None:
+            where, params = f" WHERE usuario_id = {self.p}", (usuario_id,)
+        for tabla, _ in self.TABLAS_RESUMEN:
+            cur.execute(f"DELETE FROM {tabla}{where}", params)
+        clave_usuario = f"COALESCE(usuario_id, {self.SIN_USUARIO})"
+        # En Postgres monto es REAL de 4 bytes: sumar como NUMERIC evita acumular su error de redondeo
+        suma = "SUM(CAST(monto AS NUMERIC))" if self.es_postgresql else "SUM(monto)"
+        cur.execute(f"""
+            INSERT INTO resumen_categoria (usuario_id, categoria, total, cantidad)
+            SELECT {clave_usuario}, COALESCE(categoria, 'Sin categoría'), {suma}, COUNT(*) FROM gastos{where}
+            GROUP BY {clave_usuario}, COALESCE(categoria, 'Sin categoría')
+        """, params)
+        cur.execute(f"""
+            INSERT INTO resumen_diario (usuario_id, fecha, total, cantidad)
+            SELECT {clave_usuario}, substr(CAST(fecha AS TEXT), 1, 10), {suma}, COUNT(*) FROM gastos{where}
+            GROUP BY {clave_usuario}, substr(CAST(fecha AS TEXT), 1, 10)
+        """, params)
+        cur.execute(f"""
+            INSERT INTO resumen_mensual (usuario_id, mes, total, cantidad)
+            SELECT {clave_usuario}, substr(CAST(fecha AS TEXT), 1, 7), {suma}, COUNT(*) FROM gastos{where}
+            GROUP BY {clave_usuario}, substr(CAST(fecha AS TEXT), 1, 7)
+        """, params)
+
+    def reconstruir_resumenes(self, usuario_id=None):
+        """Vuelve a calcular los totales precalculados a partir de los gastos guardados"""
+        with self._get_cursor(escritura=True, metodo="reconstruir_resumenes") as cur:
+            try:
+                self._reconstruir_resumenes(cur, usuario_id)
+                if usuario_id is None:
+                    cur.execute("UPDATE usuarios SET version_datos = version_datos + 1")
+                else:
+                    self._incrementar_version(cur, usuario_id)
+                cur.connection.commit()
+                self._invalidar_cache(usuario_id)
+                return True
+            except Exception as e:
+                cur.connection.rollback()
+                logging.error(f"Error al reconstruir resúmenes: {e}")
+                return False
 
     def registrar_usuario(self, nombre, email, password):
-        with self.lock:
-            cur = self._get_cursor()
+        # El hash se calcula antes de pedir conexión: no retiene el lock de escritura
+        try:
+            password_hash = self.hashes.hashear(password)
+        except Exception as e:
+            return (False, str(e))
+        with self._get_cursor(escritura=True, metodo="registrar_usuario") as cur:
             try:
                 import random
                 codigo = "".join([str(random.randint(0, 9)) for _ in range(6)])
-                password_hash = pwd_context.hash(password)
                 
                 cur.execute(f"INSERT INTO usuarios (nombre, email, password_hash, codigo_acceso) VALUES ({self.p}, {self.p}, {self.p}, {self.p}) RETURNING id" if self.es_postgresql else f"INSERT INTO usuarios (nombre, email, password_hash, codigo_acceso) VALUES (?, ?, ?, ?)", 
                             (nombre, email, password_hash, codigo))
                 
                 user_id = cur.fetchone()['id'] if self.es_postgresql else cur.lastrowid
-                self.conexion.commit()
+                cur.connection.commit()
                 return (True, user_id)
             except (sqlite3.IntegrityError, psycopg2.IntegrityError):
-                self.conexion.rollback()
+                cur.connection.rollback()
                 return (False, "El email ya está registrado")
             except Exception as e:
-                self.conexion.rollback()
+                cur.connection.rollback()
                 return (False, str(e))
-            finally:
-                cur.close()
+
+    def obtener_usuario_por_email(self, email):
+        """Fila completa del usuario (incluye password_hash) o None"""
+        with self._get_cursor(metodo="obtener_usuario_por_email") as cur:
+            cur.execute(f"SELECT * FROM usuarios WHERE email = {self.p}", (email,))
+            res = cur.fetchone()
+            return dict(res) if res else None
 
     def verificar_login(self, email, password):
-        with self.lock:
-            cur = self._get_cursor()
-            try:
-                cur.execute(f"SELECT * FROM usuarios WHERE email = {self.p}", (email,))
-                usuario = cur.fetchone()
-                if not usuario: return (False, "Usuario no encontrado")
-                
-                usuario_dict = dict(usuario)
-                if pwd_context.verify(password, usuario_dict['password_hash']):
-                    del usuario_dict['password_hash']
-                    return (True, usuario_dict)
-                return (False, "Contraseña incorrecta")
-            except Exception as e:
-                return (False, str(e))
-            finally:
-                cur.close()
+        # Dos pasos: leer la fila (conexión devuelta enseguida) y verificar el hash en el pool de procesos
+        try:
+            usuario_dict = self.obtener_usuario_por_email(email)
+            if not usuario_dict: return (False, "Usuario no encontrado")
+            
+            if self.hashes.verificar(password, usuario_dict['password_hash']):
+                del usuario_dict['password_hash']
+                return (True, usuario_dict)
+            return (False, "Contraseña incorrecta")
+        except Exception as e:
+            return (False, str(e))
 
     def obtener_usuario_por_id(self, user_id):
-        with self.lock:
-            cur = self._get_cursor()
-            try:
-                cur.execute(f"SELECT id, nombre, email, presupuesto, codigo_acceso FROM usuarios WHERE id = {self.p}", (user_id,))
-                res = cur.fetchone()
-                return dict(res) if res else None
-            finally:
-                cur.close()
+        with self._get_cursor(metodo="obtener_usuario_por_id") as cur:
+            cur.execute(f"SELECT id, nombre, email, presupuesto, codigo_acceso FROM usuarios WHERE id = {self.p}", (user_id,))
+            res = cur.fetchone()
+            return dict(res) if res else None
 
     def obtener_usuario_por_codigo(self, codigo):
-        with self.lock:
-            cur = self._get_cursor()
-            try:
-                cur.execute(f"SELECT id FROM usuarios WHERE codigo_acceso = {self.p}", (str(codigo),))
-                res = cur.fetchone()
-                if res:
-                    return res['id'] if self.es_postgresql else res[0]
-                return None
-            finally:
-                cur.close()
+        with self._get_cursor(metodo="obtener_usuario_por_codigo") as cur:
+            cur.execute(f"SELECT id FROM usuarios WHERE codigo_acceso = {self.p}", (str(codigo),))
+            res = cur.fetchone()
+            if res:
+                return res['id'] if self.es_postgresql else res[0]
+            return None
+
+    def _leer_presupuesto(self, cur, user_id):
+        cur.execute(f"SELECT presupuesto FROM usuarios WHERE id = {self.p}", (user_id,))
+        res = cur.fetchone()
+        if not res: return 5000.0
+        return float(res['presupuesto'] if self.es_postgresql else res[0])
+
+    def regenerar_codigo_acceso(self, user_id):
+        """Asigna al usuario un PIN nuevo de 6 dígitos y lo devuelve (None si el usuario no existe)"""
+        with self._get_cursor(escritura=True, metodo="regenerar_codigo_acceso") as cur:
+            for _ in range(5):
+                codigo = f"{secrets.randbelow(1000000):06d}"
+                try:
+                    cur.execute(f"UPDATE usuarios SET codigo_acceso = {self.p} WHERE id = {self.p}", (codigo, user_id))
+                    actualizados = cur.rowcount
+                    cur.connection.commit()
+                    return codigo if actualizados else None
+                except (sqlite3.IntegrityError, psycopg2.IntegrityError):
+                    # El PIN ya lo tiene otro usuario: probamos con otro
+                    cur.connection.rollback()
+            logging.error(f"No se pudo generar un código de acceso único para el usuario {user_id}")
+            return None
 
+    def obtener_version_datos(self, user_id):
+        """Versión actual de los datos del usuario (solo lee su fila en usuarios); None si no existe"""
+        with self._get_cursor(metodo="obtener_version_datos") as cur:
+            cur.execute(f"SELECT version_datos FROM usuarios WHERE id = {self.p}", (user_id,))
+            res = cur.fetchone()
+            if not res: return None
+            return res['version_datos'] if self.es_postgresql else res[0]
+
+    @cacheado
     def obtener_presupuesto_usuario(self, user_id):
-        with self.lock:
-            cur = self._get_cursor()
-            try:
-                cur.execute(f"SELECT presupuesto FROM usuarios WHERE id = {self.p}", (user_id,))
-                res = cur.fetchone()
-                if not res: return 5000.0
-                return float(res['presupuesto'] if self.es_postgresql else res[0])
-            finally:
-                cur.close()
+        with self._get_cursor(metodo="obtener_presupuesto_usuario") as cur:
+            return self._leer_presupuesto(cur, user_id)
 
     def actualizar_presupuesto_usuario(self, user_id, nuevo_limite):
-        with self.lock:
-            cur = self._get_cursor()
+        with self._get_cursor(escritura=True, metodo="actualizar_presupuesto_usuario") as cur:
             try:
-                cur.execute(f"UPDATE usuarios SET presupuesto = {self.p} WHERE id = {self.p}", (float(nuevo_limite), user_id))
-                self.conexion.commit()
+                cur.execute(f"UPDATE usuarios SET presupuesto = {self.p}, version_datos = version_datos + 1 WHERE id = {self.p}", (float(nuevo_limite), user_id))
+                cur.connection.commit()
+                self._invalidar_cache(user_id)
                 return True
             except:
-                self.conexion.rollback()
+                cur.connection.rollback()
                 return False
-            finally:
-                cur.close()
 
     def agregar_gasto(self, monto, categoria, descripcion, usuario_id):
-        with self.lock:
-            cur = self._get_cursor()
+        with self._get_cursor(escritura=True, metodo="agregar_gasto") as cur:
             try:
+                hoy = self._fecha_actual(cur)
                 cur.execute(f"""
-                    INSERT INTO gastos (monto, categoria, descripcion, usuario_id, fecha) 
-                    VALUES ({self.p}, {self.p}, {self.p}, {self.p}, CURRENT_DATE)
-                """, (monto, categoria, descripcion, usuario_id))
-                self.conexion.commit()
+                    INSERT INTO gastos (monto, categoria, categoria_clave, descripcion, usuario_id, fecha) 
+                    VALUES ({self.p}, {self.p}, {self.p}, {self.p}, {self.p}, {self.p})
+                """, (monto, categoria, normalizar_categoria(categoria), descripcion, usuario_id, hoy))
+                self._acumular_resumenes(cur, usuario_id, [(categoria, hoy, monto, 1)])
+                self._incrementar_version(cur, usuario_id)
+                cur.connection.commit()
+                self._invalidar_cache(usuario_id)
                 return True
             except Exception as e:
-                self.conexion.rollback()
+                cur.connection.rollback()
                 logging.error(f"Error al agregar gasto: {e}")
                 return False
+
+    def agregar_gastos_lote(self, gastos, usuario_id):
+        """
+        Inserta varios gastos (tuplas monto, categoria, descripcion) en una sola transacción:
+        executemany en SQLite y un INSERT multi-fila (execute_values) en PostgreSQL.
+        Es todo o nada: devuelve la cantidad insertada, o 0 si hubo un error.
+        """
+        if not gastos:
+            return 0
+        with self._get_cursor(escritura=True, metodo="agregar_gastos_lote") as cur:
+            try:
+                hoy = self._fecha_actual(cur)
+                filas = [(monto, categoria, normalizar_categoria(categoria), descripcion, usuario_id, hoy)
+                         for monto, categoria, descripcion in gastos]
+                if self.es_postgresql:
+                    execute_values(cur, """
+                        INSERT INTO gastos (monto, categoria, categoria_clave, descripcion, usuario_id, fecha)
+                        VALUES %s
+                    """, filas, page_size=1000)
+                else:
+                    cur.executemany("""
+                        INSERT INTO gastos (monto, categoria, categoria_clave, descripcion, usuario_id, fecha)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, filas)
+                self._acumular_resumenes(cur, usuario_id, [(categoria, hoy, monto, 1) for monto, categoria, _ in gastos])
+                self._incrementar_version(cur, usuario_id)
+                cur.connection.commit()
+                self._invalidar_cache(usuario_id)
+                return len(filas)
+            except Exception as e:
+                cur.connection.rollback()
+                logging.error(f"Error al agregar lote de gastos: {e}")
+                return 0
+
+    def _tabla_gastos(self, usuario_id=None, categorias=None):
+        """
+        Nombre de la tabla para el FROM. Con varias categorías SQLite prefiere recorrer todo el
+        historial del usuario por fecha para ahorrarse el ORDER BY; le indicamos el índice por
+        categoría para que el costo dependa solo de las filas que coinciden.
+        """
+        if categorias and usuario_id is not None and not self.es_postgresql:
+            return "gastos INDEXED BY idx_gastos_usuario_categoria_clave"
+        return "gastos"
+
+    def _condiciones_gastos(self, usuario_id=None, categorias=None, desde=None, hasta=None):
+        """
+        Arma el WHERE común de las consultas sobre gastos; devuelve (sql, params).
+        desde y hasta (incluidos) limitan el rango de fechas.
+        """
+        condiciones, params = [], []
+        if usuario_id is not None:
+            condiciones.append(f"usuario_id = {self.p}")
+            params.append(usuario_id)
+        if desde is not None:
+            condiciones.append(f"fecha >= {self.p}")
+            params.append(normalizar_fecha(desde))
+        if hasta is not None:
+            condiciones.append(f"fecha <= {self.p}")
+            params.append(normalizar_fecha(hasta))
+        if categorias:
+            claves = sorted({normalizar_categoria(c) for c in categorias})
+            condiciones.append(f"categoria_clave IN ({', '.join([self.p] * len(claves))})")
+            params.extend(claves)
+        return (" WHERE " + " AND ".join(condiciones) if condiciones else ""), params
+
+    def obtener_todos_los_gastos(self, usuario_id=None, categorias=None):
+        """
+        Gastos del usuario, del más reciente al más antiguo, opcionalmente solo de ciertas categorías
+        (sin distinguir mayúsculas). Sin usuario_id devuelve todos los de la base (app de escritorio).
+        """
+        where, params = self._condiciones_gastos(usuario_id, categorias)
+        with self._get_cursor(metodo="obtener_todos_los_gastos") as cur:
+            cur.execute(f"SELECT {self.COLUMNAS_GASTO} FROM {self._tabla_gastos(usuario_id, categorias)}{where} ORDER BY fecha DESC", params)
+            return [dict(f) for f in cur.fetchall()]
+
+    def obtener_todos_los_gastos_filtrados(self, fecha_inicio, fecha_fin, usuario_id=None, categorias=None):
+        """
+        Gastos entre fecha_inicio y fecha_fin ('AAAA-MM-DD', ambas incluidas), del más reciente
+        al más antiguo. Lee solo ese tramo del índice, no todo el historial.
+        Sin usuario_id devuelve los de toda la base (app de escritorio).
+        """
+        try:
+            where, params = self._condiciones_gastos(usuario_id, categorias, fecha_inicio, fecha_fin)
+        except ValueError as e:
+            logging.error(f"Rango de fechas inválido: {e}")
+            return []
+        with self._get_cursor(metodo="obtener_todos_los_gastos_filtrados") as cur:
+            cur.execute(f"SELECT {self.COLUMNAS_GASTO} FROM {self._tabla_gastos(usuario_id, categorias)}{where} ORDER BY fecha DESC, id DESC", params)
+            return [dict(f) for f in cur.fetchall()]
+
+    def obtener_gastos_paginados(self, usuario_id, limite=50, despues_de=None, categorias=None, desde=None, hasta=None):
+        """
+        Página de gastos ordenada por (fecha, id) descendente, paginando por clave.
+        despues_de es la clave (fecha, id) del último gasto de la página anterior.
+        desde y hasta (incluidos) limitan el rango de fechas.
+        Devuelve (gastos, clave_siguiente); clave_siguiente es None en la última página.
+        """
+        with self._get_cursor(metodo="obtener_gastos_paginados") as cur:
+            return self._leer_pagina(cur, usuario_id, limite, despues_de, categorias, desde, hasta)
+
+    def _leer_pagina(self, cur, usuario_id, limite, despues_de=None, categorias=None, desde=None, hasta=None):
+        where, params = self._condiciones_gastos(usuario_id, categorias, desde, hasta)
+        if despues_de is not None:
+            where += f" AND (fecha, id) < ({self.p}, {self.p})"
+            params.extend(despues_de)
+        params.append(limite + 1)
+        cur.execute(f"SELECT {self.COLUMNAS_GASTO} FROM {self._tabla_gastos(usuario_id, categorias)}{where} ORDER BY fecha DESC, id DESC LIMIT {self.p}", params)
+        gastos = [dict(f) for f in cur.fetchall()]
+        if len(gastos) <= limite:
+            return gastos, None
+        gastos = gastos[:limite]
+        return gastos, (gastos[-1]['fecha'], gastos[-1]['id'])
+
+    def buscar_gastos(self, texto, usuario_id=None, limite=100, desplazamiento=0):
+        """
+        Gastos cuya descripción o categoría contiene todas las palabras de texto, también como
+        comienzo de palabra ("rest" encuentra "Restaurante") y sin importar acentos ni mayúsculas.
+        Ordenados por relevancia (pesa más la descripción) y, a igual relevancia, los más nuevos.
+        Usa el índice de texto (FTS5 en SQLite, tsvector con GIN en PostgreSQL): el costo depende
+        de cuántos gastos coinciden, no del tamaño del historial. Sin palabras devuelve [].
+        Sin usuario_id busca en toda la base (app de escritorio).
+        """
+        terminos = terminos_busqueda(texto)
+        if not terminos:
+            return []
+        columnas = ", ".join(f"g.{c}" for c in self.COLUMNAS_GASTO.split(", "))
+        with self._get_cursor(metodo="buscar_gastos") as cur:
+            if self.es_postgresql:
+                consulta = " & ".join(f"{t}:*" for t in terminos)
+                where, params = "g.busqueda @@ q.consulta", [consulta]
+                if usuario_id is not None:
+                    where += " AND g.usuario_id = %s"
+                    params.append(usuario_id)
+                cur.execute(f"""
+                    SELECT {columnas} FROM gastos g,
+                        to_tsquery('spanish', translate(lower(%s), '{ACENTOS}', '{SIN_ACENTOS}')) AS q(consulta)
+                    WHERE {where}
+                    ORDER BY ts_rank(g.busqueda, q.consulta) DESC, g.id DESC LIMIT %s OFFSET %s
+                """, params + [limite, desplazamiento])
+            else:
+                # Cada palabra entre comillas (no se interpreta como operador) y con * de prefijo
+                consulta = " ".join(f'"{t}"*' for t in terminos)
+                if usuario_id is not None:
+                    consulta = f"usuario : u{int(usuario_id)} AND {{descripcion categoria}} : ({consulta})"
+                else:
+                    consulta = f"{{descripcion categoria}} : ({consulta})"
+                # Se ordena y recorta dentro del índice y solo la página se cruza con gastos
+                cur.execute(f"""
+                    SELECT {columnas} FROM (
+                        SELECT rowid, rank FROM gastos_fts
+                        WHERE gastos_fts MATCH ? AND rank MATCH 'bm25(10.0, 5.0, 0.0)'
+                        ORDER BY rank, rowid DESC LIMIT ? OFFSET ?
+                    ) AS r JOIN gastos g ON g.id = r.rowid
+                    ORDER BY r.rank, g.id DESC
+                """, (consulta, limite, desplazamiento))
+            return [dict(f) for f in cur.fetchall()]
+
+    def buscar_gastos_paginados(self, texto, usuario_id, limite=50, desplazamiento=0):
+        """Página de buscar_gastos; devuelve (gastos, desplazamiento_siguiente), None en la última"""
+        gastos = self.buscar_gastos(texto, usuario_id, limite + 1, desplazamiento)
+        if len(gastos) <= limite:
+            return gastos, None
+        return gastos[:limite], desplazamiento + limite
+
+    def _recorrer_gastos(self, usuario_id, columnas=None, desde=None, tamano_lote=1000, tuplas=False):
+        """
+        Generador de lotes (listas) de filas de gastos, más recientes primero, sin cargarlas
+        todas en memoria: cursor del lado del servidor en PostgreSQL y cursor iterado en SQLite.
+        Usa una conexión dedicada mientras dura el recorrido. Con tuplas=True las filas son
+        tuplas simples en lugar de diccionarios (más baratas para exportar).
+        """
+        where, params = self._condiciones_gastos(usuario_id, desde=desde)
+        with self.pool.conexion_dedicada() as conexion:
+            if self.es_postgresql:
+                cur = conexion.cursor(name=f"exportar_gastos_{usuario_id or 'todos'}",
+                                      cursor_factory=None if tuplas else RealDictCursor)
+                cur.itersize = tamano_lote
+            else:
+                cur = conexion.cursor()
+                if tuplas:
+                    cur.row_factory = None
+            try:
+                cur.execute(f"SELECT {columnas or self.COLUMNAS_GASTO} FROM gastos{where} ORDER BY fecha DESC, id DESC", params)
+                while True:
+                    filas = cur.fetchmany(tamano_lote)
+                    if not filas:
+                        break
+                    yield filas
             finally:
                 cur.close()
 
-    def obtener_todos_los_gastos(self, usuario_id):
-        with self.lock:
-            cur = self._get_cursor()
+    def iterar_gastos(self, usuario_id, tamano_lote=1000, desde=None):
+        """
+        Generador con los gastos del usuario (más recientes primero) que no los carga todos
+        en memoria, leyendo de a tamano_lote filas. Con usuario_id=None recorre los de toda
+        la base (app de escritorio); con desde ('AAAA-MM-DD') solo los de esa fecha en adelante.
+        """
+        for filas in self._recorrer_gastos(usuario_id, desde=desde, tamano_lote=tamano_lote):
+            for fila in filas:
+                yield dict(fila)
+
+    def contar_gastos(self, usuario_id=None, desde=None):
+        """Cantidad de gastos del usuario (o de toda la base), para informar el avance de una exportación"""
+        where, params = self._condiciones_gastos(usuario_id, desde=desde)
+        with self._get_cursor(metodo="contar_gastos") as cur:
+            cur.execute(f"SELECT COUNT(*) AS cantidad FROM gastos{where}", params)
+            res = cur.fetchone()
+            return res['cantidad'] if self.es_postgresql else res[0]
+
+    def obtener_historial_cierres(self, usuario_id=None):
+        """
+        Un cierre por cada mes anterior al actual, armado con los totales mensuales
+        precalculados: fecha_cierre ('AAAA-MM'), total_gastado, presupuesto_fijado y estado.
+        No se guarda el presupuesto de cada mes: se compara contra el vigente (sin usuario_id,
+        la suma de los de todos los usuarios).
+        """
+        with self._get_cursor(metodo="obtener_historial_cierres") as cur:
+            mes_actual = self._fecha_actual(cur)[:7]
+            if usuario_id is None:
+                cur.execute("SELECT SUM(presupuesto) AS presupuesto FROM usuarios")
+                res = cur.fetchone()
+                presupuesto = float((res['presupuesto'] if self.es_postgresql else res[0]) or 0)
+            else:
+                presupuesto = self._leer_presupuesto(cur, usuario_id)
+        cierres = []
+        for mes, total in self.obtener_gastos_por_mes(usuario_id).items():
+            if mes >= mes_actual:
+                continue
+            estado = "Excedido" if total > presupuesto else "Dentro del presupuesto"
+            cierres.append({"fecha_cierre": mes, "total_gastado": total,
+                            "presupuesto_fijado": presupuesto, "estado": estado})
+        return cierres
+
+    def exportar_a_excel_completo(self, ruta, usuario_id=None, progreso=None, tamano_lote=5000):
+        """
+        Libro de Excel con dos hojas: los gastos del mes actual y el historial de cierres
+        mensuales, del usuario o de toda la base (app de escritorio).
+        Usa el modo write-only de openpyxl: las filas se leen de a tamano_lote desde un cursor
+        y van directo al archivo, así la memoria no crece con la cantidad de gastos.
+        ruta: nombre de archivo o buffer binario. progreso(filas, total) se llama en cada lote;
+        si devuelve False la exportación se interrumpe.
+        Devuelve True si el libro quedó completo.
+        """
+        try:
+            with self._get_cursor(metodo="exportar_a_excel_completo") as cur:
+                desde = self._fecha_actual(cur)[:7] + "-01"
+            total = self.contar_gastos(usuario_id, desde)
+            libro = Workbook(write_only=True)
+            hoja = libro.create_sheet("Gastos del mes")
+            hoja.append(("ID", "Fecha", "Categoría", "Descripción", "Monto"))
+            filas = 0
+            lotes = self._recorrer_gastos(usuario_id, "id, fecha, categoria, descripcion, monto", desde,
+                                          tamano_lote, tuplas=True)
             try:
-                cur.execute(f"SELECT * FROM gastos WHERE usuario_id = {self.p} ORDER BY fecha DESC", (usuario_id,))
-                return [dict(f) for f in cur.fetchall()]
+                for lote in lotes:
+                    for fila in lote:
+                        hoja.append(fila)
+                    filas += len(lote)
+                    if progreso and progreso(filas, total) is False:
+                        hoja.close()  # libera el archivo temporal de la hoja
+                        return False
             finally:
-                cur.close()
+                lotes.close()
+
+            historial = libro.create_sheet("Historial de cierres")
+            historial.append(("Mes", "Total Gastado", "Presupuesto", "Estado"))
+            for cierre in self.obtener_historial_cierres(usuario_id):
+                historial.append((cierre['fecha_cierre'], cierre['total_gastado'], cierre['presupuesto_fijado'],
+                                  cierre['estado']))
+            libro.save(ruta)
+            if progreso:
+                progreso(filas, total)
+            return True
+        except Exception as e:
+            logging.error(f"Error al exportar a Excel: {e}")
+            return False
 
-    def eliminar_gasto(self, id_gasto, usuario_id):
-        with self.lock:
-            cur = self._get_cursor()
+    def _gasto_para_modificar(self, cur, id_gasto, usuario_id=None):
+        """Lee (y bloquea hasta el commit) el gasto que se va a modificar; None si no existe o es ajeno"""
+        condicion, params = f"id = {self.p}", [id_gasto]
+        if usuario_id is not None:
+            condicion += f" AND usuario_id = {self.p}"
+            params.append(usuario_id)
+        bloqueo = " FOR UPDATE" if self.es_postgresql else ""
+        cur.execute(f"SELECT monto, categoria, fecha, usuario_id FROM gastos WHERE {condicion}{bloqueo}", params)
+        return cur.fetchone()
+
+    def eliminar_gasto(self, id_gasto, usuario_id=None):
+        with self._get_cursor(escritura=True, metodo="eliminar_gasto") as cur:
             try:
-                cur.execute(f"DELETE FROM gastos WHERE id = {self.p} AND usuario_id = {self.p}", (id_gasto, usuario_id))
-                self.conexion.commit()
-                return cur.rowcount > 0
+                gasto = self._gasto_para_modificar(cur, id_gasto, usuario_id)
+                if not gasto:
+                    cur.connection.rollback()
+                    return False
+                cur.execute(f"DELETE FROM gastos WHERE id = {self.p}", (id_gasto,))
+                self._acumular_resumenes(cur, gasto['usuario_id'], [(gasto['categoria'], gasto['fecha'], -gasto['monto'], -1)])
+                self._incrementar_version(cur, gasto['usuario_id'])
+                cur.connection.commit()
+                self._invalidar_cache(gasto['usuario_id'])
+                return True
             except:
-                self.conexion.rollback()
+                cur.connection.rollback()
                 return False
-            finally:
-                cur.close()
 
-    def obtener_total_gastado(self, usuario_id):
-        with self.lock:
-            cur = self._get_cursor()
+    def actualizar_gasto(self, id_gasto, nuevo_monto, categoria, descripcion, fecha, usuario_id=None):
+        with self._get_cursor(escritura=True, metodo="actualizar_gasto") as cur:
             try:
-                cur.execute(f"SELECT SUM(monto) AS total FROM gastos WHERE usuario_id = {self.p}", (usuario_id,))
-                res = cur.fetchone()
-                if not res: return 0.0
-                val = res['total'] if self.es_postgresql else res[0]
-                return float(val) if val else 0.0
-            finally:
-                cur.close()
+                fecha = normalizar_fecha(fecha)
+                anterior = self._gasto_para_modificar(cur, id_gasto, usuario_id)
+                if not anterior:
+                    cur.connection.rollback()
+                    return False
+                cur.execute(f"""
+                    UPDATE gastos SET monto = {self.p}, categoria = {self.p}, categoria_clave = {self.p}, descripcion = {self.p}, fecha = {self.p}
+                    WHERE id = {self.p}
+                """, (float(nuevo_monto), categoria, normalizar_categoria(categoria), descripcion, fecha, id_gasto))
+                self._acumular_resumenes(cur, anterior['usuario_id'], [
+                    (anterior['categoria'], anterior['fecha'], -anterior['monto'], -1),
+                    (categoria, fecha, float(nuevo_monto), 1),
+                ])
+                self._incrementar_version(cur, anterior['usuario_id'])
+                cur.connection.commit()
+                self._invalidar_cache(anterior['usuario_id'])
+                return True
+            except Exception as e:
+                cur.connection.rollback()
+                logging.error(f"Error al actualizar gasto: {e}")
+                return False
 
+    @cacheado
+    def obtener_total_gastado(self, usuario_id):
+        with self._get_cursor(metodo="obtener_total_gastado") as cur:
+            cur.execute(f"SELECT SUM(total) AS total FROM resumen_categoria WHERE usuario_id = {self.p}", (usuario_id,))
+            res = cur.fetchone()
+            if not res: return 0.0
+            val = res['total'] if self.es_postgresql else res[0]
+            return float(val) if val else 0.0
+
+    def _leer_totales(self, cur, tabla, columna, usuario_id, desde=None, hasta=None):
+        """Totales precalculados de una tabla de resumen como {clave: total}, con la clave entre desde y hasta"""
+        where, params = f"usuario_id = {self.p}", [usuario_id]
+        if desde is not None:
+            where += f" AND {columna} >= {self.p}"
+            params.append(desde)
+        if hasta is not None:
+            where += f" AND {columna} <= {self.p}"
+            params.append(hasta)
+        cur.execute(f"SELECT {columna}, total FROM {tabla} WHERE {where} ORDER BY {columna} ASC", params)
+        resultados = cur.fetchall()
+        return {f[columna] if self.es_postgresql else f[0]: float(f['total'] if self.es_postgresql else f[1]) for f in resultados}
+
+    @cacheado
     def obtener_gastos_por_categoria(self, usuario_id):
-        with self.lock:
-            cur = self._get_cursor()
-            try:
-                cur.execute(f"SELECT categoria, SUM(monto) AS total FROM gastos WHERE usuario_id = {self.p} GROUP BY categoria", (usuario_id,))
-                resultados = cur.fetchall()
-                return {f['categoria'] if self.es_postgresql else f[0]: float(f['total'] if self.es_postgresql else f[1]) for f in resultados}
-            finally:
-                cur.close()
+        with self._get_cursor(metodo="obtener_gastos_por_categoria") as cur:
+            return self._leer_totales(cur, "resumen_categoria", "categoria", usuario_id)
+
+    @cacheado
+    def obtener_gastos_por_dia(self, usuario_id, desde=None, hasta=None):
+        """Total gastado por día ('AAAA-MM-DD'), opcionalmente solo entre desde y hasta (incluidos)"""
+        desde = normalizar_fecha(desde) if desde is not None else None
+        hasta = normalizar_fecha(hasta) if hasta is not None else None
+        with self._get_cursor(metodo="obtener_gastos_por_dia") as cur:
+            return self._leer_totales(cur, "resumen_diario", "fecha", usuario_id, desde, hasta)
+
+    def _totales_por_categoria_en_rango(self, cur, usuario_id, desde, hasta):
+        """Total por categoría de los gastos entre desde y hasta, sumados desde el tramo del índice"""
+        where, params = self._condiciones_gastos(usuario_id, desde=desde, hasta=hasta)
+        # Igual que al reconstruir los resúmenes: en Postgres se suma como NUMERIC
+        suma = "SUM(CAST(monto AS NUMERIC))" if self.es_postgresql else "SUM(monto)"
+        cur.execute(f"""
+            SELECT COALESCE(categoria, 'Sin categoría') AS categoria, {suma} AS total FROM gastos{where}
+            GROUP BY COALESCE(categoria, 'Sin categoría') ORDER BY 1
+        """, params)
+        return {f['categoria']: float(f['total']) for f in cur.fetchall()}
+
+    def obtener_gastos_por_rango(self, desde, hasta, usuario_id=None):
+        """Total por categoría de los gastos entre desde y hasta (incluidos); sin usuario_id, de toda la base"""
+        try:
+            desde, hasta = normalizar_fecha(desde), normalizar_fecha(hasta)
+        except ValueError as e:
+            logging.error(f"Rango de fechas inválido: {e}")
+            return {}
+        with self._get_cursor(metodo="obtener_gastos_por_rango") as cur:
+            return self._totales_por_categoria_en_rango(cur, usuario_id, desde, hasta)
+
+    @cacheado
+    def obtener_gastos_por_mes(self, usuario_id=None):
+        """Total gastado por mes ('AAAA-MM'); sin usuario_id suma todos los usuarios (app de escritorio)"""
+        with self._get_cursor(metodo="obtener_gastos_por_mes") as cur:
+            if usuario_id is None:
+                cur.execute("SELECT mes, SUM(total) AS total FROM resumen_mensual GROUP BY mes ORDER BY mes ASC")
+            else:
+                cur.execute(f"SELECT mes, total FROM resumen_mensual WHERE usuario_id = {self.p} ORDER BY mes ASC", (usuario_id,))
+            resultados = cur.fetchall()
+            return {f['mes'] if self.es_postgresql else f[0]: float(f['total'] if self.es_postgresql else f[1]) for f in resultados}
 
-    def obtener_gastos_por_dia(self, usuario_id):
-        with self.lock:
-            cur = self._get_cursor()
+    def _armar_resumen(self, presupuesto, por_cat):
+        total = sum(por_cat.values())
+        porcentaje = min(100, (total / presupuesto * 100)) if presupuesto > 0 else 0
+        
+        return {
+            "total_general": total,
+            "por_categoria": por_cat,
+            "presupuesto_limite": presupuesto,
+            "saldo_disponible": max(0, presupuesto - total),
+            "porcentaje_usado": porcentaje,
+            "nivel_alerta": 'peligro' if porcentaje >= 100 else ('advertencia' if porcentaje >= 80 else 'seguro'),
+            "balance_neto": presupuesto - total
+        }
+
+    @cacheado
+    def obtener_resumen(self, usuario_id, desde=None, hasta=None):
+        # Sin rango, totales precalculados: dos lecturas por clave sobre un mismo cursor.
+        # Con rango, los totales salen de los gastos de ese tramo de fechas.
+        with self._get_cursor(metodo="obtener_resumen") as cur:
+            presupuesto = self._leer_presupuesto(cur, usuario_id)
+            if desde is None and hasta is None:
+                por_cat = self._leer_totales(cur, "resumen_categoria", "categoria", usuario_id)
+            else:
+                por_cat = self._totales_por_categoria_en_rango(cur, usuario_id, desde, hasta)
+        return self._armar_resumen(presupuesto, por_cat)
+
+    def _iniciar_instantanea(self, cur):
+        """
+        Abre una transacción de solo lectura para que varias consultas vean los mismos datos.
+        PostgreSQL: REPEATABLE READ fija la instantánea en la primera consulta.
+        SQLite: dentro de un BEGIN la instantánea del WAL se mantiene hasta el final.
+        Devuelve False si la conexión ya estaba dentro de una transacción (llamada anidada).
+        """
+        if self.es_postgresql:
+            if cur.connection.status != psycopg2.extensions.STATUS_READY:
+                return False
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        else:
+            if cur.connection.in_transaction:
+                return False
+            cur.execute("BEGIN")
+        return True
+
+    def obtener_dashboard(self, usuario_id, limite=50, categorias=None):
+        """
+        Todo lo que muestra el panel en una sola pasada: primera página de gastos, resumen,
+        totales por categoría y por día. Se lee con un único préstamo de conexión (un solo
+        paso por el control de concurrencia) dentro de una misma transacción, así la tabla
+        y los gráficos no pueden mostrar estados distintos si otro proceso escribe en medio.
+        """
+        with self._get_cursor(metodo="obtener_dashboard") as cur:
+            propia = self._iniciar_instantanea(cur)
             try:
-                cur.execute(f"SELECT fecha, SUM(monto) AS total FROM gastos WHERE usuario_id = {self.p} GROUP BY fecha ORDER BY fecha ASC", (usuario_id,))
-                resultados = cur.fetchall()
-                return {f['fecha'] if self.es_postgresql else f[0]: float(f['total'] if self.es_postgresql else f[1]) for f in resultados}
+                gastos, siguiente = self._leer_pagina(cur, usuario_id, limite, categorias=categorias)
+                presupuesto = self._leer_presupuesto(cur, usuario_id)
+                por_cat = self._leer_totales(cur, "resumen_categoria", "categoria", usuario_id)
+                por_dia = self._leer_totales(cur, "resumen_diario", "fecha", usuario_id)
             finally:
-                cur.close()
-
-    def obtener_resumen(self, usuario_id):
-        # Este método llama a otros que ya tienen lock, pero por seguridad lo envolvemos también
-        with self.lock:
-            total = self.obtener_total_gastado(usuario_id)
-            presupuesto = self.obtener_presupuesto_usuario(usuario_id)
-            por_cat = self.obtener_gastos_por_categoria(usuario_id)
-            
-            porcentaje = min(100, (total / presupuesto * 100)) if presupuesto > 0 else 0
-            
-            return {
-                "total_general": total,
-                "por_categoria": por_cat,
-                "presupuesto_limite": presupuesto,
-                "saldo_disponible": max(0, presupuesto - total),
-                "porcentaje_usado": porcentaje,
-                "nivel_alerta": 'peligro' if porcentaje >= 100 else ('advertencia' if porcentaje >= 80 else 'seguro'),
-                "balance_neto": presupuesto - total
-            }
+                if propia:
+                    cur.connection.rollback()
+        return {
+            "gastos": gastos,
+            "siguiente": siguiente,
+            "resumen": self._armar_resumen(presupuesto, por_cat),
+            "por_dia": por_dia,
+        }
 
 # Mantenemos el nombre de la clase para no romper api_corregido.py
 class GestorConPresupuesto(GestorGastos):
-    def __init__(self, archivo):
-        super().__init__(archivo)
\ No newline at end of file
+    def __init__(self, archivo, **kwargs):
+        super().__init__(archivo, **kwargs)
+
+
+if __name__ == "__main__":
+    # Uso: python gestor_db.py reconstruir-resumenes [DATABASE_URL]
+    from dotenv import load_dotenv
+    load_dotenv()
+    if len(sys.argv) < 2 or sys.argv[1] != "reconstruir-resumenes":
+        print("Uso: python gestor_db.py reconstruir-resumenes [DATABASE_URL]")
+        sys.exit(1)
+    destino = sys.argv[2] if len(sys.argv) > 2 else os.getenv("DATABASE_URL", "FinanzasPro.db")
+    gestor = GestorGastos(destino)
+    exito = gestor.reconstruir_resumenes()
+    gestor.cerrar()
+    print("[OK] Resúmenes reconstruidos." if exito else "[ERROR] No se pudieron reconstruir los resúmenes.")
+    sys.exit(0 if exito else 1)
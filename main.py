@@ -365,15 +365,12 @@ def ver_historial():
                 entry_manual_fin.delete(0, tk.END)
                 entry_manual_fin.insert(0, f_fin)
 
-        # 2. Obtener datos base (por tiempo si existe)
+        # 2. Obtener datos (por tiempo si existe); la categoría la filtra la base de datos
+        categorias = None if categoria_seleccionada == "Todas" else [categoria_seleccionada]
         if f_ini and f_fin:
-            datos = mi_gestor.obtener_todos_los_gastos_filtrados(f_ini, f_fin)
+            datos = mi_gestor.obtener_todos_los_gastos_filtrados(f_ini, f_fin, categorias=categorias)
         else:
-            datos = mi_gestor.obtener_todos_los_gastos()
-
-        # 3. Filtrar por CAPA de categoría si no es "Todas"
-        if categoria_seleccionada != "Todas":
-            datos = [g for g in datos if str(g['categoria']).lower() == categoria_seleccionada.lower()]
+            datos = mi_gestor.obtener_todos_los_gastos(categorias=categorias)
 
         cargar_datos_en_tabla(datos)
 
@@ -815,8 +812,8 @@ def exporta_a_excel():
                 escritor = csv.writer(file)
                 escritor.writerow(["ID", "Monto", "Categoría", "Fecha", "Descripción"])
                 
-                # Convertimos cada diccionario a una lista simple de sus valores
-                datos_para_csv = [list(g.values()) for g in gastos]
+                # Las columnas del encabezado, en su orden (cada gasto trae además usuario_id y categoria_clave)
+                datos_para_csv = [[g["id"], g["monto"], g["categoria"], g["fecha"], g["descripcion"]] for g in gastos]
                 escritor.writerows(datos_para_csv)
             
             messagebox.showinfo("✓ Éxito", f"Archivo CSV guardado:\n{archivo_ruta}")
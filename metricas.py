@@ -0,0 +1,220 @@
+"""
+Métricas del servidor en el formato de texto de Prometheus (GET /metrics).
+
+RegistroMetricas guarda contadores e histogramas en memoria del proceso; registrar una
+observación es sumar en un diccionario bajo un lock, sin reservar memoria nueva salvo la
+primera vez que aparece una combinación de etiquetas. Con varios workers cada uno expone
+sus propios valores.
+
+- MiddlewareMetricas (ASGI): peticiones, latencia y tamaño de respuesta por ruta.
+- MetricasGestor: lo que GestorGastos informa de cada uso de la base de datos.
+"""
+import bisect
+import threading
+import time
+
+from starlette.routing import Match
+
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_BYTES = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+BUCKETS_FILAS = (0, 1, 10, 100, 1000, 10_000, 100_000)
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _etiquetas(nombres, valores, extra=""):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def sumar(self, *valores_etiquetas, cantidad=1):
+        with self._lock:
+            self._valores[valores_etiquetas] = self._valores.get(valores_etiquetas, 0) + cantidad
+
+    def muestras(self):
+        with self._lock:
+            valores = dict(self._valores)
+        for clave, valor in sorted(valores.items()):
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}"
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # etiquetas -> [conteo por bucket (no acumulado)..., +Inf, suma]
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *valores_etiquetas):
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(valores_etiquetas)
+            if serie is None:
+                serie = self._series[valores_etiquetas] = [0] * (len(self.buckets) + 1) + [0.0]
+            serie[indice] += 1
+            serie[-1] += valor
+
+    def muestras(self):
+        with self._lock:
+            series = {clave: list(serie) for clave, serie in self._series.items()}
+        for clave, serie in sorted(series.items()):
+            acumulado = 0
+            for limite, cantidad in zip(self.buckets + (float("inf"),), serie[:-1]):
+                acumulado += cantidad
+                le = f'le="{_numero(limite)}"'
+                yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {acumulado}"
+            yield f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(serie[-1])}"
+            yield f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {acumulado}"
+
+
+class Indicador:
+    """Valor que se lee al exponer (gauge): funcion() devuelve {tupla de etiquetas: valor}"""
+    tipo = "gauge"
+
+    def __init__(self, nombre, ayuda, etiquetas, funcion):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.funcion = funcion
+
+    def muestras(self):
+        for clave, valor in sorted(self.funcion().items()):
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}"
+
+
+class RegistroMetricas:
+    """Conjunto de métricas de un proceso. Pedir dos veces el mismo nombre devuelve la misma métrica."""
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, clase, nombre, *args):
+        with self._lock:
+            metrica = self._metricas.get(nombre)
+            if metrica is None:
+                metrica = self._metricas[nombre] = clase(nombre, *args)
+            elif not isinstance(metrica, clase):
+                raise ValueError(f"La métrica {nombre} ya existe con otro tipo")
+            return metrica
+
+    def contador(self, nombre, ayuda, etiquetas=()):
+        return self._registrar(Contador, nombre, ayuda, etiquetas)
+
+    def histograma(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_SEGUNDOS):
+        return self._registrar(Histograma, nombre, ayuda, etiquetas, buckets)
+
+    def indicador(self, nombre, ayuda, etiquetas, funcion):
+        indicador = self._registrar(Indicador, nombre, ayuda, etiquetas, funcion)
+        indicador.funcion = funcion  # un gestor nuevo (otro worker, reinicio) reemplaza al anterior
+        return indicador
+
+    def exponer(self):
+        """Todas las métricas en el formato de texto de Prometheus (version 0.0.4)"""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        lineas = []
+        for metrica in metricas:
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            lineas.extend(metrica.muestras())
+        return "\n".join(lineas) + "\n"
+
+
+class MetricasGestor:
+    """
+    Receptor de las mediciones de GestorGastos (parámetro metricas=). Por cada préstamo de
+    cursor: método que lo pidió, duración, filas leídas; además la espera por el lock de
+    escritura y por una conexión libre, y la duración de los commits.
+    """
+    def __init__(self, registro):
+        self.consultas = registro.histograma(
+            "finanzas_bd_consulta_segundos", "Tiempo con el cursor prestado, por método de GestorGastos",
+            ("metodo", "tipo"))
+        self.filas = registro.histograma(
+            "finanzas_bd_consulta_filas", "Filas leídas por método de GestorGastos", ("metodo",), BUCKETS_FILAS)
+        self.esperas = registro.histograma(
+            "finanzas_bd_espera_segundos", "Espera antes de poder usar la base (lock de escritura o conexión libre)",
+            ("motivo",))
+        self.commits = registro.histograma(
+            "finanzas_bd_commit_segundos", "Duración de los commits", ("metodo",))
+
+    def observar_consulta(self, metodo, escritura, segundos, filas):
+        self.consultas.observar(segundos, metodo, "escritura" if escritura else "lectura")
+        self.filas.observar(filas, metodo)
+
+    def observar_espera(self, motivo, segundos):
+        self.esperas.observar(segundos, motivo)
+
+    def observar_commit(self, metodo, segundos):
+        self.commits.observar(segundos, metodo)
+
+
+def plantilla_ruta(scope):
+    """Ruta declarada (p. ej. /gastos/{gasto_id}) de la petición, para no crear una serie por id"""
+    ruta = scope.get("route")
+    if ruta is None:
+        for candidata in getattr(scope.get("app"), "routes", ()):
+            if candidata.matches(scope)[0] == Match.FULL:
+                ruta = candidata
+                break
+    return getattr(ruta, "path", None) or "sin_ruta"
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI: cantidad de peticiones, latencia y bytes de respuesta por método y ruta"""
+    def __init__(self, app, registro):
+        self.app = app
+        self.peticiones = registro.contador(
+            "finanzas_http_peticiones_total", "Peticiones atendidas", ("metodo", "ruta", "estado"))
+        self.latencia = registro.histograma(
+            "finanzas_http_duracion_segundos", "Tiempo hasta terminar de enviar la respuesta", ("metodo", "ruta"))
+        self.tamano = registro.histograma(
+            "finanzas_http_respuesta_bytes", "Tamaño del cuerpo de la respuesta", ("metodo", "ruta"), BUCKETS_BYTES)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        estado = 500
+        enviados = 0
+
+        async def enviar(mensaje):
+            nonlocal estado, enviados
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            elif mensaje["type"] == "http.response.body":
+                enviados += len(mensaje.get("body", b""))
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            metodo, ruta = scope["method"], plantilla_ruta(scope)
+            self.peticiones.sumar(metodo, ruta, str(estado))
+            self.latencia.observar(time.perf_counter() - inicio, metodo, ruta)
+            self.tamano.observar(enviados, metodo, ruta)
@@ -0,0 +1,107 @@
+"""
+Perfilador de sentencias SQL de GestorGastos (modo opcional, parámetro perfilador=).
+
+Por cada sentencia ejecutada con un cursor de _get_cursor se anota la plantilla SQL, el
+método del gestor que la lanzó, la cantidad de parámetros, el tiempo (ejecución y lectura
+de filas) y las filas. Las que superan el umbral van a un archivo propio con rotación, y
+en memoria se acumula por (método, plantilla) para ver qué sentencias cuestan más.
+"""
+import logging
+import re
+import threading
+from logging.handlers import RotatingFileHandler
+
+_LITERAL_TEXTO = re.compile(r"'(?:[^']|'')*'")
+_LITERAL_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_ESPACIOS = re.compile(r"\s+")
+_LISTA_MARCADORES = re.compile(r"(\?|%s)(?:\s*,\s*(?:\?|%s))+")
+_TUPLAS_REPETIDAS = re.compile(r"(\([^()]*\))(?:\s*,\s*\1)+")
+
+
+def plantilla_sql(sql):
+    """
+    Forma normalizada de una sentencia para agrupar las que son la misma consulta:
+    literales reemplazados por ?, espacios colapsados y listas de marcadores de largo
+    variable (IN (?, ?, ?), VALUES (...), (...)) reducidas a una sola entrada con "...".
+    """
+    if isinstance(sql, bytes):
+        sql = sql.decode("utf-8", errors="replace")
+    sql = _LITERAL_TEXTO.sub("?", sql)
+    sql = _LITERAL_NUMERO.sub("?", sql)
+    sql = _ESPACIOS.sub(" ", sql).strip()
+    sql = _LISTA_MARCADORES.sub(r"\1, ...", sql)
+    return _TUPLAS_REPETIDAS.sub(r"\1, ...", sql)
+
+
+class PerfiladorSQL:
+    """
+    umbral: segundos a partir de los cuales una sentencia se escribe en el archivo.
+    max_plantillas: límite de (método, plantilla) distintos que se acumulan en memoria;
+    al llenarse se descarta la de menor tiempo total.
+    """
+    ORDENES = ("tiempo_total", "tiempo_max", "tiempo_promedio", "ejecuciones", "filas")
+
+    def __init__(self, umbral=0.1, archivo="consultas_lentas.log", max_bytes=5 * 1024 * 1024, copias=3,
+                 max_plantillas=1000):
+        self.umbral = umbral
+        self.archivo = archivo
+        self.max_plantillas = max_plantillas
+        self._sentencias = {}  # (metodo, plantilla) -> acumulados
+        self._lentas = 0
+        self._lock = threading.Lock()
+        # Logger propio (fuera del árbol de logging) para no mezclarse con el log de la app
+        self._log = logging.Logger("consultas_lentas")
+        self._handler = None
+        if archivo:
+            self._handler = RotatingFileHandler(archivo, maxBytes=max_bytes, backupCount=copias, encoding="utf-8")
+            self._handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self._log.addHandler(self._handler)
+
+    def registrar(self, metodo, sql, parametros, segundos, filas):
+        plantilla = plantilla_sql(sql)
+        lenta = segundos >= self.umbral
+        with self._lock:
+            clave = (metodo, plantilla)
+            datos = self._sentencias.get(clave)
+            if datos is None:
+                if len(self._sentencias) >= self.max_plantillas:
+                    del self._sentencias[min(self._sentencias, key=lambda c: self._sentencias[c]["tiempo_total"])]
+                datos = self._sentencias[clave] = {"ejecuciones": 0, "lentas": 0, "tiempo_total": 0.0,
+                                                   "tiempo_max": 0.0, "filas": 0, "parametros": parametros}
+            datos["ejecuciones"] += 1
+            datos["tiempo_total"] += segundos
+            datos["tiempo_max"] = max(datos["tiempo_max"], segundos)
+            datos["filas"] += filas
+            datos["parametros"] = parametros
+            if lenta:
+                datos["lentas"] += 1
+                self._lentas += 1
+        if lenta:
+            self._log.warning(f"{segundos * 1000:.1f} ms | {metodo} | filas={filas} | parametros={parametros} | {plantilla}")
+
+    def top(self, limite=20, orden="tiempo_total"):
+        """Las sentencias más costosas según `orden` (uno de ORDENES)"""
+        if orden not in self.ORDENES:
+            raise ValueError(f"Orden desconocido: {orden}")
+        with self._lock:
+            filas = [dict(datos, metodo=metodo, sql=plantilla) for (metodo, plantilla), datos in self._sentencias.items()]
+        for fila in filas:
+            fila["tiempo_promedio"] = fila["tiempo_total"] / fila["ejecuciones"]
+        filas.sort(key=lambda f: f[orden], reverse=True)
+        return filas[:limite]
+
+    def estadisticas(self):
+        with self._lock:
+            return {"umbral": self.umbral, "archivo": self.archivo, "plantillas": len(self._sentencias),
+                    "lentas": self._lentas}
+
+    def reiniciar(self):
+        with self._lock:
+            self._sentencias.clear()
+            self._lentas = 0
+
+    def cerrar(self):
+        if self._handler is not None:
+            self._log.removeHandler(self._handler)
+            self._handler.close()
+            self._handler = None
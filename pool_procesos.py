@@ -0,0 +1,58 @@
+"""
+Pool de procesos para trabajo CPU puro (hashing de contraseñas, armado de reportes PDF).
+
+En el proceso de la API ese trabajo retendría el GIL que necesitan los hilos que atienden
+peticiones; en procesos aparte avanza en paralelo, uno por núcleo.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class PoolProcesos:
+    """
+    ProcessPoolExecutor creado en el primer uso. Si un proceso muere, el pool se descarta
+    (se recrea en el próximo uso) y esa tarea se resuelve en el hilo que la pidió.
+    Con max_procesos=0 todo corre en el mismo hilo (app de escritorio, pruebas).
+    """
+    def __init__(self, nombre, max_procesos):
+        self.nombre = nombre
+        self.max_procesos = max_procesos
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _obtener_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # 'spawn': un fork copiaría las conexiones abiertas y los locks tomados por otros hilos
+                self._executor = ProcessPoolExecutor(max_workers=self.max_procesos,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def ejecutar(self, funcion, *args):
+        """funcion(*args) en un proceso del pool; funcion y args tienen que poder serializarse"""
+        if self.max_procesos <= 0:
+            return funcion(*args)
+        executor = self._obtener_executor()
+        try:
+            return executor.submit(funcion, *args).result()
+        except BrokenProcessPool as e:
+            logging.error(f"Pool de procesos '{self.nombre}' caído, se recrea: {e}")
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False)
+            return funcion(*args)
+
+    @property
+    def activo(self):
+        """Si hay procesos levantados"""
+        return self._executor is not None
+
+    def cerrar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
@@ -0,0 +1,169 @@
+"""
+Reporte ejecutivo en PDF, armado en memoria (nunca se escribe en disco).
+
+El detalle de gastos se dibuja página por página directamente sobre el canvas: cada página
+es una tabla chica que se descarta al pasar a la siguiente. Así la memoria del armado no
+crece con el historial (un único Table con todas las filas vive entero en memoria y partirlo
+en páginas cuesta cada vez más).
+
+GeneradorReportes arma los PDF en un pool de procesos aparte: es CPU puro y, en el proceso
+de la API, retendría el GIL que necesitan los hilos que atienden peticiones. Los gastos no
+viajan desde la API: el proceso que arma el reporte los lee de la base de a lotes (con su
+propio gestor) a medida que llena las páginas, así ni la API ni el proceso los tienen todos
+en memoria.
+"""
+import io
+import os
+from datetime import datetime
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Paragraph, Table, TableStyle
+
+from gestor_db import GestorGastos
+from pool_procesos import PoolProcesos
+
+MARGEN = 50
+ALTO_FILA = 14
+ANCHOS_DETALLE = [80, 110, 230, 80]
+MAX_CATEGORIA = 20
+MAX_DESCRIPCION = 48
+# Gastos leídos de la base por vez mientras se arma el detalle
+LOTE_FILAS = 1000
+
+ESTILO_RESUMEN = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.purple),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+ESTILO_DETALLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('FONTSIZE', (0, 0), (-1, -1), 9),
+    ('ALIGN', (3, 0), (3, -1), 'RIGHT')
+])
+
+
+def fila_reporte(gasto):
+    """Fila compacta (fecha, categoría, descripción, monto) de un gasto, para pasarla entre procesos"""
+    return (str(gasto['fecha'])[:10], gasto['categoria'], gasto['descripcion'] or "", float(gasto['monto']))
+
+
+def _recortar(texto, largo):
+    return texto if len(texto) <= largo else texto[:largo - 1] + "…"
+
+
+def _dibujar(c, flowable, x, y):
+    """Dibuja un flowable con su borde superior en y; devuelve la y donde terminó"""
+    _, alto = flowable.wrapOn(c, letter[0] - 2 * MARGEN, y)
+    flowable.drawOn(c, x, y - alto)
+    return y - alto
+
+
+def _pie(c, pagina):
+    c.setFont("Helvetica", 8)
+    c.drawRightString(letter[0] - MARGEN, MARGEN / 2, f"Página {pagina}")
+
+
+def armar_reporte_pdf(usuario, resumen, filas, fecha=None):
+    """
+    PDF (bytes) con el resumen y el detalle completo de `filas` (iterable de fila_reporte),
+    tantas páginas como hagan falta.
+    """
+    fecha = fecha or datetime.now().strftime('%d/%m/%Y')
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter, pageCompression=1)
+    c.setTitle("Reporte Ejecutivo de Gastos - FinanzasPro")
+    styles = getSampleStyleSheet()
+    _, alto = letter
+
+    # Encabezado y resumen, solo en la primera página
+    y = alto - MARGEN
+    y = _dibujar(c, Paragraph("Reporte Ejecutivo de Gastos - FinanzasPro", styles['Title']), MARGEN, y)
+    y = _dibujar(c, Paragraph(f"Usuario: {usuario['nombre']} | Fecha: {fecha}", styles['Normal']), MARGEN, y) - 20
+    y = _dibujar(c, Paragraph("Resumen Financiero", styles['Heading2']), MARGEN, y)
+    t_resumen = Table([
+        ["Concepto", "Valor"],
+        ["Total Gastado", f"${resumen['total_general']:,.2f}"],
+        ["Presupuesto Mensual", f"${resumen['presupuesto_limite']:,.2f}"],
+        ["Saldo Disponible", f"${resumen['saldo_disponible']:,.2f}"],
+        ["Nivel de Alerta", resumen['nivel_alerta'].upper()]
+    ], colWidths=[200, 100])
+    t_resumen.setStyle(ESTILO_RESUMEN)
+    y = _dibujar(c, t_resumen, MARGEN, y) - 20
+    y = _dibujar(c, Paragraph("Desglose de Gastos", styles['Heading2']), MARGEN, y)
+
+    # Detalle: se llena cada página con las filas que entran y se la cierra
+    encabezado = ["Fecha", "Categoría", "Descripción", "Monto"]
+    pagina, lote = 1, []
+    capacidad = int((y - MARGEN) // ALTO_FILA) - 1
+
+    def cerrar_pagina():
+        nonlocal y, pagina, capacidad
+        tabla = Table([encabezado] + lote, colWidths=ANCHOS_DETALLE, rowHeights=ALTO_FILA)
+        tabla.setStyle(ESTILO_DETALLE)
+        _dibujar(c, tabla, MARGEN, y)
+        _pie(c, pagina)
+        c.showPage()
+        pagina += 1
+        y = alto - MARGEN
+        capacidad = int((y - MARGEN) // ALTO_FILA) - 1
+        lote.clear()
+
+    for fecha_gasto, categoria, descripcion, monto in filas:
+        lote.append([fecha_gasto, _recortar(categoria, MAX_CATEGORIA), _recortar(descripcion, MAX_DESCRIPCION),
+                     f"${monto:,.2f}"])
+        if len(lote) == capacidad:
+            cerrar_pagina()
+    if lote or pagina == 1:
+        if not lote:
+            lote.append(["", "Sin gastos registrados", "", ""])
+        cerrar_pagina()
+    c.save()
+    return buffer.getvalue()
+
+
+# Gestor de solo lectura de este proceso por base de datos, creado en el primer reporte
+_gestores = {}
+
+
+def _gestor_del_proceso(finanzas_bd):
+    gestor = _gestores.get(finanzas_bd)
+    if gestor is None:
+        gestor = _gestores[finanzas_bd] = GestorGastos(finanzas_bd, max_conexiones=1, procesos_hash=0)
+    return gestor
+
+
+def filas_de_usuario(finanzas_bd, usuario_id, tamano_lote=LOTE_FILAS):
+    """Filas del reporte (fila_reporte) de todos los gastos del usuario, leídas de a tamano_lote"""
+    for gasto in _gestor_del_proceso(finanzas_bd).iterar_gastos(usuario_id, tamano_lote):
+        yield fila_reporte(gasto)
+
+
+def armar_reporte_usuario(finanzas_bd, usuario_id, usuario, resumen, tamano_lote=LOTE_FILAS):
+    """armar_reporte_pdf con los gastos del usuario leídos de a lotes de finanzas_bd"""
+    return armar_reporte_pdf(usuario, resumen, filas_de_usuario(finanzas_bd, usuario_id, tamano_lote))
+
+
+class GeneradorReportes(PoolProcesos):
+    """
+    Arma reportes PDF en un pool de procesos aparte, como ProcesadorHash con las contraseñas.
+    Con max_procesos=0 se arman en el mismo hilo (pruebas).
+    """
+    def __init__(self, max_procesos=None):
+        if max_procesos is None:
+            max_procesos = int(os.getenv("PDF_PROCESOS", "2"))
+        super().__init__("reportes", max_procesos)
+
+    def generar(self, finanzas_bd, usuario_id, usuario, resumen):
+        """PDF (bytes) del reporte con todos los gastos del usuario, que se leen de finanzas_bd"""
+        return self.ejecutar(armar_reporte_usuario, finanzas_bd, usuario_id, usuario, resumen)
+
+    def cerrar(self):
+        super().cerrar()
+        # Con max_procesos=0 los gestores de lectura se abrieron en este proceso
+        while _gestores:
+            _gestores.popitem()[1].cerrar()
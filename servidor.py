@@ -0,0 +1,45 @@
+"""
+Arranque de la API con uno o varios procesos (workers).
+
+Uso: python servidor.py [--host 0.0.0.0] [--port 8000] [--workers N]
+Por defecto toma PORT y WEB_CONCURRENCY del entorno.
+
+Con varios workers se hace lo mismo que `uvicorn --workers` (uvicorn 0.40), más un ajuste:
+el socket que abre uvicorn queda con proto=0, asyncio entonces no activa TCP_NODELAY en
+las conexiones aceptadas y cada respuesta en una conexión keep-alive espera ~40 ms al ACK
+retrasado del cliente. Aquí se activa TCP_NODELAY en el socket de escucha, que las
+conexiones aceptadas heredan.
+"""
+import argparse
+import os
+import socket
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de FinanzasPro")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    if args.workers > 1 and os.getenv("EXPORTACIONES") == "1":
+        parser.error("las exportaciones en segundo plano (EXPORTACIONES=1) necesitan un único worker")
+
+    # La API reparte cachés y pools de hashing según la cantidad de workers
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    config = uvicorn.Config("api_corregido:app", host=args.host, port=args.port,
+                            workers=args.workers, log_level=args.log_level)
+    servidor = uvicorn.Server(config)
+    if args.workers <= 1:
+        servidor.run()
+        return
+    sock = config.bind_socket()
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    Multiprocess(config, target=servidor.run, sockets=[sock]).run()
+
+
+if __name__ == "__main__":
+    main()
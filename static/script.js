@@ -139,22 +139,72 @@ async function editarPresupuesto() {
     }
 }
 
+// Cursor de la siguiente página de gastos (null cuando ya no hay más)
+let siguienteCursor = null;
+// Texto de la búsqueda en curso (null = se muestran los gastos por fecha)
+let busquedaActual = null;
+
+function construirUrlGastos(cursor = null, ruta = '/gastos') {
+    const filtroInput = document.getElementById('filtro-categoria')?.value;
+    const params = new URLSearchParams();
+
+    if (busquedaActual !== null && ruta === '/gastos') {
+        // Mientras hay una búsqueda, las páginas siguientes son de sus resultados
+        ruta = '/gastos/buscar';
+        params.append('q', busquedaActual);
+    } else if (filtroInput) {
+        // Si hay filtro, construir los parámetros de la URL
+        const categorias = filtroInput.split(',').map(c => c.trim()).filter(c => c !== "");
+        categorias.forEach(cat => params.append('categorias', cat));
+    }
+    if (cursor) {
+        params.append('cursor', cursor);
+    }
+
+    const query = params.toString();
+    return query ? `${ruta}?${query}` : ruta;
+}
+
+function crearFilaGasto(gasto) {
+    const fila = document.createElement('tr');
+
+    fila.innerHTML = `
+        <td style="padding: 8px; text-align: center;">${gasto.id}</td>
+        <td style="padding: 8px;">${gasto.descripcion}</td>
+        <td style="padding: 8px; font-weight: bold; color: #2E7D32;">$${gasto.monto.toFixed(2)}</td>
+        <td style="padding: 8px;">
+            <span style="background-color: #03DAC6; color: #000000; padding: 2px 8px; border-radius: 10px; font-size: 0.9em; font-weight: bold;">
+                ${gasto.categoria}
+            </span>
+        </td>
+        <td style="padding: 8px; text-align: center;">${gasto.fecha}</td>
+        <td style="text-align: center;">
+            <button onclick="eliminarGasto(${gasto.id})" style="border: none; background: none; cursor: pointer; font-size: 1.2em;">
+                🗑️
+            </button>
+        </td>
+    `;
+    return fila;
+}
+
+function actualizarBotonCargarMas() {
+    const boton = document.getElementById('btn-cargar-mas');
+    if (boton) {
+        boton.style.display = siguienteCursor ? 'inline-block' : 'none';
+    }
+}
+
 async function cargarGastos() {
     console.log("Intentando cargar gastos...");
+    // Recargar la lista deja de lado la búsqueda que hubiera
+    busquedaActual = null;
+    const buscador = document.getElementById('filtro-busqueda');
+    if (buscador) buscador.value = "";
     try {
         const filtroInput = document.getElementById('filtro-categoria')?.value;
-        let url = '/gastos';
-
-        // Si hay filtro, construir los parámetros de la URL
-        if (filtroInput) {
-            const categorias = filtroInput.split(',').map(c => c.trim()).filter(c => c !== "");
-            const params = new URLSearchParams();
-            categorias.forEach(cat => params.append('categorias', cat));
-            url += `?${params.toString()}`;
-        }
 
-        // Llamamos al endpoint que devuelve la LISTA de gastos con autenticación
-        const response = await fetch(url, {
+        // Una sola petición trae la PRIMERA PÁGINA de gastos, el resumen y los datos de los gráficos
+        const response = await fetch(construirUrlGastos(null, '/dashboard'), {
             headers: getAuthHeaders()
         });
 
@@ -162,16 +212,17 @@ async function cargarGastos() {
             throw new Error(`Error HTTP: ${response.status}`);
         }
 
-        // Convertimos la respuesta a JSON
+        // La API devuelve: { gastos: [...], next_cursor, resumen, comparacion, diarios }
         const data = await response.json();
         console.log("Datos recibidos:", data);
+        siguienteCursor = data.next_cursor;
 
         // Obtenemos referencia al cuerpo de la tabla
         const tabla = document.querySelector('#tabla-gastos');
         tabla.innerHTML = ""; // Limpiar tabla antes de agregar nuevos
 
         // Verificar si hay gastos
-        if (data.length === 0) {
+        if (data.gastos.length === 0) {
             // Mostrar mensaje amigable si no hay gastos
             const filaVacia = document.createElement('tr');
             filaVacia.innerHTML = `
@@ -184,29 +235,15 @@ async function cargarGastos() {
             tabla.appendChild(filaVacia);
         } else {
             // Iteramos sobre los datos
-            data.forEach(gasto => {
-                const fila = document.createElement('tr');
-
-                fila.innerHTML = `
-                    <td style="padding: 8px; text-align: center;">${gasto.id}</td>
-                    <td style="padding: 8px;">${gasto.descripcion}</td>
-                    <td style="padding: 8px; font-weight: bold; color: #2E7D32;">$${gasto.monto.toFixed(2)}</td>
-                    <td style="padding: 8px;">
-                        <span style="background-color: #03DAC6; color: #000000; padding: 2px 8px; border-radius: 10px; font-size: 0.9em; font-weight: bold;">
-                            ${gasto.categoria}
-                        </span>
-                    </td>
-                    <td style="padding: 8px; text-align: center;">${gasto.fecha}</td>
-                    <td style="text-align: center;">
-                        <button onclick="eliminarGasto(${gasto.id})" style="border: none; background: none; cursor: pointer; font-size: 1.2em;">
-                            🗑️
-                        </button>
-                    </td>
-                `;
-
-                tabla.appendChild(fila);
-            });
+            data.gastos.forEach(gasto => tabla.appendChild(crearFilaGasto(gasto)));
         }
+        actualizarBotonCargarMas();
+
+        // Actualizamos el resumen y los gráficos con los mismos datos
+        actualizarResumen(data.resumen);
+        renderizarGrafico(data.resumen);
+        renderizarGraficoComparacion(data.comparacion);
+        renderizarGraficoDiario(data.diarios);
 
         if (filtroInput) {
             mostrarNotificacion(`Mostrando gastos de: ${filtroInput}`, 'info');
@@ -214,12 +251,30 @@ async function cargarGastos() {
     } catch (error) {
         console.error('Error al cargar gastos:', error);
         mostrarNotificacion("❌ Error al cargar los datos", "error");
-    } finally {
-        // Actualizamos el resumen y los gráficos secuencialmente
-        await actualizarResumen();
-        await renderizarGrafico();
-        await renderizarGraficoComparacion();
-        await renderizarGraficoDiario();
+    }
+}
+
+async function cargarMasGastos() {
+    if (!siguienteCursor) return;
+    try {
+        const response = await fetch(construirUrlGastos(siguienteCursor), {
+            headers: getAuthHeaders()
+        });
+
+        if (!response.ok) {
+            throw new Error(`Error HTTP: ${response.status}`);
+        }
+
+        const data = await response.json();
+        siguienteCursor = data.next_cursor;
+
+        // Agregamos la página al final de la tabla sin volver a pedir las anteriores
+        const tabla = document.querySelector('#tabla-gastos');
+        data.gastos.forEach(gasto => tabla.appendChild(crearFilaGasto(gasto)));
+        actualizarBotonCargarMas();
+    } catch (error) {
+        console.error('Error al cargar más gastos:', error);
+        mostrarNotificacion("❌ Error al cargar más gastos", "error");
     }
 }
 
@@ -286,25 +341,14 @@ async function crearGasto() {
 
 /**
  * Función nueva para actualizar las tarjetas del Dashboard.
- * Se conecta al endpoint /gastos/resumen y actualiza el DOM.
+ * Recibe el resumen que llega en /dashboard y actualiza el DOM.
  */
-async function actualizarResumen() {
+function actualizarResumen(data) {
     try {
-        console.log("🔄 Actualizando resumen...");
-        const respuesta = await fetch('/gastos/resumen', {
-            headers: getAuthHeaders()
-        });
-
-        if (!respuesta.ok) {
-            console.error("❌ Error en respuesta:", respuesta.status);
-            throw new Error("Error al obtener resumen");
-        }
-
-        // La API ahora devuelve: { 
+        // El resumen trae: { 
         //   total_general, por_categoria, presupuesto_limite, 
         //   saldo_disponible, porcentaje_usado, nivel_alerta 
         // }
-        const data = await respuesta.json();
         console.log("📊 Datos de resumen recibidos:", data);
 
         // Actualizamos las tarjetas de la nueva UI
@@ -375,10 +419,8 @@ async function exportarCSV() {
 }
 
 // 1. EL QUE SE BORRÓ: Gráfico Circular de Categorías
-async function renderizarGrafico() {
+function renderizarGrafico(data) {
     try {
-        const respuesta = await fetch('/gastos/resumen', { headers: getAuthHeaders() });
-        const data = await respuesta.json();
         if (Object.keys(data.por_categoria).length === 0) return;
 
         const ctx = document.getElementById('miGrafico').getContext('2d');
@@ -406,10 +448,8 @@ async function renderizarGrafico() {
 }
 
 // 2. NUEVO: Comparación Presupuesto vs Real con Semáforo
-async function renderizarGraficoComparacion() {
+function renderizarGraficoComparacion(data) {
     try {
-        const respuesta = await fetch('/gastos/comparacion-presupuesto', { headers: getAuthHeaders() });
-        const data = await respuesta.json();
         if (!data.categorias || data.categorias.length === 0) {
             console.log("No hay categorías para el gráfico de comparación");
             return;
@@ -474,10 +514,8 @@ async function renderizarGraficoComparacion() {
 }
 
 // 3. NUEVO: Gastos Día a Día
-async function renderizarGraficoDiario() {
+function renderizarGraficoDiario(data) {
     try {
-        const respuesta = await fetch('/gastos/diarios', { headers: getAuthHeaders() });
-        const data = await respuesta.json();
 
         // Actualizar el valor acumulado del mes
         const totalAcumulado = data.totales.reduce((a, b) => a + b, 0);
@@ -522,21 +560,51 @@ async function renderizarGraficoDiario() {
     } catch (e) { console.error("Error acumulado:", e); }
 }
 
-async function filtrarTabla() {
-    const texto = document.getElementById('filtro-busqueda').value.toLowerCase();
-    const filas = document.querySelectorAll('#tabla-gastos tr');
+// Temporizador para no consultar a la API con cada tecla
+let temporizadorBusqueda = null;
+
+function filtrarTabla() {
+    clearTimeout(temporizadorBusqueda);
+    temporizadorBusqueda = setTimeout(buscarGastos, 300);
+}
 
-    filas.forEach(fila => {
-        // Obtenemos el texto de la descripción (columna 2) y categoría (columna 4)
-        const descripcion = fila.cells[1]?.textContent.toLowerCase() || "";
-        const categoria = fila.cells[3]?.textContent.toLowerCase() || "";
+async function buscarGastos() {
+    const texto = document.getElementById('filtro-busqueda').value.trim();
+    if (!texto) {
+        // Sin texto se vuelve a la lista normal
+        if (busquedaActual !== null) {
+            busquedaActual = null;
+            cargarGastos();
+        }
+        return;
+    }
+    busquedaActual = texto;
+    try {
+        // La búsqueda la resuelve la API sobre todo el historial, no solo las filas cargadas
+        const response = await fetch(construirUrlGastos(), { headers: getAuthHeaders() });
+        if (!response.ok) {
+            throw new Error(`Error HTTP: ${response.status}`);
+        }
+        const data = await response.json();
+        // Si el usuario siguió escribiendo, esta respuesta ya no corresponde
+        if (busquedaActual !== texto) return;
+        siguienteCursor = data.next_cursor;
 
-        if (descripcion.includes(texto) || categoria.includes(texto)) {
-            fila.style.display = ""; // Mostrar
+        const tabla = document.querySelector('#tabla-gastos');
+        tabla.innerHTML = "";
+        if (data.gastos.length === 0) {
+            const filaVacia = document.createElement('tr');
+            filaVacia.innerHTML = `<td colspan="6" style="text-align: center; padding: 20px; color: #999;"></td>`;
+            filaVacia.querySelector('td').textContent = `Sin resultados para "${texto}"`;
+            tabla.appendChild(filaVacia);
         } else {
-            fila.style.display = "none"; // Ocultar
+            data.gastos.forEach(gasto => tabla.appendChild(crearFilaGasto(gasto)));
         }
-    });
+        actualizarBotonCargarMas();
+    } catch (error) {
+        console.error('Error al buscar gastos:', error);
+        mostrarNotificacion("❌ Error al buscar gastos", "error");
+    }
 }
 
 async function descargarPDF() {
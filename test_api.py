@@ -0,0 +1,253 @@
+"""
+Pruebas de la API (api_corregido.py) con TestClient sobre una base SQLite temporal.
+"""
+import base64
+import csv
+import io
+import json
+import threading
+from datetime import date, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import api_corregido as api
+
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    monkeypatch.setenv("HASH_PROCESOS", "0")
+    monkeypatch.setattr(api, "DATABASE_NAME", str(tmp_path / "api.db"))
+    monkeypatch.setattr(api, "_gestor", None)
+    monkeypatch.setattr(api, "cache_auth", api.CacheAutenticacion())
+    with TestClient(api.app) as cliente:
+        yield cliente
+
+
+def registrar(cliente, email="ana@correo.com"):
+    """Registra un usuario; devuelve (cabeceras con su JWT, usuario)"""
+    datos = cliente.post("/auth/registro", json={"nombre": "Ana", "email": email, "password": "secreto1"}).json()
+    return {"Authorization": f"Bearer {datos['token']}"}, datos["usuario"]
+
+
+def test_con_varios_workers_el_pin_no_se_cachea(cliente, monkeypatch):
+    monkeypatch.setattr(api, "CACHE_PINES", False)
+    cabeceras, usuario = registrar(cliente)
+    pin = {"Authorization": f"Bearer {usuario['codigo_acceso']}"}
+    assert cliente.get("/auth/me", headers=pin).status_code == 200
+    assert api.cache_auth.obtener(usuario["codigo_acceso"]) is None
+
+    # Otro worker cambia el PIN directamente en la base: el viejo deja de valer en el acto
+    api.obtener_gestor().regenerar_codigo_acceso(usuario["id"])
+    assert cliente.get("/auth/me", headers=pin).status_code == 401
+    assert cliente.get("/auth/me", headers=cabeceras).status_code == 200
+
+
+def test_exportaciones_en_segundo_plano_exigen_un_unico_worker(tmp_path, monkeypatch):
+    monkeypatch.setenv("HASH_PROCESOS", "0")
+    monkeypatch.setattr(api, "DATABASE_NAME", str(tmp_path / "api.db"))
+    monkeypatch.setattr(api, "_gestor", None)
+    monkeypatch.setattr(api, "WORKERS", 2)
+    with pytest.raises(RuntimeError):
+        with TestClient(api.app):
+            pass
+
+    monkeypatch.setattr(api, "EXPORTACIONES", False)
+    with TestClient(api.app) as cliente:
+        cabeceras, _ = registrar(cliente)
+        assert cliente.post("/exportaciones", json={"tipo": "csv"}, headers=cabeceras).status_code == 404
+        assert cliente.get("/exportaciones", headers=cabeceras).status_code == 404
+        assert cliente.get("/gastos/exportar/csv", headers=cabeceras).status_code == 200
+
+
+def test_cache_de_autenticacion_vence_y_desaloja(monkeypatch):
+    ahora = [1000.0]
+    monkeypatch.setattr(api.time, "time", lambda: ahora[0])
+    cache = api.CacheAutenticacion(max_entradas=2, ttl=60)
+
+    cache.guardar("pin-a", 1)
+    ahora[0] += 59
+    assert cache.obtener("pin-a") == 1
+    ahora[0] += 1
+    assert cache.obtener("pin-a") is None
+
+    # Al pasar del límite se desaloja la entrada usada hace más tiempo
+    cache.guardar("pin-a", 1)
+    cache.guardar("pin-b", 2)
+    assert cache.obtener("pin-a") == 1
+    cache.guardar("pin-c", 3)
+    assert cache.obtener("pin-b") is None
+    assert (cache.obtener("pin-a"), cache.obtener("pin-c")) == (1, 3)
+    assert cache.estadisticas()["desalojos"] == 1
+
+
+def test_pin_cacheado_no_consulta_la_base_y_regenerarlo_lo_revoca(cliente, monkeypatch):
+    monkeypatch.setattr(api, "CACHE_PINES", True)
+    cabeceras, usuario = registrar(cliente)
+    pin = {"Authorization": f"Bearer {usuario['codigo_acceso']}"}
+
+    gestor = api.obtener_gestor()
+    consultas = []
+    original = gestor.obtener_usuario_por_codigo
+    monkeypatch.setattr(gestor, "obtener_usuario_por_codigo", lambda codigo: consultas.append(codigo) or original(codigo))
+    assert cliente.get("/auth/me", headers=pin).status_code == 200
+    assert cliente.get("/auth/me", headers=pin).status_code == 200
+    assert len(consultas) == 1
+
+    respuesta = cliente.post("/auth/regenerar-codigo", headers=cabeceras)
+    assert respuesta.status_code == 200
+    assert cliente.get("/auth/me", headers=pin).status_code == 401
+    nuevo = {"Authorization": f"Bearer {respuesta.json()['codigo_acceso']}"}
+    assert cliente.get("/auth/me", headers=nuevo).status_code == 200
+
+
+@pytest.mark.parametrize("ruta", ["/gastos", "/gastos/resumen", "/gastos/diarios", "/dashboard"])
+def test_etag_304_sin_cuerpo_hasta_que_cambian_los_datos(cliente, ruta):
+    cabeceras, _ = registrar(cliente)
+    cliente.post("/gastos", json={"monto": 10.0, "categoria": "Comida"}, headers=cabeceras)
+
+    primera = cliente.get(ruta, headers=cabeceras)
+    assert primera.status_code == 200
+    etag = primera.headers["etag"]
+
+    repetida = cliente.get(ruta, headers={**cabeceras, "If-None-Match": etag})
+    assert repetida.status_code == 304
+    assert repetida.content == b""
+    assert repetida.headers["etag"] == etag
+
+    # Una escritura sube version_datos: el ETag viejo ya no vale
+    cliente.post("/gastos", json={"monto": 5.0, "categoria": "Ocio"}, headers=cabeceras)
+    nueva = cliente.get(ruta, headers={**cabeceras, "If-None-Match": etag})
+    assert nueva.status_code == 200
+    assert nueva.headers["etag"] != etag
+    assert nueva.content
+
+
+def test_dashboard_coincide_con_los_endpoints_individuales(cliente):
+    cabeceras, usuario = registrar(cliente)
+    assert cliente.put("/usuario/presupuesto", json={"nuevo_limite": 100.0}, headers=cabeceras).status_code == 200
+    gestor = api.obtener_gestor()
+    hoy = date.today()
+    for dias, monto, categoria in [(0, 12.5, "Comida"), (0, 30.0, "Ocio"), (1, 7.25, "Comida"),
+                                   (3, 80.0, "Transporte"), (3, 4.0, "comida")]:
+        gestor.agregar_gasto(monto, categoria, "Semilla", usuario["id"])
+        gasto = max(gestor.obtener_todos_los_gastos(usuario["id"]), key=lambda g: g["id"])
+        gestor.actualizar_gasto(gasto["id"], monto, categoria, "Semilla", (hoy - timedelta(days=dias)).isoformat(), usuario["id"])
+
+    panel = cliente.get("/dashboard?limit=3", headers=cabeceras).json()
+    pagina = cliente.get("/gastos?limit=3", headers=cabeceras).json()
+    assert panel["gastos"] == pagina["gastos"]
+    assert panel["next_cursor"] == pagina["next_cursor"]
+    assert panel["resumen"] == cliente.get("/gastos/resumen", headers=cabeceras).json()
+    assert panel["comparacion"] == cliente.get("/gastos/comparacion-presupuesto", headers=cabeceras).json()
+    assert panel["diarios"] == cliente.get("/gastos/diarios", headers=cabeceras).json()
+    assert panel["resumen"]["total_general"] == 133.75
+
+
+def test_lote_por_api_no_guarda_nada_si_falla_la_transaccion(cliente, monkeypatch):
+    cabeceras, usuario = registrar(cliente)
+    gestor = api.obtener_gestor()
+    version = gestor.obtener_version_datos(usuario["id"])
+
+    def falla(*args):
+        raise RuntimeError("fallo simulado después de insertar")
+    lote = {"gastos": [{"monto": 5.0, "categoria": "Ocio"}, {"monto": 2.5, "categoria": "Comida"}]}
+    with monkeypatch.context() as parche:
+        parche.setattr(gestor, "_acumular_resumenes", falla)
+        assert cliente.post("/gastos/lote", json=lote, headers=cabeceras).status_code == 500
+    assert gestor.obtener_todos_los_gastos(usuario["id"]) == []
+    assert gestor.obtener_version_datos(usuario["id"]) == version
+
+    respuesta = cliente.post("/gastos/lote", json=lote, headers=cabeceras)
+    assert respuesta.status_code == 201 and respuesta.json()["insertados"] == 2
+    assert gestor.obtener_version_datos(usuario["id"]) == version + 1
+    assert cliente.get("/gastos/resumen", headers=cabeceras).json()["total_general"] == 7.5
+
+
+def test_paginacion_por_cursor_hasta_el_final_con_fechas_iguales(cliente):
+    cabeceras, usuario = registrar(cliente)
+    # Todos del mismo día: el orden lo desempata el id
+    api.obtener_gestor().agregar_gastos_lote([(float(i), "Comida", f"Gasto {i}") for i in range(1, 8)], usuario["id"])
+
+    vistos, cursor = [], None
+    for _ in range(10):
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        pagina = cliente.get("/gastos", params=params, headers=cabeceras).json()
+        vistos.extend(g["id"] for g in pagina["gastos"])
+        cursor = pagina["next_cursor"]
+        if cursor is None:
+            break
+    assert len(vistos) == 7
+    assert vistos == sorted(vistos, reverse=True)
+
+    # Repetir la misma página da los mismos gastos
+    segunda = cliente.get("/gastos", params={"limit": 3}, headers=cabeceras).json()["next_cursor"]
+    ids = [[g["id"] for g in cliente.get("/gastos", params={"limit": 3, "cursor": segunda}, headers=cabeceras).json()["gastos"]]
+           for _ in range(2)]
+    assert ids[0] == ids[1] == vistos[3:6]
+
+
+@pytest.mark.parametrize("clave", [None, ["2024-01-01", "abc"], ["no-es-fecha", 5], ["2024-02-30", 5],
+                                   [20240101, 5], ["2024-01-01", 1.5], ["2024-01-01"]])
+def test_cursor_invalido_responde_400(cliente, clave):
+    cabeceras, _ = registrar(cliente)
+    cursor = base64.urlsafe_b64encode(json.dumps(clave).encode()).decode()
+    assert cliente.get("/gastos", params={"cursor": cursor}, headers=cabeceras).status_code == 400
+    assert cliente.get("/gastos", params={"cursor": "no-es-base64!"}, headers=cabeceras).status_code == 400
+
+
+def test_exportar_csv_encabezado_filas_y_escapado(cliente):
+    cabeceras, usuario = registrar(cliente)
+    raras = ['Pan, leche y huevos', 'Libro "Rayuela"', 'Dos\nlíneas']
+    # Más filas que un bloque del generador, para cruzar varios envíos
+    gastos = [(1.0, "Varios", f"Gasto {i}") for i in range(1200)] + [(2.5, "Súper, almacén", d) for d in raras]
+    api.obtener_gestor().agregar_gastos_lote(gastos, usuario["id"])
+
+    respuesta = cliente.get("/gastos/exportar/csv", headers=cabeceras)
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"].startswith("text/csv")
+    filas = list(csv.reader(io.StringIO(respuesta.text)))
+    assert filas[0] == ["ID", "Fecha", "Descripción", "Categoría", "Monto"]
+    assert len(filas) == 1 + len(gastos)
+    especiales = [f for f in filas[1:] if f[3] == "Súper, almacén"]
+    assert sorted(f[2] for f in especiales) == sorted(raras)
+    assert {f[4] for f in especiales} == {"$2.50"}
+
+
+def test_metrics_exige_token_salvo_que_se_publiquen_a_proposito(cliente, monkeypatch):
+    monkeypatch.setattr(api, "METRICAS_TOKEN", None)
+    assert cliente.get("/metrics").status_code == 404
+
+    monkeypatch.setattr(api, "METRICAS_TOKEN", "s3creto")
+    assert cliente.get("/metrics").status_code == 401
+    assert cliente.get("/metrics", headers={"Authorization": "Bearer otro"}).status_code == 401
+    respuesta = cliente.get("/metrics", headers={"Authorization": "Bearer s3creto"})
+    assert respuesta.status_code == 200 and "finanzas_http_peticiones_total" in respuesta.text
+
+    monkeypatch.setattr(api, "METRICAS_TOKEN", None)
+    monkeypatch.setattr(api, "METRICAS_PUBLICAS", True)
+    assert cliente.get("/metrics").status_code == 200
+
+
+def test_estadisticas_solo_para_administradores(cliente, monkeypatch):
+    cabeceras, _ = registrar(cliente)
+    admin, _ = registrar(cliente, "admin@correo.com")
+    monkeypatch.setattr(api, "ADMIN_EMAILS", {"admin@correo.com"})
+    assert cliente.get("/estadisticas", headers=cabeceras).status_code == 403
+    respuesta = cliente.get("/estadisticas", headers=admin)
+    assert respuesta.status_code == 200 and "pool" in respuesta.json()
+
+
+def test_descargas_csv_simultaneas_acotadas(cliente, monkeypatch):
+    cabeceras, _ = registrar(cliente)
+    cupo = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(api, "cupo_descargas", cupo)
+
+    assert cupo.acquire(blocking=False)  # otra descarga en curso
+    respuesta = cliente.get("/gastos/exportar/csv", headers=cabeceras)
+    assert respuesta.status_code == 503 and respuesta.headers["retry-after"] == "5"
+
+    cupo.release()
+    assert cliente.get("/gastos/exportar/csv", headers=cabeceras).status_code == 200
+    # Terminada la descarga, su lugar queda libre
+    assert cupo.acquire(blocking=False)
@@ -0,0 +1,109 @@
+"""
+Búsqueda de texto en los gastos: acentos y mayúsculas, prefijos, gastos de otros usuarios,
+índice al día tras editar o borrar, y la migración que indexa los gastos existentes.
+
+Para probar también PostgreSQL: TEST_DATABASE_URL=postgresql://... pytest
+"""
+import os
+
+import pytest
+
+from gestor_db import GestorGastos
+
+EMAILS = ("ana@busqueda.com", "beto@busqueda.com")
+
+
+def _limpiar(gestor):
+    """Borra lo que haya quedado de una ejecución anterior en una base compartida"""
+    with gestor._get_cursor(escritura=True) as cur:
+        for email in EMAILS:
+            cur.execute(f"DELETE FROM gastos WHERE usuario_id IN (SELECT id FROM usuarios WHERE email = {gestor.p})", (email,))
+            cur.execute(f"DELETE FROM usuarios WHERE email = {gestor.p}", (email,))
+        cur.connection.commit()
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def gestor(request, tmp_path):
+    if request.param == "postgresql":
+        if not os.getenv("TEST_DATABASE_URL"):
+            pytest.skip("TEST_DATABASE_URL no configurada")
+        gestor = GestorGastos(os.getenv("TEST_DATABASE_URL"), procesos_hash=0)
+        _limpiar(gestor)
+    else:
+        gestor = GestorGastos(str(tmp_path / "busqueda.db"), procesos_hash=0)
+    try:
+        yield gestor
+    finally:
+        gestor.cerrar()
+
+
+def _descripciones(gastos):
+    return sorted(g["descripcion"] for g in gastos)
+
+
+def test_sin_distinguir_acentos_ni_mayusculas_y_por_prefijo(gestor):
+    _, uid = gestor.registrar_usuario("Ana", EMAILS[0], "secreto1")
+    gestor.agregar_gastos_lote([(3.0, "Café", "Cortado en la estación"), (40.0, "Comida", "RESTAURANTE japonés"),
+                                (12.0, "Transporte", "Taxi al aeropuerto")], uid)
+
+    assert _descripciones(gestor.buscar_gastos("cafe", uid)) == ["Cortado en la estación"]
+    assert _descripciones(gestor.buscar_gastos("ESTACION", uid)) == ["Cortado en la estación"]
+    assert _descripciones(gestor.buscar_gastos("Japonés", uid)) == ["RESTAURANTE japonés"]
+    assert _descripciones(gestor.buscar_gastos("rest", uid)) == ["RESTAURANTE japonés"]
+    assert _descripciones(gestor.buscar_gastos("taxi aero", uid)) == ["Taxi al aeropuerto"]
+    # Todas las palabras tienen que estar
+    assert gestor.buscar_gastos("taxi japonés", uid) == []
+    assert gestor.buscar_gastos("!!", uid) == []
+
+
+def test_solo_encuentra_gastos_del_usuario(gestor):
+    _, ana = gestor.registrar_usuario("Ana", EMAILS[0], "secreto1")
+    _, beto = gestor.registrar_usuario("Beto", EMAILS[1], "secreto1")
+    gestor.agregar_gasto(10.0, "Comida", "Almuerzo con Ana", ana)
+    gestor.agregar_gasto(11.0, "Comida", "Almuerzo con Beto", beto)
+
+    assert _descripciones(gestor.buscar_gastos("almuerzo", ana)) == ["Almuerzo con Ana"]
+    assert _descripciones(gestor.buscar_gastos("almuerzo", beto)) == ["Almuerzo con Beto"]
+    assert gestor.buscar_gastos("beto", ana) == []
+
+
+def test_el_indice_sigue_las_ediciones_y_los_borrados(gestor):
+    _, uid = gestor.registrar_usuario("Ana", EMAILS[0], "secreto1")
+    gestor.agregar_gasto(10.0, "Comida", "Almuerzo", uid)
+    gestor.agregar_gasto(20.0, "Ocio", "Cine", uid)
+    almuerzo, cine = sorted(gestor.obtener_todos_los_gastos(uid), key=lambda g: g["id"])
+
+    gestor.actualizar_gasto(almuerzo["id"], 10.0, "Comida", "Cena", "2024-01-15", uid)
+    assert gestor.buscar_gastos("almuerzo", uid) == []
+    assert _descripciones(gestor.buscar_gastos("cena", uid)) == ["Cena"]
+
+    gestor.eliminar_gasto(cine["id"], uid)
+    assert gestor.buscar_gastos("cine", uid) == []
+    assert gestor.buscar_gastos("ocio", uid) == []
+
+
+class GestorSinBusqueda(GestorGastos):
+    """Gestor con el esquema anterior al índice de búsqueda"""
+    def _migraciones(self):
+        return [m for m in super()._migraciones() if m[0] < 8]
+
+
+def test_la_migracion_indexa_los_gastos_existentes(tmp_path):
+    ruta = str(tmp_path / "busqueda.db")
+    viejo = GestorSinBusqueda(ruta, procesos_hash=0)
+    try:
+        _, uid = viejo.registrar_usuario("Ana", EMAILS[0], "secreto1")
+        viejo.agregar_gastos_lote([(3.0, "Café", "Cortado"), (12.0, "Transporte", "Taxi")], uid)
+    finally:
+        viejo.cerrar()
+
+    gestor = GestorGastos(ruta, procesos_hash=0)
+    try:
+        assert _descripciones(gestor.buscar_gastos("cafe", uid)) == ["Cortado"]
+        # Volver a indexar (p. ej. si se repite la migración) no duplica ni falla
+        with gestor._get_cursor(escritura=True) as cur:
+            gestor._migracion_busqueda(cur)
+            cur.connection.commit()
+        assert _descripciones(gestor.buscar_gastos("taxi", uid)) == ["Taxi"]
+    finally:
+        gestor.cerrar()
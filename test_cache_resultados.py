@@ -0,0 +1,109 @@
+"""
+Pruebas de la caché de resultados: aciertos, invalidación al escribir, desalojo LRU
+por tamaño y descarte de valores calculados durante una escritura concurrente.
+"""
+import pickle
+
+import pytest
+
+from cache_resultados import BackendCache, CacheMemoria, CacheResultados
+from gestor_db import GestorGastos
+
+
+def test_lecturas_repetidas_salen_de_la_cache_y_se_invalidan_al_escribir(tmp_path):
+    cache = CacheResultados()
+    gestor = GestorGastos(str(tmp_path / "cache.db"), cache=cache, procesos_hash=0)
+    try:
+        _, uid = gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+        _, otro = gestor.registrar_usuario("Beto", "beto@correo.com", "secreto1")
+        gestor.agregar_gasto(10.0, "Comida", "Almuerzo", uid)
+
+        assert gestor.obtener_resumen(uid)["total_general"] == 10.0
+        assert gestor.obtener_resumen(uid)["total_general"] == 10.0
+        gestor.obtener_resumen(otro)
+        assert cache.estadisticas()["aciertos"] == 1
+
+        gestor.agregar_gasto(5.0, "Comida", "Café", uid)
+        assert gestor.obtener_resumen(uid)["total_general"] == 15.0
+        gestor.actualizar_presupuesto_usuario(uid, 100)
+        assert gestor.obtener_resumen(uid)["presupuesto_limite"] == 100.0
+        gestor.eliminar_gasto(1, uid)
+        assert gestor.obtener_gastos_por_categoria(uid) == {"Comida": 5.0}
+
+        # La escritura de un usuario no toca lo cacheado de los demás
+        gestor.obtener_resumen(otro)
+        assert cache.estadisticas()["aciertos"] == 2
+    finally:
+        gestor.cerrar()
+
+
+def test_los_valores_devueltos_son_copias(tmp_path):
+    cache = CacheResultados()
+    gestor = GestorGastos(str(tmp_path / "cache.db"), cache=cache, procesos_hash=0)
+    try:
+        _, uid = gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+        gestor.agregar_gasto(10.0, "Comida", "Almuerzo", uid)
+        gestor.obtener_gastos_por_categoria(uid)["Comida"] = 999
+        assert gestor.obtener_gastos_por_categoria(uid) == {"Comida": 10.0}
+    finally:
+        gestor.cerrar()
+
+
+def test_desaloja_lo_menos_usado_al_superar_el_limite_de_memoria():
+    tamano = len(pickle.dumps(1.0))
+    backend = CacheMemoria(max_bytes=2 * tamano)
+    cache = CacheResultados(backend)
+    for usuario in (1, 2):
+        cache.leer("total", usuario, (), lambda: 1.0)
+    cache.leer("total", 1, (), lambda: 1.0)
+    cache.leer("total", 3, (), lambda: 1.0)
+
+    assert backend.estadisticas()["desalojos"] == 1
+    assert backend.obtener("total:1:()") is not None
+    assert backend.obtener("total:2:()") is None
+
+
+def test_no_guarda_un_valor_calculado_mientras_el_usuario_escribia():
+    cache = CacheResultados()
+
+    def calcular_con_escritura_en_medio():
+        cache.invalidar_usuario(1)
+        return "viejo"
+
+    assert cache.leer("total", 1, (), calcular_con_escritura_en_medio) == "viejo"
+    assert cache.leer("total", 1, (), lambda: "nuevo") == "nuevo"
+
+
+def test_metodos_cacheados_sin_argumentos_y_con_argumentos_por_nombre(tmp_path):
+    cache = CacheResultados()
+    gestor = GestorGastos(str(tmp_path / "cache.db"), cache=cache, procesos_hash=0)
+    try:
+        _, uid = gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+        gestor.agregar_gasto(10.0, "Comida", "Almuerzo", uid)
+        mes = gestor.obtener_todos_los_gastos(uid)[0]["fecha"][:7]
+
+        # Sin usuario (app de escritorio) se usa el valor por defecto y no pasa por la caché
+        assert gestor.obtener_gastos_por_mes() == {mes: 10.0}
+        assert cache.estadisticas()["fallos"] == 0
+
+        # Por posición, por nombre o con los valores por defecto explícitos: la misma entrada
+        assert gestor.obtener_resumen(uid)["total_general"] == 10.0
+        assert gestor.obtener_resumen(usuario_id=uid)["total_general"] == 10.0
+        assert gestor.obtener_resumen(uid, desde=None, hasta=None)["total_general"] == 10.0
+        assert cache.estadisticas()["aciertos"] == 2
+        assert gestor.obtener_gastos_por_dia(uid, hasta="2000-01-01") == {}
+        assert cache.estadisticas()["fallos"] == 2
+    finally:
+        gestor.cerrar()
+
+
+def test_un_backend_incompleto_falla_al_crearlo():
+    class SinLimpiar(BackendCache):
+        def obtener(self, clave): return None
+        def guardar(self, clave, datos, usuario_id, generacion): pass
+        def generacion(self, usuario_id): return 0
+        def invalidar_usuario(self, usuario_id): pass
+
+    with pytest.raises(TypeError):
+        SinLimpiar()
+    assert CacheMemoria().estadisticas() is not None
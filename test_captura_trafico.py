@@ -0,0 +1,55 @@
+"""
+Captura de tráfico: lo que se guarda no tiene datos personales y alcanza para reproducir la carga.
+"""
+import json
+import random
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from jose import jwt
+
+from bench.reproducir import rafaga_maxima, valor_sintetico
+from captura_trafico import CapturaTrafico, MiddlewareCaptura
+
+
+def test_la_captura_guarda_ruta_forma_y_cubeta_sin_datos_personales(tmp_path):
+    archivo = tmp_path / "trafico.jsonl"
+    captura = CapturaTrafico(str(archivo), sal="sal")
+    app = FastAPI()
+    app.add_middleware(MiddlewareCaptura, captura=captura)
+
+    @app.post("/gastos/{gasto_id}")
+    async def editar(gasto_id: int, cuerpo: dict):
+        return {"ok": True}
+
+    @app.get("/metrics")
+    async def metricas():
+        return "nada"
+
+    token = jwt.encode({"sub": "42"}, "otra-clave")
+    cabeceras = {"Authorization": f"Bearer {token}"}
+    with TestClient(app) as cliente:
+        cliente.post("/gastos/7?limit=5&cursor=abc&categorias=Comida&categorias=Ocio", headers=cabeceras,
+                     json={"monto": 10.5, "descripcion": "Regalo para Ana", "etiquetas": ["a", "b"]})
+        cliente.post("/gastos/8", headers=cabeceras, json={"monto": 1})
+        cliente.get("/metrics")
+    captura.cerrar()
+
+    texto = archivo.read_text(encoding="utf-8")
+    assert "Ana" not in texto and "abc" not in texto and token not in texto
+    primero, segundo = [json.loads(linea) for linea in texto.splitlines()]
+    assert primero["ruta"] == "/gastos/{gasto_id}" and primero["estado"] == 200
+    assert primero["query"] == {"limit": "5", "cursor": "?", "categorias": 2}
+    assert primero["cuerpo"] == {"monto": "numero", "descripcion": "texto",
+                                 "etiquetas": {"lista": 2, "elemento": "texto"}}
+    assert primero["credencial"] == "jwt" and primero["cubeta"] == segundo["cubeta"] is not None
+
+
+def test_reproduccion_arma_cuerpos_y_mide_rafagas():
+    usuario = {"email": "replay0001@bench.local"}
+    cuerpo = valor_sintetico({"gastos": {"lista": 3, "elemento": {"monto": "numero", "categoria": "texto"}}},
+                             None, usuario, random.Random(1))
+    assert len(cuerpo["gastos"]) == 3
+    assert all(g["monto"] > 0 and isinstance(g["categoria"], str) for g in cuerpo["gastos"])
+    assert valor_sintetico({"email": "texto"}, None, usuario, None) == {"email": "replay0001@bench.local"}
+    assert rafaga_maxima([0.0, 0.1, 0.2, 0.25, 2.0, 5.0, 5.5]) == 4
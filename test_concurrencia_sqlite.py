@@ -0,0 +1,138 @@
+"""
+Escrituras con SQLite compartido entre procesos: si otro proceso retiene el lock del
+archivo más que busy_timeout, la escritura se reintenta en lugar de fallar.
+También el pool de conexiones agotado (espera y vence sin abrir conexiones de más), los
+modos de ControlConcurrencia y la base en memoria usada desde varios hilos.
+"""
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from gestor_db import ControlConcurrencia, GestorGastos, PoolConexiones
+
+
+def retener_lock(ruta, segundos, tomado):
+    """Simula otro worker con una transacción de escritura abierta"""
+    conexion = sqlite3.connect(ruta, isolation_level=None)
+    conexion.execute("BEGIN IMMEDIATE")
+    tomado.set()
+    time.sleep(segundos)
+    conexion.execute("COMMIT")
+    conexion.close()
+
+
+def test_escritura_reintenta_si_otro_proceso_tiene_el_lock(tmp_path, monkeypatch):
+    monkeypatch.setenv("SQLITE_BUSY_TIMEOUT", "0.05")
+    monkeypatch.setenv("SQLITE_REINTENTOS", "5")
+    ruta = str(tmp_path / "workers.db")
+    gestor = GestorGastos(ruta, procesos_hash=0)
+    try:
+        _, uid = gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+
+        tomado = threading.Event()
+        otro = threading.Thread(target=retener_lock, args=(ruta, 0.3, tomado))
+        otro.start()
+        tomado.wait()
+        assert gestor.agregar_gasto(10.0, "Comida", "Almuerzo", uid)
+        otro.join()
+
+        assert gestor.estadisticas_concurrencia()["reintentos_bloqueo"] >= 1
+        assert gestor.obtener_total_gastado(uid) == 10.0
+    finally:
+        gestor.cerrar()
+
+
+def test_pool_agotado_espera_y_vence_sin_abrir_conexiones_de_mas(tmp_path):
+    pool = PoolConexiones(str(tmp_path / "pool.db"), False, max_conexiones=2, timeout=0.2)
+    tomadas, soltar = threading.Barrier(3), threading.Event()
+
+    def prestar():
+        with pool.conexion():
+            tomadas.wait()
+            soltar.wait()
+
+    hilos = [threading.Thread(target=prestar) for _ in range(2)]
+    try:
+        for hilo in hilos:
+            hilo.start()
+        tomadas.wait()
+
+        inicio = time.perf_counter()
+        with pytest.raises(TimeoutError):
+            pool.obtener()
+        assert time.perf_counter() - inicio >= 0.2
+        assert len(pool._conexiones_sqlite) == 2
+
+        # Quien espera recibe el lugar que se libera
+        pool.timeout = 5.0
+        threading.Timer(0.1, soltar.set).start()
+        with pool.conexion() as conexion:
+            assert conexion.execute("SELECT 1").fetchone()[0] == 1
+        stats = pool.estadisticas()
+        assert (stats["timeouts"], stats["esperas"]) == (1, 1)
+    finally:
+        soltar.set()
+        for hilo in hilos:
+            hilo.join()
+        pool.cerrar()
+    assert pool.estadisticas()["en_uso"] == 0
+
+
+def maximo_simultaneo(control, tipos):
+    """Cuántos de los bloques (uno por tipo, 'lectura' o 'escritura') llegan a estar adentro a la vez"""
+    adentro, maximo, lock = [0], [0], threading.Lock()
+
+    def bloque(tipo):
+        with getattr(control, tipo)():
+            with lock:
+                adentro[0] += 1
+                maximo[0] = max(maximo[0], adentro[0])
+            time.sleep(0.1)
+            with lock:
+                adentro[0] -= 1
+
+    hilos = [threading.Thread(target=bloque, args=(tipo,)) for tipo in tipos]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    return maximo[0]
+
+
+def test_modos_de_control_de_concurrencia():
+    exclusivo, lectura_escritura = ControlConcurrencia("exclusivo"), ControlConcurrencia("lectura_escritura")
+    assert maximo_simultaneo(exclusivo, ["lectura"] * 3) == 1
+    assert maximo_simultaneo(exclusivo, ["lectura", "escritura"]) == 1
+    assert maximo_simultaneo(lectura_escritura, ["lectura"] * 3) == 3
+    assert maximo_simultaneo(lectura_escritura, ["escritura"] * 3) == 1
+    assert exclusivo.estadisticas()["esperas_lectura"] >= 2
+    with pytest.raises(ValueError):
+        ControlConcurrencia("otro")
+
+
+def test_base_en_memoria_compartida_entre_hilos():
+    gestor = GestorGastos(":memory:", procesos_hash=0)
+    try:
+        assert gestor.estadisticas_concurrencia()["modo"] == "exclusivo"
+        _, uid = gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+
+        # Escribe otro hilo (como un worker de ejecutor_bd) y se lee desde este
+        otro = threading.Thread(target=gestor.agregar_gasto, args=(10.0, "Comida", "Almuerzo", uid))
+        otro.start()
+        otro.join()
+        assert gestor.obtener_total_gastado(uid) == 10.0
+
+        # Y al revés, incluido el recorrido por la conexión dedicada de las exportaciones
+        leidos = {}
+        def leer():
+            leidos["usuario"] = gestor.obtener_usuario_por_id(uid)
+            leidos["gastos"] = list(gestor.iterar_gastos(uid))
+        otro = threading.Thread(target=leer)
+        otro.start()
+        otro.join()
+        assert leidos["usuario"]["email"] == "ana@correo.com"
+        assert [g["descripcion"] for g in leidos["gastos"]] == ["Almuerzo"]
+    finally:
+        gestor.cerrar()
@@ -0,0 +1,85 @@
+"""
+Pools de hilos de la API asíncrona: un pool saturado no frena a los demás y las
+estadísticas reflejan la cola.
+"""
+import asyncio
+import threading
+
+from ejecutores import EjecutorAcotado, IteradorConCupo, iterar_en_ejecutor
+
+
+def test_un_pool_saturado_no_frena_a_otro():
+    pdf = EjecutorAcotado("pdf", 1)
+    bd = EjecutorAcotado("bd", 2)
+    liberar = threading.Event()
+
+    async def escenario():
+        # Tres reportes "lentos" ocupan el único hilo de pdf y dejan dos en cola
+        lentos = [asyncio.ensure_future(pdf.ejecutar(liberar.wait)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        rapido = await asyncio.wait_for(bd.ejecutar(lambda: "perfil"), timeout=1)
+        en_cola = pdf.estadisticas()["en_cola"]
+        liberar.set()
+        await asyncio.gather(*lentos)
+        return rapido, en_cola
+
+    try:
+        rapido, en_cola = asyncio.run(escenario())
+        assert rapido == "perfil"
+        assert en_cola == 2
+        stats = pdf.estadisticas()
+        assert stats["completadas"] == 3 and stats["en_cola"] == 0 and stats["en_curso"] == 0
+        assert stats["max_en_cola"] >= 2
+    finally:
+        pdf.cerrar()
+        bd.cerrar()
+
+
+def test_iterar_en_ejecutor_cierra_el_generador_si_se_corta():
+    ejecutor = EjecutorAcotado("bd", 1)
+    cerrado = threading.Event()
+
+    def filas():
+        try:
+            yield from range(100)
+        finally:
+            cerrado.set()
+
+    async def leer_dos():
+        recorrido = iterar_en_ejecutor(ejecutor, filas())
+        leidas = [await recorrido.__anext__(), await recorrido.__anext__()]
+        await recorrido.aclose()
+        return leidas
+
+    try:
+        assert asyncio.run(leer_dos()) == [0, 1]
+        assert cerrado.wait(1)
+    finally:
+        ejecutor.cerrar()
+
+
+def test_iterador_con_cupo_libera_su_lugar_al_terminar_o_cortarse():
+    cupo = threading.BoundedSemaphore(1)
+    cerrados = []
+
+    def filas():
+        try:
+            yield from range(3)
+        finally:
+            cerrados.append(True)
+
+    for recorrer in (list, lambda it: next(it), lambda it: None):
+        assert cupo.acquire(blocking=False)
+        iterador = IteradorConCupo(filas(), cupo)
+        recorrer(iterador)
+        iterador.close()
+        iterador.close()
+        # El lugar vuelve una sola vez (BoundedSemaphore fallaría con dos release)
+        assert cupo.acquire(blocking=False)
+        cupo.release()
+    assert len(cerrados) == 2  # el que nunca empezó no llegó a abrir nada
+
+    # Sin close explícito (la respuesta nunca empezó a enviarse), al descartarlo
+    assert cupo.acquire(blocking=False)
+    IteradorConCupo(filas(), cupo)
+    assert cupo.acquire(blocking=False)
@@ -0,0 +1,76 @@
+"""
+Exportaciones en segundo plano: avance, límite por usuario, cancelación y tope de memoria.
+"""
+import threading
+
+import pytest
+
+from ejecutores import EjecutorAcotado
+from exportaciones import ColaExportaciones, LimiteExportaciones
+
+
+def test_avance_limite_por_usuario_y_cancelacion():
+    cola = ColaExportaciones(EjecutorAcotado("exportaciones", 1), max_por_usuario=2)
+    liberar = threading.Event()
+
+    def lenta(trabajo):
+        for filas in range(0, 1000, 100):
+            if not trabajo.avanzar(filas, 1000):
+                return None
+            liberar.wait()
+        return b"a,b\n", "gastos.csv", "text/csv"
+
+    try:
+        primero = cola.enviar(1, "csv", lenta)
+        segundo = cola.enviar(1, "csv", lenta)
+        with pytest.raises(LimiteExportaciones):
+            cola.enviar(1, "csv", lenta)
+        # Otro usuario no se ve afectado ni ve los trabajos ajenos
+        assert cola.obtener(primero.id, 2) is None
+
+        assert cola.cancelar(segundo.id, 1).estado == "cancelado"
+        liberar.set()
+        primero.futuro.result(timeout=5)
+        assert primero.como_dict()["estado"] == "terminado" and primero.como_dict()["progreso"] == 1.0
+        assert cola.obtener(primero.id, 1).datos == b"a,b\n"
+        assert cola.estadisticas()["trabajos"] == {"terminado": 1, "cancelado": 1}
+    finally:
+        cola.cerrar()
+
+
+def test_al_superar_el_tope_se_descartan_los_archivos_mas_viejos():
+    cola = ColaExportaciones(EjecutorAcotado("exportaciones", 1), max_bytes=25)
+    try:
+        trabajos = []
+        for _ in range(3):
+            trabajo = cola.enviar(1, "pdf", lambda t: (b"x" * 10, "reporte.pdf", "application/pdf"))
+            trabajo.futuro.result(timeout=5)
+            trabajos.append(trabajo)
+        assert [t.estado for t in trabajos] == ["vencido", "terminado", "terminado"]
+        assert trabajos[0].datos is None and cola.estadisticas()["bytes"] == 20
+
+        assert cola.cancelar(trabajos[1].id, 1).estado == "eliminado"
+        assert cola.estadisticas() == {"trabajos": {"vencido": 1, "eliminado": 1, "terminado": 1},
+                                       "bytes": 10, "max_bytes": 25, "descartados": 2}
+    finally:
+        cola.cerrar()
+
+
+def test_cancelar_antes_de_que_el_trabajo_llegue_al_ejecutor():
+    ejecutor = EjecutorAcotado("exportaciones", 1)
+    cola = ColaExportaciones(ejecutor)
+    enviar = ejecutor.enviar
+    corridas = []
+
+    def enviar_tarde(funcion, trabajo, *args):
+        # DELETE /exportaciones/{id} entre que el trabajo se publica y que recibe su futuro
+        assert cola.cancelar(trabajo.id, 1).estado == "cancelado"
+        return enviar(funcion, trabajo, *args)
+
+    ejecutor.enviar = enviar_tarde
+    try:
+        trabajo = cola.enviar(1, "csv", lambda t: corridas.append(t) or (b"", "gastos.csv", "text/csv"))
+        trabajo.futuro.result(timeout=5)
+        assert trabajo.estado == "cancelado" and corridas == []
+    finally:
+        cola.cerrar()
@@ -1,25 +1,246 @@
+"""
+Pruebas básicas de GestorConPresupuesto sobre una base temporal, del hashing de contraseñas en
+el pool de procesos, de su exportación a Excel, de la migración de fecha a DATE con los filtros
+por rango y del generador de datos de bench/ (reproducible con la misma semilla y cargado
+correctamente con poblar).
+"""
+from openpyxl import load_workbook
 
-import sys
-import os
-import traceback
+from bench.generador import generar_gastos, generar_usuarios, poblar
+from gestor_db import GestorConPresupuesto, ProcesadorHash
 
-print("Testing initialization...")
 
-try:
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    if script_dir not in sys.path:
-        sys.path.append(script_dir)
-    
-    print(f"Script dir: {script_dir}")
-    print(f"Files in dir: {os.listdir(script_dir)}")
+class GestorSinFechaDate(GestorConPresupuesto):
+    """Gestor con el esquema anterior a la migración de fecha (columna TEXT)"""
+    def _migraciones(self):
+        return [m for m in super()._migraciones() if m[0] < 9]
 
-    from gestor_db import GestorConPresupuesto
-    print("Import successful")
 
-    db_path = os.path.join(script_dir, "FinanzasPro.db")
-    mi_gestor = GestorConPresupuesto(db_path, 5000)
-    print("Gestor initialized successfully")
-    print(f"Total: {mi_gestor.obtener_total()}")
+def test_gestor_inicializa_y_calcula_totales(tmp_path):
+    gestor = GestorConPresupuesto(str(tmp_path / "FinanzasPro.db"), procesos_hash=0)
+    try:
+        _, uid = gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+        assert gestor.obtener_presupuesto_usuario(uid) == 5000
+        assert gestor.obtener_total_gastado(uid) == 0
 
-except Exception:
-    traceback.print_exc()
+        gestor.agregar_gasto(10.5, "Comida", "Almuerzo", uid)
+        gestor.agregar_gasto(4.5, "Transporte", "Colectivo", uid)
+        assert gestor.obtener_total_gastado(uid) == 15.0
+        assert gestor.obtener_gastos_por_categoria(uid) == {"Comida": 10.5, "Transporte": 4.5}
+    finally:
+        gestor.cerrar()
+
+
+def test_generador_reproducible_y_poblar(tmp_path):
+    assert list(generar_gastos(5, 200, semilla=7)) == list(generar_gastos(5, 200, semilla=7))
+    assert generar_usuarios(5, semilla=7) == generar_usuarios(5, semilla=7)
+
+    gestor = GestorConPresupuesto(str(tmp_path / "bench.db"), procesos_hash=0)
+    try:
+        ids = poblar(gestor, usuarios=5, gastos=200, semilla=7, tamano_lote=64)
+        assert len(ids) == 5
+        assert sum(len(gestor.obtener_todos_los_gastos(uid)) for uid in ids) == 200
+        # Los totales precalculados quedan coherentes con los gastos cargados
+        for uid in ids:
+            esperado = sum(g["monto"] for g in gestor.obtener_todos_los_gastos(uid))
+            assert abs(gestor.obtener_total_gastado(uid) - esperado) < 0.01
+    finally:
+        gestor.cerrar()
+
+
+def test_excel_con_gastos_del_mes_e_historial_de_cierres(tmp_path):
+    gestor = GestorConPresupuesto(str(tmp_path / "FinanzasPro.db"), procesos_hash=0)
+    try:
+        _, uid = gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+        gestor.agregar_gastos_lote([(10.0 + i, "Comida", f"Gasto {i}") for i in range(12)], uid)
+        gestor.agregar_gasto(6000, "Viajes", "Vacaciones", uid)
+        viaje = gestor.obtener_todos_los_gastos(uid, categorias=["Viajes"])[0]
+        gestor.actualizar_gasto(viaje["id"], 6000, "Viajes", "Vacaciones", "2020-01-15", uid)
+
+        avances = []
+        archivo = tmp_path / "gastos.xlsx"
+        assert gestor.exportar_a_excel_completo(str(archivo), uid, tamano_lote=5,
+                                                progreso=lambda filas, total: avances.append((filas, total)))
+        assert avances == [(5, 12), (10, 12), (12, 12), (12, 12)]
+
+        libro = load_workbook(archivo, read_only=True)
+        assert libro.sheetnames == ["Gastos del mes", "Historial de cierres"]
+        gastos = list(libro["Gastos del mes"].values)
+        assert gastos[0] == ("ID", "Fecha", "Categoría", "Descripción", "Monto") and len(gastos) == 13
+        assert list(libro["Historial de cierres"].values)[1:] == [("2020-01", 6000, 5000, "Excedido")]
+        libro.close()
+
+        # Si el callback de avance devuelve False, la exportación se interrumpe
+        assert not gestor.exportar_a_excel_completo(str(tmp_path / "cortado.xlsx"), uid, tamano_lote=5,
+                                                    progreso=lambda filas, total: False)
+    finally:
+        gestor.cerrar()
+
+
+def test_migracion_fecha_date_y_filtros_por_rango(tmp_path):
+    ruta = str(tmp_path / "FinanzasPro.db")
+    viejo = GestorSinFechaDate(ruta, procesos_hash=0)
+    try:
+        _, uid = viejo.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+        viejo.agregar_gastos_lote([(10.0, "Comida", "Almuerzo"), (20.0, "Ocio", "Cine"), (5.0, "Comida", "Café")], uid)
+        # El último gasto se borra: su id no tiene que volver a usarse después de rehacer la tabla
+        viejo.agregar_gasto(1.0, "Ocio", "Borrado", uid)
+        viejo.eliminar_gasto(4, uid)
+        # Filas como las que dejaba el DEFAULT CURRENT_TIMESTAMP: con hora
+        with viejo._get_cursor(escritura=True) as cur:
+            for id_gasto, fecha in ((1, "2024-01-10 08:30:00"), (2, "2024-02-03 21:00:00"), (3, "2024-02-28")):
+                cur.execute("UPDATE gastos SET fecha = ? WHERE id = ?", (fecha, id_gasto))
+            cur.connection.commit()
+        viejo.reconstruir_resumenes(uid)
+    finally:
+        viejo.cerrar()
+
+    gestor = GestorConPresupuesto(ruta, procesos_hash=0)
+    try:
+        with gestor._get_cursor() as cur:
+            cur.execute("SELECT type FROM pragma_table_info('gastos') WHERE name = 'fecha'")
+            assert cur.fetchone()[0] == "DATE"
+        assert [g["fecha"] for g in gestor.obtener_todos_los_gastos(uid)] == ["2024-02-28", "2024-02-03", "2024-01-10"]
+
+        assert [g["id"] for g in gestor.obtener_todos_los_gastos_filtrados("2024-02-01", "2024-02-29")] == [3, 2]
+        assert gestor.obtener_gastos_por_rango("2024-01-01", "2024-02-03") == {"Comida": 10.0, "Ocio": 20.0}
+        assert gestor.obtener_gastos_por_rango("2024-13-01", "2024-02-03") == {}
+        gastos, _ = gestor.obtener_gastos_paginados(uid, desde="2024-01-10", hasta="2024-01-10")
+        assert [g["id"] for g in gastos] == [1]
+        assert gestor.obtener_resumen(uid, "2024-02-01", "2024-02-29")["por_categoria"] == {"Comida": 5.0, "Ocio": 20.0}
+        assert gestor.obtener_resumen(uid)["total_general"] == 35.0
+        assert gestor.obtener_gastos_por_dia(uid, "2024-02-01", None) == {"2024-02-03": 20.0, "2024-02-28": 5.0}
+
+        # La búsqueda sigue al día después de rehacer la tabla
+        gestor.agregar_gasto(3.0, "Comida", "Medialunas", uid)
+        assert [(g["id"], g["descripcion"]) for g in gestor.buscar_gastos("medialunas", uid)] == [(5, "Medialunas")]
+        assert not gestor.actualizar_gasto(1, 10.0, "Comida", "Almuerzo", "10/01/2024", uid)
+    finally:
+        gestor.cerrar()
+
+
+def test_migracion_fecha_date_corrige_fechas_invalidas(tmp_path):
+    ruta = str(tmp_path / "FinanzasPro.db")
+    viejo = GestorSinFechaDate(ruta, procesos_hash=0)
+    try:
+        _, uid = viejo.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+        viejo.agregar_gastos_lote([(10.0, "Comida", "Almuerzo"), (20.0, "Ocio", "Cine"), (5.0, "Comida", "Café")], uid)
+        # Fechas escritas a mano en la app de escritorio
+        with viejo._get_cursor(escritura=True) as cur:
+            for id_gasto, fecha in ((1, "31/01/2024"), (2, None), (3, "ayer")):
+                cur.execute("UPDATE gastos SET fecha = ? WHERE id = ?", (fecha, id_gasto))
+            cur.connection.commit()
+        viejo.reconstruir_resumenes(uid)
+    finally:
+        viejo.cerrar()
+
+    gestor = GestorConPresupuesto(ruta, procesos_hash=0)
+    try:
+        assert {g["id"]: g["fecha"] for g in gestor.obtener_todos_los_gastos(uid)} == {
+            1: "2024-01-31", 2: "1900-01-01", 3: "1900-01-01"}
+        assert gestor.obtener_gastos_por_dia(uid) == {"1900-01-01": 25.0, "2024-01-31": 10.0}
+        assert gestor.obtener_total_gastado(uid) == 35.0
+    finally:
+        gestor.cerrar()
+
+
+def _resumenes_y_gastos(gestor):
+    """Totales de las tablas de resumen y los mismos sumados desde gastos, por (usuario, clave)"""
+    consultas = {
+        "resumen_categoria": "COALESCE(categoria, 'Sin categoría')",
+        "resumen_diario": "substr(CAST(fecha AS TEXT), 1, 10)",
+        "resumen_mensual": "substr(CAST(fecha AS TEXT), 1, 7)",
+    }
+    resumenes, gastos = {}, {}
+    with gestor._get_cursor() as cur:
+        for (tabla, columna), expresion in zip(gestor.TABLAS_RESUMEN, consultas.values()):
+            cur.execute(f"SELECT usuario_id, {columna}, total, cantidad FROM {tabla}")
+            resumenes[tabla] = {(u, c): (round(t, 2), n) for u, c, t, n in cur.fetchall()}
+            cur.execute(f"""
+                SELECT COALESCE(usuario_id, {gestor.SIN_USUARIO}), {expresion}, SUM(monto), COUNT(*) FROM gastos
+                GROUP BY COALESCE(usuario_id, {gestor.SIN_USUARIO}), {expresion}
+            """)
+            gastos[tabla] = {(u, c): (round(t, 2), n) for u, c, t, n in cur.fetchall()}
+    return resumenes, gastos
+
+
+def test_resumenes_coinciden_con_gastos_incluidos_los_sin_usuario(tmp_path):
+    gestor = GestorConPresupuesto(str(tmp_path / "FinanzasPro.db"), procesos_hash=0)
+    try:
+        _, uid = gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+        gestor.agregar_gasto(10.5, "Comida", "Almuerzo", uid)
+        gestor.agregar_gasto(7.25, "Comida", "Desayuno", None)
+        gestor.agregar_gasto(30.0, "Ocio", "Cine", None)
+        # Categoría vacía (posible desde la app de escritorio) y sin categoría: claves distintas
+        gestor.agregar_gasto(2.0, "", "Sin nada", uid)
+        gestor.agregar_gasto(1.0, None, "Nulo", uid)
+        resumenes, gastos = _resumenes_y_gastos(gestor)
+        assert resumenes == gastos
+        assert sum(gestor.obtener_gastos_por_mes().values()) == 50.75
+
+        sin_usuario = sorted((g for g in gestor.obtener_todos_los_gastos() if g["usuario_id"] is None),
+                             key=lambda g: g["id"])
+        gestor.actualizar_gasto(sin_usuario[0]["id"], 8.0, "Transporte", "Taxi", "2024-02-10")
+        resumenes, gastos = _resumenes_y_gastos(gestor)
+        assert resumenes == gastos
+
+        gestor.eliminar_gasto(sin_usuario[1]["id"])
+        resumenes, gastos = _resumenes_y_gastos(gestor)
+        assert resumenes == gastos
+        assert sum(gestor.obtener_gastos_por_mes().values()) == 21.5
+
+        # Reconstruir desde cero da lo mismo que lo acumulado en cada escritura
+        assert gestor.reconstruir_resumenes()
+        assert _resumenes_y_gastos(gestor)[0] == resumenes
+    finally:
+        gestor.cerrar()
+
+
+def test_lote_de_gastos_es_todo_o_nada_y_sube_la_version_una_vez(tmp_path):
+    gestor = GestorConPresupuesto(str(tmp_path / "FinanzasPro.db"), procesos_hash=0)
+    try:
+        _, uid = gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+        gestor.agregar_gasto(10.0, "Comida", "Almuerzo", uid)
+        version = gestor.obtener_version_datos(uid)
+        resumenes, _ = _resumenes_y_gastos(gestor)
+
+        # Un monto que no es un número hace fallar el lote entero
+        assert gestor.agregar_gastos_lote([(5.0, "Ocio", "Cine"), ("abc", "Ocio", "Teatro")], uid) == 0
+        assert len(gestor.obtener_todos_los_gastos(uid)) == 1
+        assert gestor.obtener_version_datos(uid) == version
+        assert _resumenes_y_gastos(gestor)[0] == resumenes
+
+        acumulados = []
+        original = gestor._acumular_resumenes
+        gestor._acumular_resumenes = lambda cur, usuario_id, movimientos: acumulados.append(movimientos) or original(cur, usuario_id, movimientos)
+        assert gestor.agregar_gastos_lote([(5.0, "Ocio", "Cine"), (2.5, "Comida", "Café"), (1.0, "Ocio", "Diario")], uid) == 3
+        assert len(acumulados) == 1
+        assert gestor.obtener_version_datos(uid) == version + 1
+        resumenes, gastos = _resumenes_y_gastos(gestor)
+        assert resumenes == gastos
+        assert gestor.obtener_gastos_por_categoria(uid) == {"Comida": 12.5, "Ocio": 6.0}
+    finally:
+        gestor.cerrar()
+
+
+def test_hashing_en_procesos_da_lo_mismo_que_en_el_hilo(tmp_path):
+    en_hilo, en_pool = ProcesadorHash(0), ProcesadorHash(1)
+    try:
+        hash_hilo, hash_pool = en_hilo.hashear("secreto1"), en_pool.hashear("secreto1")
+        assert en_pool.activo and not en_hilo.activo
+        # Cualquiera de los dos verifica el hash del otro
+        assert en_hilo.verificar("secreto1", hash_pool) and en_pool.verificar("secreto1", hash_hilo)
+        assert not en_pool.verificar("otra", hash_hilo) and not en_hilo.verificar("otra", hash_pool)
+    finally:
+        en_pool.cerrar()
+    assert not en_pool.activo
+
+    gestor = GestorConPresupuesto(str(tmp_path / "FinanzasPro.db"), procesos_hash=1)
+    try:
+        gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+        assert gestor.verificar_login("ana@correo.com", "secreto1")[0]
+        assert gestor.verificar_login("ana@correo.com", "otra") == (False, "Contraseña incorrecta")
+        assert gestor.hashes.activo
+    finally:
+        gestor.cerrar()
+    assert not gestor.hashes.activo
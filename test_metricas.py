@@ -0,0 +1,47 @@
+"""
+Métricas en formato Prometheus: histogramas acumulados y mediciones del gestor por método.
+"""
+from gestor_db import GestorGastos
+from metricas import RegistroMetricas, MetricasGestor
+
+
+def test_histograma_en_formato_de_texto():
+    registro = RegistroMetricas()
+    latencia = registro.histograma("latencia_segundos", "Latencia", ("ruta",), buckets=(0.1, 1.0))
+    for valor in (0.05, 0.5, 3.0):
+        latencia.observar(valor, "/gastos")
+
+    lineas = registro.exponer().splitlines()
+    assert "# TYPE latencia_segundos histogram" in lineas
+    assert 'latencia_segundos_bucket{ruta="/gastos",le="0.1"} 1' in lineas
+    assert 'latencia_segundos_bucket{ruta="/gastos",le="1.0"} 2' in lineas
+    assert 'latencia_segundos_bucket{ruta="/gastos",le="+Inf"} 3' in lineas
+    assert 'latencia_segundos_count{ruta="/gastos"} 3' in lineas
+    assert registro.histograma("latencia_segundos", "Latencia") is latencia
+
+
+def test_el_gestor_informa_consultas_filas_y_commits_por_metodo(tmp_path):
+    registro = RegistroMetricas()
+    gestor = GestorGastos(str(tmp_path / "metricas.db"), procesos_hash=0, metricas=MetricasGestor(registro))
+    try:
+        _, uid = gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+        gestor.agregar_gasto(10.0, "Comida", "Almuerzo", uid)
+        gestor.agregar_gasto(5.0, "Taxi", "Viaje", uid)
+        assert len(gestor.obtener_todos_los_gastos(uid)) == 2
+        # Los métodos cacheados y anidados se etiquetan con su propio nombre; un cursor pedido
+        # desde fuera del gestor, como "otro"
+        gestor.obtener_gastos_por_mes(uid)
+        gestor.obtener_historial_cierres(uid)
+        with gestor._get_cursor() as cur:
+            cur.execute("SELECT 1")
+    finally:
+        gestor.cerrar()
+
+    lineas = registro.exponer().splitlines()
+    assert 'finanzas_bd_consulta_segundos_count{metodo="agregar_gasto",tipo="escritura"} 2' in lineas
+    assert 'finanzas_bd_consulta_filas_sum{metodo="obtener_todos_los_gastos"} 2.0' in lineas
+    assert 'finanzas_bd_commit_segundos_count{metodo="agregar_gasto"} 2' in lineas
+    assert 'finanzas_bd_consulta_segundos_count{metodo="obtener_gastos_por_mes",tipo="lectura"} 2' in lineas
+    assert 'finanzas_bd_consulta_segundos_count{metodo="obtener_historial_cierres",tipo="lectura"} 1' in lineas
+    assert 'finanzas_bd_consulta_segundos_count{metodo="otro",tipo="lectura"} 1' in lineas
+    assert any(l.startswith('finanzas_bd_espera_segundos_count{motivo="lock_escritura"}') for l in lineas)
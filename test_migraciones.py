@@ -0,0 +1,110 @@
+"""
+Migraciones versionadas del esquema: una base anterior a schema_version llega a la última
+versión, una base al día no vuelve a migrar y una migración que falla no deja nada a medias.
+"""
+import sqlite3
+
+import pytest
+
+from gestor_db import GestorGastos
+
+
+def crear_base_antigua(ruta):
+    """Esquema de antes de las migraciones: sin schema_version ni codigo_acceso"""
+    conexion = sqlite3.connect(ruta)
+    conexion.executescript("""
+        CREATE TABLE usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            fecha_creacion TEXT DEFAULT CURRENT_TIMESTAMP,
+            presupuesto REAL DEFAULT 5000.0
+        );
+        CREATE TABLE gastos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            monto REAL,
+            categoria TEXT,
+            descripcion TEXT,
+            fecha TEXT DEFAULT CURRENT_TIMESTAMP,
+            usuario_id INTEGER,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios(id)
+        );
+    """)
+    conexion.executemany("INSERT INTO usuarios (nombre, email, password_hash) VALUES (?, ?, 'x')",
+                         [(f"Usuario {i}", f"u{i}@correo.com") for i in range(50)])
+    conexion.executemany("INSERT INTO gastos (monto, categoria, descripcion, fecha, usuario_id) VALUES (?, ?, ?, ?, ?)",
+                         [(10.0, "Comida", "Almuerzo", "2024-01-15 12:30:00", 1), (5.0, "Ocio", "Cine", "2024-02-01", 2)])
+    conexion.commit()
+    conexion.close()
+
+
+def leer(ruta, sql):
+    conexion = sqlite3.connect(ruta)
+    try:
+        return conexion.execute(sql).fetchall()
+    finally:
+        conexion.close()
+
+
+def test_base_antigua_migra_hasta_la_ultima_version(tmp_path, capsys):
+    ruta = str(tmp_path / "antigua.db")
+    crear_base_antigua(ruta)
+    gestor = GestorGastos(ruta, procesos_hash=0)
+    try:
+        ultima = gestor._migraciones()[-1][0]
+        assert leer(ruta, "SELECT MAX(version) FROM schema_version") == [(ultima,)]
+        assert f"[MIGRACIÓN] v{ultima}:" in capsys.readouterr().out
+
+        codigos = [c for (c,) in leer(ruta, "SELECT codigo_acceso FROM usuarios")]
+        assert len(codigos) == 50 and len(set(codigos)) == 50
+        assert all(c is not None and len(c) == 6 and c.isdigit() for c in codigos)
+        assert gestor.obtener_gastos_por_categoria(1) == {"Comida": 10.0}
+        assert [g["fecha"] for g in gestor.obtener_todos_los_gastos(1)] == ["2024-01-15"]
+    finally:
+        gestor.cerrar()
+
+    # Una base al día no vuelve a aplicar ninguna migración
+    gestor = GestorGastos(ruta, procesos_hash=0)
+    gestor.cerrar()
+    assert "[MIGRACIÓN]" not in capsys.readouterr().out
+    assert leer(ruta, "SELECT COUNT(*) FROM schema_version") == [(ultima,)]
+
+
+class GestorMigracionRota(GestorGastos):
+    """La migración 5 falla después de que las anteriores ya cambiaron el esquema"""
+    def _migraciones(self):
+        def rota(cur):
+            cur.execute("CREATE TABLE a_medias (id INTEGER)")
+            raise RuntimeError("migración rota")
+        return [(n, d, rota if n == 5 else m) for n, d, m in super()._migraciones()]
+
+
+def test_una_migracion_que_falla_no_deja_cambios(tmp_path):
+    ruta = str(tmp_path / "antigua.db")
+    crear_base_antigua(ruta)
+    with pytest.raises(RuntimeError, match="migración rota"):
+        GestorMigracionRota(ruta, procesos_hash=0)
+
+    tablas = {t for (t,) in leer(ruta, "SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "schema_version" not in tablas and "a_medias" not in tablas
+    assert "codigo_acceso" not in [c[1] for c in leer(ruta, "PRAGMA table_info(usuarios)")]
+
+    # Corregida la migración, la misma base migra completa
+    gestor = GestorGastos(ruta, procesos_hash=0)
+    ultima = gestor._migraciones()[-1][0]
+    gestor.cerrar()
+    assert leer(ruta, "SELECT MAX(version) FROM schema_version") == [(ultima,)]
+
+    # Una migración nueva que falla deja la versión registrada como estaba
+    class GestorMigracionNuevaRota(GestorGastos):
+        def _migraciones(self):
+            def rota(cur):
+                cur.execute("ALTER TABLE gastos ADD COLUMN a_medias TEXT")
+                raise RuntimeError("migración rota")
+            return super()._migraciones() + [(ultima + 1, "Rota", rota)]
+
+    with pytest.raises(RuntimeError, match="migración rota"):
+        GestorMigracionNuevaRota(ruta, procesos_hash=0)
+    assert leer(ruta, "SELECT MAX(version) FROM schema_version") == [(ultima,)]
+    assert "a_medias" not in [c[1] for c in leer(ruta, "PRAGMA table_info(gastos)")]
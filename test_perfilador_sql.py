@@ -0,0 +1,30 @@
+"""
+Perfilador SQL: plantillas normalizadas, ranking por método y archivo de consultas lentas.
+"""
+from gestor_db import GestorGastos
+from perfilador_sql import PerfiladorSQL, plantilla_sql
+
+
+def test_plantilla_agrupa_listas_y_literales():
+    assert plantilla_sql("SELECT *  FROM gastos\n WHERE id IN (?, ?, ?) AND monto > 10") == \
+        "SELECT * FROM gastos WHERE id IN (?, ...) AND monto > ?"
+    assert plantilla_sql(b"INSERT INTO t (a, b) VALUES (1, 'x'), (2, 'it''s')") == \
+        "INSERT INTO t (a, b) VALUES (?, ...), ..."
+
+
+def test_gestor_con_perfilador_registra_sentencias_y_las_lentas(tmp_path):
+    archivo = tmp_path / "lentas.log"
+    perfilador = PerfiladorSQL(umbral=0.0, archivo=str(archivo))
+    gestor = GestorGastos(str(tmp_path / "perfil.db"), procesos_hash=0, perfilador=perfilador)
+    try:
+        _, uid = gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+        gestor.agregar_gastos_lote([(10.0, "Comida", "Almuerzo"), (5.0, "Taxi", "Viaje")], uid)
+        gestor.obtener_todos_los_gastos(uid)
+        gestor.obtener_todos_los_gastos(uid)
+    finally:
+        gestor.cerrar()
+
+    lecturas = [s for s in perfilador.top(100) if s["metodo"] == "obtener_todos_los_gastos"]
+    assert len(lecturas) == 1
+    assert lecturas[0]["ejecuciones"] == 2 and lecturas[0]["filas"] == 4 and lecturas[0]["parametros"] == 1
+    assert "| obtener_todos_los_gastos | filas=2 | parametros=1 |" in archivo.read_text(encoding="utf-8")
@@ -0,0 +1,219 @@
+"""
+Pruebas de regresión de planes de consulta.
+Ejecuta todas las consultas de GestorGastos, las captura (también las de los recorridos por
+la conexión dedicada) y comprueba con EXPLAIN QUERY PLAN (SQLite) / EXPLAIN (PostgreSQL) que
+ninguna recorre una tabla completa. Sin usuario (app de escritorio) se admiten solo las que
+leen toda la tabla a propósito, las que no tienen WHERE.
+
+Para probar también PostgreSQL: TEST_DATABASE_URL=postgresql://... pytest
+"""
+import io
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+
+from gestor_db import GestorGastos
+
+TABLAS = ("gastos", "usuarios", "resumen_categoria", "resumen_diario", "resumen_mensual")
+
+
+class CursorEspia:
+    """Envuelve un cursor y anota cada sentencia ejecutada"""
+    def __init__(self, cur, registro):
+        self._cur = cur
+        self._registro = registro
+
+    def execute(self, sql, params=()):
+        self._registro.append((sql, tuple(params)))
+        return self._cur.execute(sql, params)
+
+    def __getattr__(self, nombre):
+        return getattr(self._cur, nombre)
+
+    def __setattr__(self, nombre, valor):
+        # row_factory, itersize...: van al cursor real
+        if nombre.startswith("_"):
+            super().__setattr__(nombre, valor)
+        else:
+            setattr(self._cur, nombre, valor)
+
+
+class ConexionEspia:
+    """Envuelve una conexión para espiar los cursores que se abren sobre ella"""
+    def __init__(self, conexion, registro):
+        self._conexion = conexion
+        self._registro = registro
+
+    def cursor(self, *args, **kwargs):
+        return CursorEspia(self._conexion.cursor(*args, **kwargs), self._registro)
+
+    def __getattr__(self, nombre):
+        return getattr(self._conexion, nombre)
+
+
+def espiar(gestor):
+    registro = []
+    original = gestor._get_cursor
+    dedicada = gestor.pool.conexion_dedicada
+
+    @contextmanager
+    def _get_cursor(*args, **kwargs):
+        with original(*args, **kwargs) as cur:
+            yield CursorEspia(cur, registro)
+
+    @contextmanager
+    def conexion_dedicada():
+        with dedicada() as conexion:
+            yield ConexionEspia(conexion, registro)
+
+    gestor._get_cursor = _get_cursor
+    gestor.pool.conexion_dedicada = conexion_dedicada
+    return registro
+
+
+def ejecutar_todas_las_consultas(gestor):
+    """Recorre todos los métodos de GestorGastos que tocan la base de datos"""
+    exito, uid = gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+    assert exito
+    gestor.agregar_gasto(10.0, "Comida", "Almuerzo", uid)
+    gestor.agregar_gasto(25.0, "Transporte", "Taxi", uid)
+    gestor.verificar_login("ana@correo.com", "secreto1")
+    codigo = gestor.obtener_usuario_por_id(uid)["codigo_acceso"]
+    gestor.obtener_usuario_por_codigo(codigo)
+    gestor.actualizar_presupuesto_usuario(uid, 3000)
+    gestor.obtener_version_datos(uid)
+    gestor.obtener_todos_los_gastos(uid)
+    _, siguiente = gestor.obtener_gastos_paginados(uid, limite=1)
+    gestor.obtener_gastos_paginados(uid, limite=1, despues_de=siguiente)
+    gestor.obtener_todos_los_gastos(uid, categorias=["comida"])
+    gestor.obtener_gastos_paginados(uid, limite=1, categorias=["COMIDA", "Transporte"])
+    gestor.obtener_gastos_paginados(uid, limite=1, desde="2024-01-01", hasta="2024-01-31")
+    gestor.obtener_todos_los_gastos_filtrados("2024-01-01", "2024-12-31", uid, ["comida"])
+    gestor.obtener_gastos_por_rango("2024-01-01", "2024-12-31", uid)
+    gestor.obtener_resumen(uid)
+    gestor.obtener_resumen(uid, "2024-01-01", "2024-12-31")
+    gestor.obtener_dashboard(uid, limite=1, categorias=["comida"])
+    gestor.obtener_gastos_por_dia(uid)
+    gestor.obtener_gastos_por_dia(uid, "2024-01-01", "2024-01-31")
+    gestor.obtener_gastos_por_mes(uid)
+    gestor.agregar_gastos_lote([(5.0, "Comida", "Café"), (7.5, "Ocio", "Cine")], uid)
+    gestor.actualizar_gasto(2, 30.0, "Transporte", "Taxi al aeropuerto", "2024-01-15", uid)
+    gestor.buscar_gastos_paginados("taxi aero", uid, limite=1)
+    gestor.contar_gastos(uid)
+    gestor.contar_gastos(uid, desde="2024-01-01")
+    list(gestor.iterar_gastos(uid))
+    list(gestor.iterar_gastos(uid, desde="2024-01-01"))
+    gestor.obtener_historial_cierres(uid)
+    gestor.exportar_a_excel_completo(io.BytesIO(), uid)
+    gestor.eliminar_gasto(1, uid)
+    gestor.reconstruir_resumenes(uid)
+
+
+def ejecutar_consultas_sin_usuario(gestor):
+    """Las mismas consultas con usuario_id=None, como las hace la app de escritorio"""
+    gestor.agregar_gasto(3.0, "Comida", "Café", None)
+    gastos = gestor.obtener_todos_los_gastos()
+    gestor.obtener_todos_los_gastos(categorias=["comida"])
+    gestor.obtener_todos_los_gastos_filtrados("2024-01-01", "2024-12-31")
+    gestor.obtener_todos_los_gastos_filtrados("2024-01-01", "2024-12-31", categorias=["comida"])
+    gestor.obtener_gastos_por_rango("2024-01-01", "2024-12-31")
+    gestor.obtener_gastos_por_mes()
+    gestor.buscar_gastos("café")
+    gestor.contar_gastos()
+    gestor.contar_gastos(desde="2024-01-01")
+    list(gestor.iterar_gastos(None))
+    list(gestor.iterar_gastos(None, desde="2024-01-01"))
+    gestor.obtener_historial_cierres()
+    gestor.exportar_a_excel_completo(io.BytesIO())
+    gestor.actualizar_gasto(gastos[0]["id"], 4.0, "Comida", "Café doble", "2024-02-01")
+    gestor.eliminar_gasto(gastos[0]["id"])
+    gestor.reconstruir_resumenes()
+
+
+def sentencias_con_plan(registro, sin_usuario=False):
+    """
+    Sentencias cuyo plan se revisa. Con sin_usuario se dejan de lado las que no tienen WHERE:
+    leen toda la tabla porque así se pidió (todos los gastos de la base, su cantidad...).
+    """
+    return [(sql, params) for sql, params in registro
+            if sql.lstrip().split()[0].upper() in ("SELECT", "UPDATE", "DELETE")
+            and not (sin_usuario and not re.search(r"\bWHERE\b", sql, re.IGNORECASE))]
+
+
+def recorridos_completos_sqlite(ruta, sql, params):
+    conexion = sqlite3.connect(ruta)
+    try:
+        plan = conexion.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    finally:
+        conexion.close()
+    # Columna 'detail': 'SCAN gastos' es un recorrido completo, 'SEARCH gastos USING INDEX ...' no
+    # (tampoco 'SCAN gastos_fts VIRTUAL TABLE ...', que es una consulta al índice de texto)
+    return [fila[3] for fila in plan
+            if any(fila[3].split()[:2] == ["SCAN", tabla] for tabla in TABLAS)]
+
+
+def test_sqlite_ninguna_consulta_recorre_tablas_completas(tmp_path):
+    ruta = str(tmp_path / "planes.db")
+    gestor = GestorGastos(ruta)
+    registro = espiar(gestor)
+    try:
+        ejecutar_todas_las_consultas(gestor)
+        sentencias = sentencias_con_plan(registro)
+        registro.clear()
+        ejecutar_consultas_sin_usuario(gestor)
+        sentencias += sentencias_con_plan(registro, sin_usuario=True)
+    finally:
+        gestor.cerrar()
+
+    assert sentencias
+    for sql, params in sentencias:
+        assert recorridos_completos_sqlite(ruta, sql, params) == [], sql
+
+    # El índice (usuario_id, categoria) se eliminó: ninguna de las consultas anteriores lo necesita
+    conexion = sqlite3.connect(ruta)
+    try:
+        indices = {f[0] for f in conexion.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    finally:
+        conexion.close()
+    assert "idx_gastos_usuario_categoria" not in indices
+    assert "idx_gastos_usuario_categoria_clave" in indices
+
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL no configurada")
+def test_postgresql_ninguna_consulta_recorre_tablas_completas():
+    url = os.getenv("TEST_DATABASE_URL")
+    gestor = GestorGastos(url)
+    registro = espiar(gestor)
+    try:
+        # El email es UNIQUE: limpiamos restos de una ejecución anterior
+        with gestor._get_cursor(escritura=True) as cur:
+            cur.execute("DELETE FROM gastos WHERE usuario_id IN (SELECT id FROM usuarios WHERE email = 'ana@correo.com')")
+            cur.execute("DELETE FROM usuarios WHERE email = 'ana@correo.com'")
+            cur.connection.commit()
+        registro.clear()
+        ejecutar_todas_las_consultas(gestor)
+        sentencias = sentencias_con_plan(registro)
+        registro.clear()
+        ejecutar_consultas_sin_usuario(gestor)
+        sentencias += sentencias_con_plan(registro, sin_usuario=True)
+    finally:
+        gestor.cerrar()
+
+    conexion = psycopg2.connect(url)
+    try:
+        cur = conexion.cursor()
+        # Con tablas pequeñas el planificador prefiere Seq Scan aunque haya índice;
+        # desactivándolo, un Seq Scan solo aparece si no existe un índice utilizable
+        cur.execute("SET enable_seqscan = off")
+        assert sentencias
+        for sql, params in sentencias:
+            cur.execute(f"EXPLAIN {sql}", params)
+            plan = "\n".join(fila[0] for fila in cur.fetchall())
+            assert "Seq Scan" not in plan, f"{sql}\n{plan}"
+    finally:
+        conexion.rollback()
+        conexion.close()
@@ -0,0 +1,59 @@
+"""
+Reporte PDF: se arma en memoria con todos los gastos, repartidos en páginas, leyéndolos de la
+base de a lotes en el proceso que lo arma.
+"""
+import re
+
+from gestor_db import GestorGastos
+from reportes_pdf import GeneradorReportes, armar_reporte_pdf, fila_reporte
+
+RESUMEN = {"total_general": 150.0, "presupuesto_limite": 5000.0, "saldo_disponible": 4850.0,
+           "nivel_alerta": "seguro"}
+
+
+def _paginas(pdf):
+    return len(re.findall(rb"/Type /Page\b", pdf))
+
+
+def test_el_detalle_completo_se_reparte_en_paginas():
+    filas = [fila_reporte({"fecha": "2025-03-01 10:00:00", "categoria": "Comida", "descripcion": "Almuerzo " * 20,
+                           "monto": i + 0.5}) for i in range(500)]
+    assert filas[0] == ("2025-03-01", "Comida", "Almuerzo " * 20, 0.5)
+
+    pdf = armar_reporte_pdf({"nombre": "Ana"}, RESUMEN, filas, fecha="01/03/2025")
+    assert pdf.startswith(b"%PDF")
+    # ~48 filas por página completa (menos en la primera, que lleva el resumen)
+    assert 10 <= _paginas(pdf) <= 13
+
+
+def test_sin_gastos_genera_una_pagina(tmp_path):
+    ruta = str(tmp_path / "reporte.db")
+    gestor = GestorGastos(ruta, procesos_hash=0)
+    _, uid = gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+    gestor.cerrar()
+    generador = GeneradorReportes(max_procesos=0)
+    try:
+        pdf = generador.generar(ruta, uid, {"nombre": "Ana"}, RESUMEN)
+    finally:
+        generador.cerrar()
+    assert pdf.startswith(b"%PDF") and _paginas(pdf) == 1
+
+
+def test_el_proceso_del_pool_lee_los_gastos_de_a_lotes(tmp_path):
+    ruta = str(tmp_path / "reporte.db")
+    gestor = GestorGastos(ruta, procesos_hash=0)
+    try:
+        _, uid = gestor.registrar_usuario("Ana", "ana@correo.com", "secreto1")
+        _, otro = gestor.registrar_usuario("Beto", "beto@correo.com", "secreto1")
+        gestor.agregar_gastos_lote([(i + 0.5, "Comida", f"Gasto {i}") for i in range(500)], uid)
+        gestor.agregar_gastos_lote([(1.0, "Ocio", "Cine")] * 300, otro)
+    finally:
+        gestor.cerrar()
+
+    generador = GeneradorReportes(max_procesos=1)
+    try:
+        pdf = generador.generar(ruta, uid, {"nombre": "Ana"}, RESUMEN)
+    finally:
+        generador.cerrar()
+    assert pdf.startswith(b"%PDF") and 10 <= _paginas(pdf) <= 13
+    assert not generador.activo